@@ -1,12 +1,30 @@
 """
 Helper script to add an index to the transactions table.
 Use this during load testing to observe online schema changes.
+
+With --track (implied by --index, --cycles and --output) the CREATE INDEX
+runs on one connection while another polls crdb_internal.jobs, recording
+the backfill's fraction completed, rows/sec and job phase changes.
+Several indexes and repeated build/DROP cycles can be benchmarked in one
+session; --output writes the progress series in the load-metrics formats
+(.csv or binary) plus the phase changes as <name>.events.csv, timed from
+--start-time (a load run's start) so they line up with its export.
 """
+import argparse
+import threading
 import psycopg2
 import time
+from typing import Callable, List, Optional, Tuple
+
+from metrics_export import open_interval_writer
+from scenario import EventLog, events_path
 
 DSN_APP = "postgresql://root@localhost:26257/study_db?sslmode=disable"
 
+DEFAULT_INDEX = ("idx_user_amount", ["user_id", "amount"])
+PROGRESS_COLUMNS = ['time_elapsed', 'build', 'fraction_completed', 'rows_done', 'rows_per_sec']
+POLL_INTERVAL = 1.0
+
 def add_index():
     """Add an index on user_id and amount columns."""
     try:
@@ -68,5 +86,309 @@ def add_index():
         raise
 
 
+def parse_index(value: str) -> Tuple[str, List[str]]:
+    """Parse an index definition "name:col1,col2"."""
+    name, _, columns = value.partition(":")
+    columns = [c.strip() for c in columns.split(",") if c.strip()]
+    if not name or not columns:
+        raise argparse.ArgumentTypeError(f"invalid index '{value}' (expected name:col1,col2)")
+    return name.strip(), columns
+
+
+def _index_exists(cur, name: str) -> bool:
+    cur.execute("""
+        SELECT indexname
+        FROM pg_indexes
+        WHERE tablename = 'transactions'
+        AND indexname = %s;
+    """, (name,))
+    return cur.fetchone() is not None
+
+
+def _estimated_rows(cur) -> int:
+    """Table size from the optimizer's statistics; a COUNT(*) would compete with the backfill."""
+    cur.execute("""
+        SELECT estimated_row_count
+        FROM crdb_internal.table_row_statistics
+        WHERE table_name = 'transactions';
+    """)
+    row = cur.fetchone()
+    return int(row[0] or 0) if row else 0
+
+
+def _job_pattern(sql: str, name: str) -> str:
+    """
+    LIKE pattern for the job description of a CREATE or DROP of index
+    `name` ("... INDEX name ON ..." or "...@name"), so a job for another
+    index whose name merely contains it never matches.
+    """
+    name = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    if sql.lstrip().upper().startswith("DROP"):
+        return f"%@{name}"
+    return f"%INDEX {name} ON %"
+
+
+def _latest_job(cur, pattern: str, since, job_id: Optional[int] = None):
+    """
+    (job_id, status, running_status, fraction_completed) of the newest
+    schema change matching `pattern`, or of `job_id` once it is known.
+    """
+    if job_id is not None:
+        cur.execute("""
+            SELECT job_id, status, running_status, fraction_completed
+            FROM crdb_internal.jobs
+            WHERE job_id = %s;
+        """, (job_id,))
+        return cur.fetchone()
+    cur.execute("""
+        SELECT job_id, status, running_status, fraction_completed
+        FROM crdb_internal.jobs
+        WHERE job_type IN ('SCHEMA CHANGE', 'NEW SCHEMA CHANGE')
+        AND description LIKE %s
+        AND created >= %s
+        ORDER BY created DESC
+        LIMIT 1;
+    """, (pattern, since))
+    return cur.fetchone()
+
+
+class BuildTracker:
+    """Runs DDL statements while polling their schema-change jobs."""
+
+    def __init__(self, dsn: str = DSN_APP, poll_interval: float = POLL_INTERVAL,
+                 output: Optional[str] = None, start_time: Optional[float] = None,
+                 on_event: Optional[Callable[[str, str], None]] = None):
+        """
+        Args:
+            dsn: Database to build on
+            poll_interval: Seconds between crdb_internal.jobs polls
+            output: Optional progress file (.csv or binary) with an
+                .events.csv sidecar for phase changes
+            start_time: Time progress rows and events are measured from,
+                e.g. the load run's start (default: now)
+            on_event: Called with (event, detail) on phase changes instead
+                of printing them or the per-poll progress, e.g. a load
+                run's record_event
+        """
+        self.dsn = dsn
+        self.poll_interval = poll_interval
+        self.conn = psycopg2.connect(dsn)  # Polling connection
+        self.conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        self.start_time = start_time or time.time()
+        self.on_event = on_event
+        self.builds = 0
+        self.writer = open_interval_writer(output, PROGRESS_COLUMNS) if output else None
+        self.events = EventLog(events_path(output)) if output else None
+
+    def _event(self, event: str, detail: str):
+        elapsed = time.time() - self.start_time
+        if self.on_event:
+            self.on_event(event, detail)
+        else:
+            print(f"  [{elapsed:7.1f}s] {event}: {detail}")
+        if self.events:
+            self.events.write(elapsed, event, detail)
+
+    def run(self, sql: str, label: str, name: str) -> Tuple[float, float]:
+        """
+        Execute one DDL statement on its own connection and follow its job.
+
+        Returns:
+            (seconds, average rows/sec of the backfill)
+        """
+        self.builds += 1
+        with self.conn.cursor() as cur:
+            table_rows = _estimated_rows(cur)
+            cur.execute("SELECT now();")
+            since = cur.fetchone()[0]
+
+        failure = []
+
+        def submit():
+            conn = psycopg2.connect(self.dsn)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(sql)
+            except Exception as e:
+                failure.append(e)
+            finally:
+                conn.close()
+
+        ddl = threading.Thread(target=submit, name="ddl", daemon=True)
+        started = time.time()
+        self._event(label, "start")
+        ddl.start()
+
+        pattern = _job_pattern(sql, name)
+        job_id = None  # Pinned once found, so later jobs can't be mistaken for it
+        phase = None
+        last_time, last_fraction = started, 0.0
+        while True:
+            finished = not ddl.is_alive()  # Checked before polling so the last poll sees the end
+            with self.conn.cursor() as cur:
+                job = _latest_job(cur, pattern, since, job_id)
+
+            now = time.time()
+            if job:
+                job_id, status, running_status, fraction = job
+                fraction = float(fraction or 0.0)
+                current = f"{status}" + (f" ({running_status})" if running_status else "")
+                if current != phase:
+                    self._event(label, current)
+                    phase = current
+
+                rate = 0.0
+                if now > last_time:
+                    rate = max(0.0, fraction - last_fraction) * table_rows / (now - last_time)
+                if self.writer:
+                    self.writer.write({
+                        'time_elapsed': now - self.start_time,
+                        'build': self.builds,
+                        'fraction_completed': fraction,
+                        'rows_done': fraction * table_rows,
+                        'rows_per_sec': rate,
+                    })
+                if not finished and self.on_event is None:
+                    print(f"    {fraction * 100:5.1f}% | {rate:12,.0f} rows/sec | {current}")
+                last_time, last_fraction = now, fraction
+
+            if finished:
+                break
+            ddl.join(self.poll_interval)
+
+        elapsed = time.time() - started
+        if failure:
+            self._event(label, f"failed: {failure[0]}")
+            raise failure[0]
+        self._event(label, f"done in {elapsed:.2f}s")
+        return elapsed, table_rows / elapsed if elapsed > 0 else 0.0
+
+    def close(self):
+        self.conn.close()
+        if self.writer:
+            self.writer.close()
+            print(f"✓ Wrote {self.writer.rows_written} progress rows to {self.writer.path}")
+        if self.events:
+            self.events.close()
+            print(f"✓ Wrote {self.events.count} events to {self.events.path}")
+
+
+def benchmark_indexes(indexes: List[Tuple[str, List[str]]], cycles: int = 1,
+                      drop: bool = False, output: Optional[str] = None,
+                      poll_interval: float = POLL_INTERVAL,
+                      start_time: Optional[float] = None) -> List[tuple]:
+    """
+    Build each index `cycles` times with progress tracking.
+
+    Indexes are dropped (and the drop tracked too) between cycles, and after
+    the last one when `drop` is set. An index that already exists is dropped
+    first so every cycle measures a full backfill. Progress is timed from
+    `start_time` (default: now), e.g. the Unix time a load run started.
+
+    Returns:
+        (index, cycle, seconds, rows/sec) per build
+    """
+    tracker = BuildTracker(poll_interval=poll_interval, output=output, start_time=start_time)
+    results = []
+    try:
+        for cycle in range(1, cycles + 1):
+            for name, columns in indexes:
+                with tracker.conn.cursor() as cur:
+                    exists = _index_exists(cur, name)
+                if exists:
+                    tracker.run(f"DROP INDEX transactions@{name};", f"DROP INDEX {name}", name)
+
+                print(f"\nCREATE INDEX {name} ON transactions({', '.join(columns)}) "
+                      f"[cycle {cycle}/{cycles}]")
+                seconds, rate = tracker.run(
+                    f"CREATE INDEX {name} ON transactions({', '.join(columns)});",
+                    f"CREATE INDEX {name}", name)
+                results.append((name, cycle, seconds, rate))
+
+                if drop or cycle < cycles:
+                    tracker.run(f"DROP INDEX transactions@{name};", f"DROP INDEX {name}", name)
+    finally:
+        tracker.close()
+
+    print("\n" + "="*60)
+    print("INDEX BUILDS")
+    print("="*60)
+    print(f"{'Index':<24} {'Cycle':>5} {'Seconds':>9} {'Rows/sec':>14}")
+    for name, cycle, seconds, rate in results:
+        print(f"{name:<24} {cycle:5d} {seconds:9.2f} {rate:14,.0f}")
+    print("="*60 + "\n")
+    return results
+
+
+def build_indexes(indexes: List[Tuple[str, List[str]]], start_time: Optional[float] = None,
+                  on_event: Optional[Callable[[str, str], None]] = None,
+                  dsn: str = DSN_APP) -> List[tuple]:
+    """
+    Build each index once, following its job; the scenario add_index action.
+
+    Unlike benchmark_indexes an existing index is an error rather than
+    dropped, since the run it belongs to may be using it.
+
+    Returns:
+        (index, seconds, rows/sec) per build
+    """
+    tracker = BuildTracker(dsn=dsn, start_time=start_time, on_event=on_event)
+    results = []
+    try:
+        for name, columns in indexes:
+            with tracker.conn.cursor() as cur:
+                if _index_exists(cur, name):
+                    raise ValueError(f"index '{name}' already exists")
+            seconds, rate = tracker.run(
+                f"CREATE INDEX {name} ON transactions({', '.join(columns)});",
+                f"CREATE INDEX {name}", name)
+            results.append((name, seconds, rate))
+    finally:
+        tracker.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Add an index to transactions, optionally tracking the backfill.",
+        epilog="Example: python add_index.py --index idx_user_amount:user_id,amount "
+               "--index idx_amount:amount --cycles 3 --output builds.csv",
+    )
+    parser.add_argument("--track", action="store_true",
+                        help="Poll the schema-change job and report backfill progress")
+    parser.add_argument("--index", type=parse_index, action="append", default=None,
+                        metavar="NAME:COLS",
+                        help="Index to build, e.g. idx_amount:amount (repeatable; "
+                             "default: idx_user_amount:user_id,amount)")
+    parser.add_argument("--cycles", type=int, default=1,
+                        help="Build every index this many times, dropping it in between "
+                             "(default: 1)")
+    parser.add_argument("--drop", action="store_true",
+                        help="Drop the indexes again after the last cycle")
+    parser.add_argument("--output", default=None, metavar="PATH",
+                        help="Write the progress series to PATH (.csv or binary) and "
+                             "phase changes to <PATH>.events.csv")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, metavar="SECONDS",
+                        help=f"Seconds between job polls (default: {POLL_INTERVAL})")
+    parser.add_argument("--start-time", type=float, default=None, metavar="UNIX_TIME",
+                        help="Measure time_elapsed from this Unix time, e.g. the one a "
+                             "load_test.py run prints at start, so the series lines up "
+                             "with its export (default: now)")
+    args = parser.parse_args()
+
+    if args.cycles < 1 or args.poll_interval <= 0:
+        parser.error("--cycles must be at least 1 and --poll-interval positive")
+
+    if not (args.track or args.index or args.cycles > 1 or args.drop or args.output
+            or args.start_time):
+        add_index()
+        return
+
+    benchmark_indexes(args.index or [DEFAULT_INDEX], cycles=args.cycles, drop=args.drop,
+                      output=args.output, poll_interval=args.poll_interval,
+                      start_time=args.start_time)
+
+
 if __name__ == "__main__":
-    add_index()
+    main()
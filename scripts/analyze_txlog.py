@@ -0,0 +1,262 @@
+"""
+Post-hoc analysis of a per-transaction log (load_test.py --txlog).
+
+The log is memory-mapped as a NumPy structured array, so a multi-million
+transaction run opens instantly and every query is a vectorized pass over
+just the columns it needs. Latency can be re-sliced at any resolution
+after the fact, e.g. 100 ms buckets around the moment a node was stopped:
+
+    python analyze_txlog.py failover.txlog --around 90 --span 20 --resolution 0.1
+
+For the selected window (the whole run by default) it prints the overall
+numbers, a timeline, and breakdowns by gateway, by phase and by SQLSTATE.
+Percentiles are nearest-rank over successful transactions, like the
+harness's histograms; failed transactions are counted as errors. Scenario
+and range events (<name>.events.csv, when the log sits next to the export
+as <name>.txlog) are marked on the timeline.
+"""
+import argparse
+import os
+import sys
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from scenario import events_path, read_events
+from txlog import NO_GATEWAY, OUTCOME_OK, read_header
+
+PERCENTILES = (50, 95, 99, 99.9)
+RESOLUTIONS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+TIMELINE_ROWS = 60  # Most timeline rows an automatic --resolution gives
+
+
+class TxLog:
+    """A transaction log, memory-mapped read-only."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.header = read_header(path)
+        self.dtype = np.dtype([tuple(field) for field in self.header['fields']])
+        if self.dtype.itemsize != self.header['record_size']:
+            raise ValueError(f"{path}: record layout doesn't match its size")
+        count = (os.path.getsize(path) - self.header['offset']) // self.dtype.itemsize
+        # A log cut short mid-record (a crash) still maps its whole records
+        self.records = (np.memmap(path, dtype=self.dtype, mode='r',
+                                  offset=self.header['offset'], shape=(count,))
+                        if count else np.zeros(0, dtype=self.dtype))
+        self.phases: List[str] = self.header['phases']
+        self.gateways: List[str] = self.header['gateways']
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def seconds(self, records: np.ndarray) -> np.ndarray:
+        """Start of each record in seconds since the run started (the events' time axis)."""
+        return (records['start_ns'] - self.header['start_ns']) / 1e9
+
+    def select(self, start: Optional[float] = None, end: Optional[float] = None,
+               gateway: Optional[str] = None) -> np.ndarray:
+        """Records starting in [start, end) seconds, optionally on one gateway only."""
+        records = self.records
+        mask = np.ones(len(records), dtype=bool)
+        if start is not None or end is not None:
+            seconds = self.seconds(records)
+            if start is not None:
+                mask &= seconds >= start
+            if end is not None:
+                mask &= seconds < end
+        if gateway is not None:
+            mask &= records['gateway'] == self.gateways.index(gateway)
+        return records[mask]
+
+    def span(self, records: np.ndarray) -> tuple:
+        """(first start, last end) of the records, in seconds since the run started."""
+        if not len(records):
+            return 0.0, 0.0
+        seconds = self.seconds(records)
+        return float(seconds.min()), float((seconds + records['latency_us'] / 1e6).max())
+
+    def gateway_name(self, index: int) -> str:
+        return self.gateways[index] if index != NO_GATEWAY and index < len(self.gateways) else "?"
+
+
+def percentiles_ms(latency_us: np.ndarray, percentiles: Sequence[float] = PERCENTILES) -> Dict[float, float]:
+    """Nearest-rank percentiles of latencies in µs, in milliseconds."""
+    if not len(latency_us):
+        return {p: 0.0 for p in percentiles}
+    ordered = np.sort(latency_us)
+    ranks = [max(1, int(np.ceil(p / 100.0 * len(ordered)))) - 1 for p in percentiles]
+    return {p: ordered[rank] / 1000.0 for p, rank in zip(percentiles, ranks)}
+
+
+def timeline(log: TxLog, records: np.ndarray, start: float, end: float,
+             resolution: float) -> List[dict]:
+    """
+    One row per `resolution` seconds from start to end: transactions, TPS,
+    errors, p50, p99 and max.
+
+    All buckets are computed at once: sorting by (bucket, latency) puts
+    every bucket's latencies in order next to each other, so a percentile
+    is one index per bucket.
+    """
+    buckets = int(np.ceil((end - start) / resolution))
+    bucket = ((log.seconds(records) - start) / resolution).astype(np.int64)
+    ok = records['outcome'] == OUTCOME_OK
+    errors = np.bincount(bucket[~ok], minlength=buckets)[:buckets]
+
+    latency = records['latency_us'][ok]
+    bucket = bucket[ok]
+    order = np.lexsort((latency, bucket))
+    latency, bucket = latency[order], bucket[order]
+    counts = np.bincount(bucket, minlength=buckets)[:buckets]
+    firsts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    def at(p: float) -> np.ndarray:
+        ranks = np.maximum(1, np.ceil(p / 100.0 * counts).astype(np.int64)) - 1
+        return np.where(counts > 0, latency[np.minimum(firsts + ranks, len(latency) - 1)]
+                        if len(latency) else 0, 0) / 1000.0
+
+    p50, p99, top = at(50), at(99), at(100)
+    return [{'time': start + i * resolution, 'transactions': int(counts[i]),
+             'tps': counts[i] / resolution, 'errors': int(errors[i]),
+             'p50': float(p50[i]), 'p99': float(p99[i]), 'max': float(top[i])}
+            for i in range(buckets)]
+
+
+def by_gateway(log: TxLog, records: np.ndarray, elapsed: float) -> List[tuple]:
+    """(gateway, transactions, TPS, errors, p50, p99) per gateway."""
+    rows = []
+    for index in np.unique(records['gateway']):
+        on = records[records['gateway'] == index]
+        ok = on['outcome'] == OUTCOME_OK
+        pct = percentiles_ms(on['latency_us'][ok], (50, 99))
+        rows.append((log.gateway_name(int(index)), int(ok.sum()),
+                     ok.sum() / elapsed if elapsed > 0 else 0.0, int((~ok).sum()),
+                     pct[50], pct[99]))
+    return rows
+
+
+def by_phase(log: TxLog, records: np.ndarray) -> List[tuple]:
+    """(phase, transactions that ran it, p50, p95, p99) for the phases that ran."""
+    rows = []
+    ok = records[records['outcome'] == OUTCOME_OK]
+    for phase in log.phases:
+        spans = ok[f"phase_{phase}"]
+        spans = spans[spans > 0]
+        if len(spans):
+            pct = percentiles_ms(spans, (50, 95, 99))
+            rows.append((phase, len(spans), pct[50], pct[95], pct[99]))
+    return rows
+
+
+def by_sqlstate(records: np.ndarray) -> List[tuple]:
+    """(SQLSTATE, failures) per failure code, most frequent first; 'client' for client errors."""
+    failed = records[records['outcome'] != OUTCOME_OK]
+    codes, counts = np.unique(failed['sqlstate'], return_counts=True)
+    rows = [(code.decode() or 'client', int(count)) for code, count in zip(codes, counts)]
+    return sorted(rows, key=lambda row: -row[1])
+
+
+def pick_resolution(span: float) -> float:
+    """The finest of RESOLUTIONS that keeps a span within TIMELINE_ROWS rows."""
+    for resolution in RESOLUTIONS:
+        if span / resolution <= TIMELINE_ROWS:
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+def print_analysis(log: TxLog, records: np.ndarray, start: float, end: float,
+                   resolution: float, events: List[tuple]):
+    elapsed = end - start
+    ok = records['outcome'] == OUTCOME_OK
+    pct = percentiles_ms(records['latency_us'][ok], PERCENTILES + (100,))
+
+    print("\n" + "="*70)
+    print(f"TRANSACTION LOG {log.path} ({start:.2f}s - {end:.2f}s)")
+    print("="*70)
+    print(f"Workload: {log.header.get('workload')} | {len(log)} transactions logged")
+    print(f"Transactions: {int(ok.sum())} ({ok.sum() / elapsed if elapsed > 0 else 0.0:.1f} TPS) | "
+          f"errors: {int((~ok).sum())} | retried: {int((records['retries'] > 0).sum())}")
+    print(f"Latency (ms): p50 {pct[50]:.2f} | p95 {pct[95]:.2f} | p99 {pct[99]:.2f} | "
+          f"p99.9 {pct[99.9]:.2f} | max {pct[100]:.2f}")
+
+    print(f"\nTimeline ({resolution:g}s buckets):")
+    print(f"{'Time (s)':>9} {'Tx':>8} {'TPS':>9} {'Errors':>7} {'p50':>8} {'p99':>8} {'max':>8}")
+    marks = sorted(events)
+    for row in timeline(log, records, start, end, resolution):
+        here = [f"{event}: {detail}" for at, event, detail in marks
+                if row['time'] <= at < row['time'] + resolution]
+        print(f"{row['time']:9.2f} {row['transactions']:8d} {row['tps']:9.1f} {row['errors']:7d} "
+              f"{row['p50']:8.2f} {row['p99']:8.2f} {row['max']:8.2f}"
+              f"{'  ◀ ' + '; '.join(here) if here else ''}")
+
+    print("\nBy gateway:")
+    for node, count, tps, errors, p50, p99 in by_gateway(log, records, elapsed):
+        print(f"  {node:<21} {count:8d} tx | {tps:8.1f} TPS | {errors:6d} errors | "
+              f"p50 {p50:7.2f} | p99 {p99:7.2f}")
+
+    print("\nBy phase (ms):")
+    for phase, count, p50, p95, p99 in by_phase(log, records):
+        print(f"  {phase:<14} {count:8d} | p50 {p50:7.2f} | p95 {p95:7.2f} | p99 {p99:7.2f}")
+
+    failures = by_sqlstate(records)
+    if failures:
+        print(f"\nErrors by SQLSTATE: {', '.join(f'{code}={count}' for code, count in failures)}")
+    print("="*70 + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Slice a per-transaction log (load_test.py --txlog) at any resolution.",
+        epilog="Example: python analyze_txlog.py run.txlog --around 90 --span 20 --resolution 0.1",
+    )
+    parser.add_argument("txlog", help="Transaction log written by load_test.py --txlog")
+    parser.add_argument("--from", dest="start", type=float, default=None, metavar="SECONDS",
+                        help="Window start, seconds since the run started (default: first record)")
+    parser.add_argument("--to", dest="end", type=float, default=None, metavar="SECONDS",
+                        help="Window end (default: last record)")
+    parser.add_argument("--around", type=float, default=None, metavar="SECONDS",
+                        help="Centre the window on this time instead (see --span)")
+    parser.add_argument("--span", type=float, default=10.0, metavar="SECONDS",
+                        help="Window length with --around (default: 10)")
+    parser.add_argument("--resolution", type=float, default=None, metavar="SECONDS",
+                        help=f"Timeline bucket length (default: the finest giving at most "
+                             f"{TIMELINE_ROWS} rows)")
+    parser.add_argument("--gateway", default=None,
+                        help="Only transactions on this gateway, e.g. localhost:26258")
+    parser.add_argument("--events", default=None, metavar="CSV",
+                        help="Events to mark on the timeline (default: <name>.events.csv "
+                             "next to the log, if any)")
+    args = parser.parse_args()
+
+    if args.resolution is not None and args.resolution <= 0:
+        parser.error("--resolution must be positive")
+    if args.span <= 0:
+        parser.error("--span must be positive")
+    try:
+        log = TxLog(args.txlog)
+    except (OSError, ValueError) as e:
+        print(f"✗ {e}", file=sys.stderr)
+        sys.exit(1)
+    if args.gateway is not None and args.gateway not in log.gateways:
+        parser.error(f"unknown gateway '{args.gateway}' (logged: {', '.join(log.gateways)})")
+
+    start, end = args.start, args.end
+    if args.around is not None:
+        start, end = args.around - args.span / 2, args.around + args.span / 2
+    records = log.select(start, end, args.gateway)
+    if not len(records):
+        print(f"✗ No transactions in {args.txlog} for that window", file=sys.stderr)
+        sys.exit(1)
+    first, last = log.span(records)
+    start = first if start is None else start
+    end = last if end is None else end
+
+    events_file = args.events or events_path(args.txlog)
+    events = read_events(events_file) if os.path.exists(events_file) else []
+    print_analysis(log, records, start, end, args.resolution or pick_resolution(end - start),
+                   events)
+
+
+if __name__ == "__main__":
+    main()
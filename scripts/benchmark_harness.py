@@ -0,0 +1,242 @@
+"""
+Microbenchmarks of the harness's own hot path.
+
+Runs LoadTester's transaction path against a no-op driver, whose
+statements return at once, so all that is left to time is the client:
+key choice and statement building, the retry wrapper, phase spans,
+histogram records and the worker -> parent sample hand-off. Every
+benchmark reports microseconds per call (best of --repeat runs, like
+timeit) and the calls per second that allows; the "worker loop" row is
+the most TPS one worker thread can drive before the cluster does any
+work at all.
+
+--driver fake runs the same path on fakedb instead, which adds the fake's
+own statement parsing (closer to what a real driver costs the client).
+
+Example:
+    python benchmark_harness.py --workload default,ycsb-b,tpcc-lite
+"""
+import argparse
+import time
+from typing import Callable, List, Tuple
+
+import fakedb
+from histogram import LatencyHistogram
+from load_test import FLUSH_INTERVAL, LoadTester
+from txlog import txlog_phases
+from workloads import Workload, load_workload
+
+DEFAULT_ITERATIONS = 20_000
+DEFAULT_REPEAT = 5
+
+
+class NullCursor:
+    """A cursor whose statements do nothing; SELECTs return `rows` canned rows."""
+
+    def __init__(self, rows: List[tuple]):
+        self.rows = rows
+        self.rowcount = 1
+        self._pending: List[tuple] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, sql, params=None):
+        self._pending = self.rows
+
+    def fetchall(self):
+        rows, self._pending = self._pending, []
+        return rows
+
+    def fetchmany(self, size: int = 1):
+        rows, self._pending = self._pending[:size], self._pending[size:]
+        return rows
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def close(self):
+        pass
+
+
+class NullConnection:
+    """A connection that commits instantly and never fails."""
+
+    def __init__(self, rows: int = 5):
+        self.autocommit = False
+        self.closed = 0
+        self._rows = [(i + 1, i, 10.5, None) for i in range(rows)]
+
+    def cursor(self, *args, **kwargs) -> NullCursor:
+        return NullCursor(self._rows)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+def bench(fn: Callable[[], object], iterations: int, repeat: int) -> float:
+    """Microseconds per fn() call: the best of `repeat` loops of `iterations` calls."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(iterations):
+            fn()
+        best = min(best, (time.perf_counter_ns() - start) / iterations)
+    return best / 1000.0
+
+
+def _connect(driver: str):
+    if driver == 'fake':
+        return fakedb.FakeCluster({}).connect()
+    return NullConnection()
+
+
+def _worker_loop(tester: LoadTester, parent: LoadTester, conn) -> Callable[[], None]:
+    """One iteration of load_test._worker_loop, hand-offs included."""
+    next_flush = time.time() + FLUSH_INTERVAL
+
+    def step():
+        nonlocal next_flush
+        tester.record_result(tester.run_transaction(conn))
+        now = time.time()
+        if now >= next_flush:
+            parent.merge_sample(tester.take_sample())
+            next_flush = now + FLUSH_INTERVAL
+    return step
+
+
+def _bookkeeping(tester: LoadTester, phases: List[str]) -> Callable[[], None]:
+    """The phase spans and record_result of one successful transaction."""
+    def step():
+        for phase in phases:
+            tester._timer(phase, 20_000)
+        tester.record_result(0.05)
+    return step
+
+
+def primitive_benchmarks(iterations: int, repeat: int) -> List[Tuple[str, float]]:
+    """Building blocks every transaction pays for, for scale."""
+    hist = LatencyHistogram()
+    clock = time.perf_counter_ns
+    n = 12345
+    return [
+        ("time.time()", bench(time.time, iterations, repeat)),
+        ("perf_counter_ns span", bench(lambda: clock() - clock(), iterations, repeat)),
+        ("f-string description", bench(lambda: f"Load test transaction {n}", iterations, repeat)),
+        ("histogram record", bench(lambda: hist.record(12.5), iterations, repeat)),
+    ]
+
+
+def workload_benchmarks(spec: dict, driver: str, iterations: int,
+                        repeat: int) -> List[Tuple[str, float]]:
+    workload = Workload(spec)
+    counter = iter(range(10 ** 12))
+    results = [("next_transaction", bench(lambda: workload.next_transaction(next(counter)),
+                                          iterations, repeat))]
+
+    layout = {'phases': txlog_phases(workload), 'gateways': []}
+    for label, settings in (("transaction (plain SQL)", dict(prepare=False)),
+                            ("transaction (prepared)", dict(prepare=True)),
+                            ("transaction (no phases)", dict(prepare=True, phase_timing=False)),
+                            ("transaction (txlog)", dict(prepare=True, txlog_layout=layout))):
+        tester = LoadTester(workload=spec, quiet=True, **settings)
+        conn = _connect(driver)
+
+        def transaction():
+            tester.record_result(tester.run_transaction(conn))
+        results.append((label, bench(transaction, iterations, repeat)))
+
+    # What --txlog adds once the transaction is done: the difference of these two rows,
+    # timed in alternation so a noisy machine's drift hits both alike
+    steps = []
+    for label, settings in (("bookkeeping", {}), ("bookkeeping (txlog)", dict(txlog_layout=layout))):
+        tester = LoadTester(workload=spec, quiet=True, **settings)
+        tester.record_result(tester.run_transaction(_connect(driver)))
+        steps.append((label, _bookkeeping(tester, layout['phases'])))
+    best = {label: float('inf') for label, _ in steps}
+    for _ in range(repeat):
+        for label, step in steps:
+            best[label] = min(best[label], bench(step, iterations, 1))
+    results += [(label, best[label]) for label, _ in steps]
+    results.append(("txlog (per transaction)", best["bookkeeping (txlog)"] - best["bookkeeping"]))
+
+    # The hand-off of one flush, and one interval report, on a flush's worth of samples
+    tester = LoadTester(workload=spec, quiet=True)
+    parent = LoadTester(workload=spec, quiet=True)
+    conn = _connect(driver)
+    for _ in range(1000):
+        tester.record_result(tester.run_transaction(conn))
+    sample = tester.take_sample()
+    results.append(("hand-off (per flush)",
+                    bench(lambda: parent.merge_sample(sample), iterations // 10, repeat)))
+    results.append(("report (per interval)",
+                    bench(lambda: parent.format_metrics(
+                        parent.calculate_metrics(parent.report_state())),
+                          max(1, iterations // 100), repeat)))
+
+    results.append(("worker loop", bench(_worker_loop(LoadTester(workload=spec, quiet=True),
+                                                      parent, _connect(driver)),
+                                         iterations, repeat)))
+    return results
+
+
+def print_results(title: str, results: List[Tuple[str, float]]):
+    print(f"\n{title}")
+    print(f"{'Benchmark':<26} {'µs/call':>10} {'calls/sec':>12}")
+    for name, us in results:
+        print(f"{name:<26} {us:10.2f} {1e6 / us if us > 0 else 0:12,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the load harness's own per-transaction cost against a no-op driver.",
+        epilog="Example: python benchmark_harness.py --workload default,ycsb-b --iterations 50000",
+    )
+    parser.add_argument("--workload", default="default",
+                        help="Comma-separated workload names or JSON spec files (default: default)")
+    parser.add_argument("--driver", choices=("null", "fake"), default="null",
+                        help="null: statements do nothing; fake: fakedb with zero latency "
+                             "(default: null)")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS,
+                        help=f"Calls per timing loop (default: {DEFAULT_ITERATIONS})")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"Timing loops per benchmark; the best counts (default: {DEFAULT_REPEAT})")
+    args = parser.parse_args()
+
+    if args.iterations < 100 or args.repeat < 1:
+        parser.error("--iterations must be at least 100 and --repeat at least 1")
+    try:
+        specs = [load_workload(name.strip()) for name in args.workload.split(',') if name.strip()]
+    except ValueError as e:
+        parser.error(str(e))
+
+    print("="*70)
+    print(f"HARNESS OVERHEAD ({args.driver} driver, best of {args.repeat} x {args.iterations:,})")
+    print("="*70)
+    print_results("Primitives", primitive_benchmarks(args.iterations, args.repeat))
+
+    ceilings = []
+    for spec in specs:
+        results = workload_benchmarks(spec, args.driver, args.iterations, args.repeat)
+        print_results(f"Workload {spec['name']}", results)
+        ceilings.append((spec['name'], dict(results)["worker loop"]))
+
+    print(f"\n{'-' * 70}")
+    for name, us in ceilings:
+        print(f"{name}: {us:.1f} µs of client time per transaction; one worker "
+              f"drives at most {1e6 / us:,.0f} TPS")
+    print("="*70 + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Self-describing result bundles for load_test.py --bundle.
+
+A bundle is one JSON file (gzipped when the name ends in .gz) that keeps
+everything needed to judge a run after the terminal is gone:
+
+- config: the workload spec, concurrency, rate, retry policy, gateways,
+  the command line and the harness' git revision
+- cluster: server version, live nodes and the transactions table's
+  CREATE statement with the schema variant it matches (see
+  setup_database.SCHEMAS)
+- summary: the FINAL REPORT numbers
+- histograms: the run's total latency histogram and one per phase, in
+  LatencyHistogram.to_dict form, so bundles can be merged losslessly
+- intervals: the export series (same columns as --output) with each
+  interval's own histogram, which is what compare.py resamples for its
+  confidence intervals
+
+compare.py reads bundles back with load_bundles.
+"""
+import glob
+import gzip
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import psycopg2
+
+from cluster import dsn_for
+from histogram import LatencyHistogram
+
+BUNDLE_FORMAT = "crdb-load-bundle/1"
+BUNDLE_INTERVAL = 1.0  # Default export interval when bundling: seconds per resampled interval
+
+
+def guess_schema(create_statement: str) -> str:
+    """Which setup_database.py schema variant a CREATE TABLE statement looks like."""
+    text = create_statement.upper()
+    if "USING HASH" in text:
+        return 'hash-sharded'
+    if "STORING" in text:
+        return 'covering'
+    if "GEN_RANDOM_UUID" in text:
+        return 'uuid'
+    if "UNIQUE_ROWID" in text or "SERIAL" in text:
+        return 'serial'
+    return 'unknown'
+
+
+def probe_cluster(nodes: List[str]) -> Dict[str, object]:
+    """Version, live nodes and table schema of the cluster, as far as they can be read."""
+    info: Dict[str, object] = {'nodes': list(nodes)}
+    try:
+        conn = psycopg2.connect(dsn_for(nodes[0]), connect_timeout=2)
+    except psycopg2.Error as e:
+        info['error'] = str(e).strip()
+        return info
+    conn.autocommit = True
+    queries = {
+        'version': "SELECT version();",
+        'live_nodes': "SELECT count(*) FROM crdb_internal.gossip_liveness "
+                      "WHERE updated_at > now() - INTERVAL '10 seconds';",
+        'create_statement': "SELECT create_statement FROM [SHOW CREATE TABLE transactions];",
+    }
+    try:
+        with conn.cursor() as cur:
+            for key, query in queries.items():
+                try:
+                    cur.execute(query)
+                    row = cur.fetchone()
+                except psycopg2.Error:
+                    continue
+                if row is not None:
+                    info[key] = row[0]
+    finally:
+        conn.close()
+    info['schema'] = guess_schema(str(info.get('create_statement', '')))
+    return info
+
+
+def harness_revision() -> Optional[str]:
+    """git revision of the scripts (with -dirty for local changes), if available."""
+    try:
+        result = subprocess.run(["git", "describe", "--always", "--dirty"],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+class ResultBundle:
+    """Collects one run's intervals (from the export path) and writes them out."""
+
+    def __init__(self, config: dict, cluster: Optional[dict] = None):
+        self.config = dict(config)
+        self.config.setdefault('argv', sys.argv)
+        self.config.setdefault('python', platform.python_version())
+        self.config.setdefault('harness', harness_revision())
+        self.cluster = cluster or {}
+        self.intervals: List[dict] = []
+        self.path: Optional[str] = None
+
+    def add_interval(self, row: dict, histogram: LatencyHistogram, elapsed: float,
+                     measured: bool):
+        """
+        One export interval: the exported row, the interval's latency
+        histogram, its length in seconds and whether it is measured: whole,
+        and after the warmup.
+        """
+        self.intervals.append(dict(row, elapsed=elapsed, measured=measured,
+                                   histogram=histogram.to_dict()))
+
+    def finish(self, tester) -> dict:
+        """The bundle of a finished LoadTester.run, as a dict."""
+        elapsed = tester.total_elapsed
+        pct = tester.total_latencies.percentiles((50, 95, 99, 99.9))
+        return {
+            'format': BUNDLE_FORMAT,
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(tester.start_time)),
+            'config': self.config,
+            'cluster': self.cluster,
+            'summary': {
+                'elapsed': elapsed,
+                'transactions': tester.transaction_count,
+                'errors': tester.error_count,
+                'tps': tester.transaction_count / elapsed if elapsed > 0 else 0.0,
+                'p50': pct[50],
+                'p95': pct[95],
+                'p99': pct[99],
+                'p999': pct[99.9],
+                'max': tester.total_latencies.max_us / 1000.0,
+                'retries': tester.total_retry_stats.retries,
+                'retry_cost_ms': tester.total_retry_stats.retry_cost_ms,
+                'aborts': dict(tester.total_retry_stats.aborts),
+                'rows': tester.row_count,
+                'scans': tester.total_scan_stats.scans,
+                'scan_rows': tester.total_scan_stats.rows,
+            },
+            'histograms': {
+                'total': tester.total_latencies.to_dict(),
+                'phases': {phase: hist.to_dict()
+                           for phase, hist in tester.total_phase_latencies.items()},
+            },
+            'events': [list(event) for event in tester.events],
+            'intervals': self.intervals,
+        }
+
+    def write(self, directory: str, tester, label: str = "") -> str:
+        """Write the bundle to a new file in `directory` and return its path."""
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(tester.start_time))
+        name = "-".join(part for part in (stamp, self.config.get('workload', {}).get('name'),
+                                          label) if part)
+        path = os.path.join(directory, f"{name}.json.gz")
+        suffix = 1
+        while os.path.exists(path):
+            suffix += 1
+            path = os.path.join(directory, f"{name}-{suffix}.json.gz")
+        with gzip.open(path, 'wt') as f:
+            json.dump(self.finish(tester), f)
+        self.path = path
+        return path
+
+
+def load_bundle(path: str) -> dict:
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as f:
+        bundle = json.load(f)
+    if bundle.get('format') != BUNDLE_FORMAT:
+        raise ValueError(f"{path} is not a result bundle ({BUNDLE_FORMAT})")
+    bundle['path'] = path
+    return bundle
+
+
+def load_bundles(paths: List[str]) -> List[dict]:
+    """Bundles from files and directories (every *.json / *.json.gz in them), in name order."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, "*.json")) +
+                            glob.glob(os.path.join(path, "*.json.gz")))
+        else:
+            files.append(path)
+    if not files:
+        raise ValueError(f"no bundles in {', '.join(paths)}")
+    return [load_bundle(path) for path in files]
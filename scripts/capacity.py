@@ -0,0 +1,146 @@
+"""
+Saturation search for load_test.py --find-capacity.
+
+The offered load (connections, or an arrival rate) is doubled step by step
+until a step breaks the SLO, i.e. its p99 exceeds the target or more than
+`max_error_rate` of its transactions fail. The knee is then binary-searched
+between the last passing and the first failing load. Every step is kept,
+so the result doubles as a capacity curve: offered load vs achieved TPS
+vs p99.
+
+Curves from several topologies (e.g. --label 3-node and --label 5-node)
+can be appended to one CSV and plotted together with
+generate_graphs.py --capacity.
+"""
+import csv
+import os
+import re
+from typing import Callable, Dict, List, Optional
+
+CURVE_COLUMNS = ['label', 'knob', 'offered', 'tps', 'p50_latency', 'p99_latency',
+                 'errors', 'transactions', 'passed']
+
+_DURATION = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(ms|s)?\s*$")
+
+
+def parse_latency_ms(value: str) -> float:
+    """Parse an SLO latency such as "50ms", "0.05s" or "50" (ms)."""
+    match = _DURATION.match(value)
+    if not match or float(match.group(1)) <= 0:
+        raise ValueError(f"invalid latency '{value}' (expected e.g. 50ms)")
+    number = float(match.group(1))
+    return number * 1000 if match.group(2) == 's' else number
+
+
+def passes(step: Dict[str, float], slo_p99_ms: float, max_error_rate: float) -> bool:
+    attempted = step['transactions'] + step['errors']
+    error_rate = step['errors'] / attempted if attempted else 1.0
+    return step['transactions'] > 0 and step['p99'] <= slo_p99_ms and error_rate <= max_error_rate
+
+
+def find_capacity(run_step: Callable[[float], Dict[str, float]], start: float,
+                  slo_p99_ms: float, max_error_rate: float = 0.001,
+                  integer: bool = True, tolerance: float = 0.1,
+                  max_steps: int = 12, granularity: int = 1) -> List[Dict[str, float]]:
+    """
+    Ramp, then binary-search, the offered load under a p99 SLO.
+
+    Args:
+        run_step: Runs one step at the given load and returns a dict with
+            tps, p50, p99 (ms), errors and transactions
+        start: First load to try
+        slo_p99_ms: Highest acceptable p99
+        max_error_rate: Highest acceptable share of failed transactions
+        integer: Loads are whole numbers (connections) rather than rates
+        tolerance: Stop once the search interval is within this fraction
+            of the passing load (or 1 connection)
+        max_steps: Upper bound on the number of steps run
+        granularity: With integer loads, every load tried is a multiple of
+            this (e.g. the process count connections are split over), so
+            the load offered is the load recorded
+
+    Returns:
+        Every step, in the order run, with 'offered' and 'passed' added
+    """
+    steps: List[Dict[str, float]] = []
+
+    def run(load: float) -> bool:
+        step = dict(run_step(load))
+        step['offered'] = load
+        step['passed'] = passes(step, slo_p99_ms, max_error_rate)
+        steps.append(step)
+        verdict = "within SLO" if step['passed'] else "breaks SLO"
+        print(f"\n>>> Step {len(steps)}: offered {load:g} -> {step['tps']:.1f} TPS, "
+              f"p99 {step['p99']:.2f} ms, {step['errors']} errors ({verdict})")
+        return step['passed']
+
+    good: Optional[float] = None
+    bad: Optional[float] = None
+    load = start
+    if integer:
+        load = max(1, -(-int(start) // granularity)) * granularity
+
+    # Ramp: double until a step fails
+    while len(steps) < max_steps:
+        if run(load):
+            good = load
+            load = load * 2
+        else:
+            bad = load
+            break
+
+    if good is None or bad is None:
+        return steps
+
+    # Bisect the knee
+    while len(steps) < max_steps:
+        if integer and bad - good <= granularity:
+            break
+        if not integer and bad - good <= tolerance * good:
+            break
+        middle = (good + bad) / 2
+        if integer:
+            middle = good + int(bad - good) // (2 * granularity) * granularity
+        if run(middle):
+            good = middle
+        else:
+            bad = middle
+
+    return steps
+
+
+def knee(steps: List[Dict[str, float]]) -> Optional[Dict[str, float]]:
+    """The passing step with the highest offered load."""
+    passing = [step for step in steps if step['passed']]
+    return max(passing, key=lambda step: step['offered']) if passing else None
+
+
+def print_curve(steps: List[Dict[str, float]], knob: str, slo_p99_ms: float, label: str = ""):
+    print("="*70)
+    print(f"CAPACITY CURVE{f' ({label})' if label else ''} - p99 SLO {slo_p99_ms:g} ms")
+    print("="*70)
+    print(f"{'Offered (' + knob + ')':>18} {'TPS':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'Errors':>7}  SLO")
+    for step in sorted(steps, key=lambda step: step['offered']):
+        print(f"{step['offered']:18g} {step['tps']:9.1f} {step['p50']:9.2f} {step['p99']:9.2f} "
+              f"{step['errors']:7d}  {'ok' if step['passed'] else 'FAIL'}")
+    best = knee(steps)
+    if best:
+        print(f"\nCapacity: {best['tps']:.1f} TPS at {best['offered']:g} {knob} "
+              f"(p99 {best['p99']:.2f} ms)")
+    else:
+        print(f"\nNo step met the SLO; try a lower starting load")
+    print("="*70 + "\n")
+
+
+def append_curve(path: str, steps: List[Dict[str, float]], knob: str, label: str):
+    """Append the steps to a curve CSV (header written if the file is new)."""
+    new = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, 'a', newline='') as f:
+        writer = csv.writer(f)
+        if new:
+            writer.writerow(CURVE_COLUMNS)
+        for step in sorted(steps, key=lambda step: step['offered']):
+            writer.writerow([label, knob, f"{step['offered']:g}", f"{step['tps']:.3f}",
+                             f"{step['p50']:.3f}", f"{step['p99']:.3f}", step['errors'],
+                             step['transactions'], int(step['passed'])])
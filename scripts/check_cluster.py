@@ -1,12 +1,64 @@
 """
 Quick cluster health check script.
 Verifies cluster status and displays key information.
+
+With --watch it becomes a background collector: every node is polled
+concurrently, over one persistent connection each, for QPS, latency,
+range/lease counts, replication queue length and CPU, and the readings are
+written as a time series (see ClusterCollector). load_test.py --collect
+runs the same collector on the load test's time axis.
+
+With --ranges it tracks the transactions table's ranges instead (or as
+well), printing every lease transfer, replica move, split and merge (see
+ranges.py); load_test.py --track-ranges does the same during a run.
 """
+import argparse
 import psycopg2
+import re
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+
+from cluster import DEFAULT_NODES, dsn_for, http_address, parse_nodes
+from metrics_export import open_interval_writer
+from ranges import RangeTracker, ranges_path
+from scenario import EventLog
 
 DSN_APP = "postgresql://root@localhost:26257/study_db?sslmode=disable"
 
+# Collected metric -> node metric name. Counters are turned into per-second rates.
+NODE_METRICS = {
+    'qps': 'sql.query.count',
+    'p50_latency': 'sql.service.latency-p50',
+    'p99_latency': 'sql.service.latency-p99',
+    'ranges': 'ranges',
+    'leaseholders': 'replicas.leaseholders',
+    'replicate_queue': 'queue.replicate.pending',
+    'cpu_percent': 'sys.cpu.combined.percent-normalized',
+}
+COUNTERS = {'qps'}
+NANOS = {'p50_latency', 'p99_latency'}  # Reported in ns, collected in ms
+COLLECT_COLUMNS = ['time_elapsed', 'node', 'up'] + list(NODE_METRICS)
+COLLECT_INTERVAL = 5.0
+
+_PROM_LINE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})?\s+(\S+)')
+
+
+def estimated_rows(cur, table: str = 'transactions') -> Optional[int]:
+    """Row count from table statistics: no full scan, may lag recent writes."""
+    cur.execute("""
+        SELECT estimated_row_count
+        FROM crdb_internal.table_row_statistics
+        WHERE table_name = %s;
+    """, (table,))
+    row = cur.fetchone()
+    return int(row[0]) if row and row[0] is not None else None
+
+
 def check_cluster():
     """Check cluster health and display key metrics."""
     try:
@@ -19,9 +71,11 @@ def check_cluster():
             print("DATABASE STATUS")
             print("="*60)
 
-            cur.execute("SELECT COUNT(*) FROM transactions;")
-            count = cur.fetchone()[0]
-            print(f"Total transactions in database: {count:,}")
+            count = estimated_rows(cur)
+            if count is None:
+                print("Total transactions in database: unknown (no table statistics yet)")
+            else:
+                print(f"Total transactions in database: ~{count:,} (table statistics)")
 
             # Check if index exists
             cur.execute("""
@@ -48,7 +102,8 @@ def check_cluster():
                 """)
                 live_nodes = cur.fetchone()[0]
                 print(f"\nLive nodes: {live_nodes}")
-            except:
+            except psycopg2.Error:
+                conn.rollback()
                 print("\nNode count: Unable to determine (requires cluster access)")
 
             print("="*60)
@@ -71,6 +126,258 @@ def check_cluster():
         return False
 
 
+def _prometheus_name(metric: str) -> str:
+    """_status/vars spells node metric names with '_' for '.' and '-'."""
+    return metric.replace('.', '_').replace('-', '_')
+
+
+class _SqlSource:
+    """Reads a node's own metrics from crdb_internal.node_metrics."""
+
+    def __init__(self, node: str):
+        self.node = node
+        self.conn = None
+
+    def read(self) -> Dict[str, float]:
+        if self.conn is None or self.conn.closed:
+            self.conn = psycopg2.connect(dsn_for(self.node), connect_timeout=2)
+            self.conn.autocommit = True
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT name, value
+                FROM crdb_internal.node_metrics
+                WHERE name IN %s;
+            """, (tuple(NODE_METRICS.values()),))
+            return dict(cur.fetchall())
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+
+class _HttpSource:
+    """Reads a node's Prometheus endpoint, _status/vars, over a kept-alive session."""
+
+    def __init__(self, node: str):
+        self.url = f"http://{http_address(node)}/_status/vars"
+        self.session = requests.Session()
+        self._buckets: Dict[str, Dict[float, float]] = {}  # Previous cumulative buckets
+
+    def read(self) -> Dict[str, float]:
+        response = self.session.get(self.url, timeout=2)
+        response.raise_for_status()
+
+        values, buckets = {}, {}
+        for line in response.text.splitlines():
+            match = _PROM_LINE.match(line)
+            if not match:
+                continue
+            name, labels, value = match.groups()
+            if name.endswith('_bucket') and labels and 'le="' in labels:
+                le = labels.split('le="', 1)[1].split('"', 1)[0]
+                buckets.setdefault(name[:-len('_bucket')], {})[float(le)] = float(value)
+            elif not labels:
+                values[name] = float(value)
+
+        readings = {}
+        for metric in NODE_METRICS.values():
+            base, _, quantile = metric.partition('-p')
+            if quantile and _prometheus_name(base) in buckets:
+                name = _prometheus_name(base)
+                readings[metric] = self._quantile(name, buckets[name], float(quantile) / 100)
+            elif _prometheus_name(metric) in values:
+                readings[metric] = values[_prometheus_name(metric)]
+        self._buckets.update(buckets)
+        return readings
+
+    def _quantile(self, name: str, cumulative: Dict[float, float], q: float) -> float:
+        """Quantile of the observations since the previous poll (bucket upper bound)."""
+        previous = self._buckets.get(name, {})
+        bounds = sorted(cumulative)
+        counts = [cumulative[b] - previous.get(b, 0.0) for b in bounds]
+        if not counts or counts[-1] <= 0:
+            return 0.0
+        target = q * counts[-1]
+        finite = [b for b in bounds if b != float('inf')]
+        for bound, count in zip(bounds, counts):
+            if count >= target:
+                return bound if bound in finite else (finite[-1] if finite else 0.0)
+        return 0.0
+
+    def close(self):
+        self.session.close()
+
+
+class ClusterCollector:
+    """
+    Background poller of per-node cluster metrics.
+
+    Every `interval` seconds all nodes are read concurrently, one thread and
+    one persistent connection (SQL) or HTTP session per node, and one row
+    per node is handed to `writer`: time_elapsed (from `start_time`, so the
+    rows line up with the load test's own export), node (1-based position
+    in `nodes`), up (0/1) and the NODE_METRICS columns. Counters become
+    per-second rates.
+    """
+
+    SOURCES = ('sql', 'http')
+
+    def __init__(self, nodes: List[str], interval: float = COLLECT_INTERVAL,
+                 source: str = 'sql', writer=None, on_sample=None):
+        self.nodes = nodes
+        self.interval = interval
+        self.writer = writer
+        self.on_sample = on_sample  # Called with the rows of each poll
+        source_class = _SqlSource if source == 'sql' else _HttpSource
+        self._sources = [source_class(node) for node in nodes]
+        self._previous: List[Optional[tuple]] = [None] * len(nodes)  # (time, raw readings)
+        self._executor = ThreadPoolExecutor(max_workers=len(nodes), thread_name_prefix="collector")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.start_time = time.time()
+        self.polls = 0
+
+    def start(self, start_time: Optional[float] = None):
+        self.start_time = start_time or time.time()
+        self._thread = threading.Thread(target=self._run, name="cluster-collector", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+        for source in self._sources:
+            source.close()
+
+    def _run(self):
+        next_poll = time.time()
+        while not self._stop.is_set():
+            self.poll()
+            next_poll += self.interval
+            self._stop.wait(max(0.0, next_poll - time.time()))
+
+    def _read(self, index: int):
+        try:
+            return time.time(), self._sources[index].read()
+        except (psycopg2.Error, requests.RequestException):
+            source = self._sources[index]
+            if isinstance(source, _SqlSource) and source.conn is not None:
+                source.conn.close()  # Reconnect on the next poll
+            return time.time(), None
+
+    def poll(self) -> List[Dict[str, float]]:
+        """Read every node once, concurrently, and emit one row per node."""
+        readings = list(self._executor.map(self._read, range(len(self.nodes))))
+        rows = []
+        for i, (now, raw) in enumerate(readings):
+            row = {'time_elapsed': now - self.start_time, 'node': i + 1, 'up': 0}
+            row.update({column: 0.0 for column in NODE_METRICS})
+            if raw is not None:
+                row['up'] = 1
+                previous = self._previous[i]
+                for column, metric in NODE_METRICS.items():
+                    value = float(raw.get(metric, 0.0))
+                    if column in COUNTERS:
+                        if previous and now > previous[0]:
+                            delta = value - previous[1].get(metric, value)
+                            row[column] = max(0.0, delta) / (now - previous[0])
+                    elif column in NANOS:
+                        row[column] = value / 1e6
+                    else:
+                        row[column] = value
+                self._previous[i] = (now, raw)
+            else:
+                self._previous[i] = None
+            rows.append(row)
+            if self.writer:
+                self.writer.write(row)
+
+        self.polls += 1
+        if self.on_sample:
+            self.on_sample(rows)
+        return rows
+
+
+def print_rows(nodes: List[str], rows: List[Dict[str, float]]):
+    print(f"\n[{time.strftime('%H:%M:%S')}] {'node':<21} {'QPS':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'ranges':>7} {'leases':>7} {'replQ':>6} {'CPU %':>6}")
+    for row in rows:
+        node = nodes[row['node'] - 1]
+        if not row['up']:
+            print(f"{'':>10} {node:<21} {'down':>8}")
+            continue
+        print(f"{'':>10} {node:<21} {row['qps']:8.1f} {row['p50_latency']:8.2f} "
+              f"{row['p99_latency']:8.2f} {row['ranges']:7.0f} {row['leaseholders']:7.0f} "
+              f"{row['replicate_queue']:6.0f} {row['cpu_percent'] * 100:6.1f}")
+
+
+def print_changes(summary: str, changes: List[tuple], limit: int = 20):
+    print(f"\n[{time.strftime('%H:%M:%S')}] {summary}")
+    for event, _, detail in changes[:limit]:
+        print(f"{'':>10} {event:<15} {detail}")
+    if len(changes) > limit:
+        print(f"{'':>10} ... and {len(changes) - limit} more")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check cluster health, or collect per-node metrics continuously.",
+        epilog="Example: python check_cluster.py --watch 5 --nodes local --output nodes.csv",
+    )
+    parser.add_argument("--watch", type=float, default=None, metavar="SECONDS",
+                        help="Poll every node every SECONDS until Ctrl+C")
+    parser.add_argument("--nodes", type=parse_nodes, default=None,
+                        help="Nodes to poll, e.g. localhost:26257,localhost:26258 or 'local' "
+                             "(default: localhost:26257)")
+    parser.add_argument("--source", choices=ClusterCollector.SOURCES, default="sql",
+                        help="crdb_internal.node_metrics over SQL, or each node's "
+                             "_status/vars over HTTP (default: sql)")
+    parser.add_argument("--ranges", type=float, default=None, metavar="SECONDS",
+                        help="Snapshot the transactions table's ranges every SECONDS until "
+                             "Ctrl+C and print lease transfers and replica moves")
+    parser.add_argument("--output", default=None, metavar="PATH",
+                        help="Write one row per node and poll to PATH (.csv or binary); "
+                             "range changes go to <PATH>.ranges.csv")
+    args = parser.parse_args()
+
+    if args.watch is None and args.ranges is None:
+        success = check_cluster()
+        sys.exit(0 if success else 1)
+    if (args.watch is not None and args.watch <= 0) or (args.ranges is not None and args.ranges <= 0):
+        parser.error("--watch and --ranges must be positive")
+
+    nodes = args.nodes or DEFAULT_NODES
+    writer = collector = range_log = tracker = None
+    if args.watch:
+        if args.output:
+            writer = open_interval_writer(args.output, COLLECT_COLUMNS)
+        collector = ClusterCollector(nodes, interval=args.watch, source=args.source, writer=writer,
+                                     on_sample=lambda rows: print_rows(nodes, rows))
+        collector.start()
+    if args.ranges:
+        if args.output:
+            range_log = EventLog(ranges_path(args.output))
+        tracker = RangeTracker(nodes, interval=args.ranges, log=range_log, on_change=print_changes)
+        tracker.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n✓ Collector stopped")
+    finally:
+        if collector:
+            collector.stop()
+        if tracker:
+            tracker.stop()
+            print(f"✓ {tracker.changes} range changes over {tracker.polls} snapshots")
+        if writer:
+            writer.close()
+            print(f"✓ Wrote {writer.rows_written} rows to {writer.path}")
+        if range_log:
+            range_log.close()
+            print(f"✓ Wrote {range_log.count} range changes to {range_log.path}")
+
+
 if __name__ == "__main__":
-    success = check_cluster()
-    sys.exit(0 if success else 1)
+    main()
@@ -0,0 +1,272 @@
+"""
+Cluster addressing shared by the scripts.
+
+docker-compose.yaml publishes each node's SQL port on localhost
+(roach1 -> 26257, roach2 -> 26258, ... roach5 -> 26261), so a node is
+addressed here as "host:port" and turned into a DSN on demand.
+GatewayPool spreads load-test connections over those gateways.
+"""
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import psycopg2
+
+import fakedb
+
+DEFAULT_NODES = ["localhost:26257"]
+ALL_LOCAL_NODES = [f"localhost:{26257 + i}" for i in range(5)]
+
+
+def dsn_for(node: str, database: str = "study_db") -> str:
+    """Build an insecure-cluster DSN for a "host:port" node address."""
+    return f"postgresql://root@{node}/{database}?sslmode=disable"
+
+
+def parse_nodes(value: str) -> List[str]:
+    """
+    Parse a comma-separated node list ("localhost:26257,localhost:26258").
+
+    A bare port ("26258") means localhost, and "local" expands to all five
+    docker-compose nodes.
+    """
+    nodes = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        if item == "local":
+            nodes.extend(ALL_LOCAL_NODES)
+        elif item.isdigit():
+            nodes.append(f"localhost:{item}")
+        else:
+            nodes.append(item if ":" in item else f"{item}:26257")
+    if not nodes:
+        raise ValueError(f"No nodes in '{value}'")
+    return nodes
+
+
+def http_address(node: str) -> str:
+    """Admin UI / HTTP address of a node: SQL port 26257 + i -> 8080 + i, as in docker-compose."""
+    host, _, port = node.rpartition(":")
+    return f"{host}:{int(port) - 26257 + 8080}"
+
+
+# docker-compose container addresses as seen from the host
+COMPOSE_ADDRESSES = {f"roach{i + 1}:26257": f"localhost:{26257 + i}" for i in range(5)}
+CONNECTION_SQLSTATES = {"57P01", "57P02", "57P03"}  # Node draining / shutting down
+
+
+class NoGatewayError(RuntimeError):
+    """Raised when every gateway in the pool is currently ejected."""
+
+
+def discover_nodes(seed: str, address_map: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    List the live nodes' SQL addresses via crdb_internal.gossip_nodes.
+
+    Addresses are advertised as the cluster sees them (roach2:26257 in
+    docker-compose); address_map translates them to something reachable
+    from here, defaulting to the compose file's published ports.
+    """
+    address_map = COMPOSE_ADDRESSES if address_map is None else address_map
+    conn = psycopg2.connect(dsn_for(seed), connect_timeout=5)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT advertise_sql_address
+                FROM crdb_internal.gossip_nodes
+                WHERE is_live
+                ORDER BY node_id;
+            """)
+            addresses = [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
+    return [address_map.get(address, address) for address in addresses] or [seed]
+
+
+def is_connection_error(conn, error: Optional[Exception]) -> bool:
+    """True if the error means this gateway connection is unusable."""
+    if conn is not None and conn.closed:
+        return True
+    if error is None:
+        return False
+    if isinstance(error, psycopg2.InterfaceError):
+        return True
+    code = getattr(error, "pgcode", None)
+    if code in CONNECTION_SQLSTATES or (code or "").startswith("08"):
+        return True
+    # libpq-level failures (refused, reset, timeout) carry no SQLSTATE
+    return isinstance(error, psycopg2.OperationalError) and code is None
+
+
+class GatewayPool:
+    """
+    Hands out connections spread over several SQL gateways.
+
+    Gateways that fail are ejected; a background thread health-checks them
+    every health_interval seconds and re-admits those that answer again.
+    One pool serves all worker threads of a process.
+    """
+
+    POLICIES = ("round-robin", "least-loaded")
+
+    def __init__(self, nodes: List[str], policy: str = "round-robin",
+                 health_interval: float = 5.0, start: int = 0, database: str = "study_db",
+                 on_change: Optional[Callable[[str, str], None]] = None):
+        """
+        Args:
+            nodes: Gateway addresses ("host:port")
+            policy: "round-robin", or "least-loaded" (fewest open connections)
+            health_interval: Seconds between re-admission checks of ejected nodes
+            start: Round-robin offset, so several processes don't all start on node 0
+            database: Database to connect to
+            on_change: Called as on_change(node, "ejected" | "readmitted")
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown balancing policy '{policy}'")
+        self.nodes = list(nodes)
+        self.policy = policy
+        self.health_interval = health_interval
+        self.database = database
+        self.on_change = on_change
+        self._next = start
+        self._open: Dict[str, int] = {node: 0 for node in self.nodes}
+        self._ejected: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._checker: Optional[threading.Thread] = None
+
+    def healthy(self) -> List[str]:
+        with self._lock:
+            return [node for node in self.nodes if node not in self._ejected]
+
+    def _choose(self, exclude: Set[str]) -> Optional[str]:
+        with self._lock:
+            candidates = [n for n in self.nodes if n not in self._ejected and n not in exclude]
+            if not candidates:
+                return None
+            if self.policy == "least-loaded":
+                fewest = min(self._open[n] for n in candidates)
+                candidates = [n for n in candidates if self._open[n] == fewest]
+            node = candidates[self._next % len(candidates)]
+            self._next += 1
+            self._open[node] += 1
+            return node
+
+    def connect(self) -> Tuple[str, object]:
+        """
+        Open a connection to the next gateway picked by the policy.
+
+        Gateways that refuse the connection are ejected and the next one is
+        tried. Raises NoGatewayError when none is left.
+
+        Returns:
+            (node, connection); hand the node back with release() when done
+        """
+        tried: Set[str] = set()
+        last_error = None
+        while True:
+            node = self._choose(tried)
+            if node is None:
+                raise NoGatewayError(f"No healthy gateway (last error: {last_error})")
+            try:
+                return node, psycopg2.connect(dsn_for(node, self.database), connect_timeout=5)
+            except psycopg2.Error as e:
+                self.release(node)
+                self.eject(node)
+                tried.add(node)
+                last_error = e
+
+    def release(self, node: str):
+        with self._lock:
+            self._open[node] -= 1
+
+    def eject(self, node: str) -> bool:
+        """Stop handing out a gateway until it passes a health check. Returns True if newly ejected."""
+        with self._lock:
+            if node in self._ejected:
+                return False
+            self._ejected.add(node)
+        self._start_checker()
+        if self.on_change:
+            self.on_change(node, "ejected")
+        return True
+
+    def _start_checker(self):
+        with self._lock:
+            if self._checker is None:
+                self._checker = threading.Thread(target=self._health_loop,
+                                                 name="gateway-health", daemon=True)
+                self._checker.start()
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            with self._lock:
+                ejected = list(self._ejected)
+                if not ejected:
+                    self._checker = None
+                    return
+            for node in ejected:
+                if self._check(node):
+                    with self._lock:
+                        self._ejected.discard(node)
+                    if self.on_change:
+                        self.on_change(node, "readmitted")
+
+    def _check(self, node: str) -> bool:
+        try:
+            conn = psycopg2.connect(dsn_for(node, self.database), connect_timeout=2)
+        except psycopg2.Error:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+                cur.fetchone()
+            return True
+        except psycopg2.Error:
+            return False
+        finally:
+            conn.close()
+
+    def close(self):
+        self._stop.set()
+
+
+CPU_METRICS = ("sys.cpu.user.ns", "sys.cpu.sys.ns")
+
+
+def gateway_cpu_seconds(nodes: List[str]) -> Dict[str, float]:
+    """
+    Cumulative CPU seconds used by each node's process.
+
+    crdb_internal.node_metrics reports the node you are connected to, so
+    each gateway is asked directly. Unreachable nodes are left out. Take
+    two readings and divide the difference by wall time for cores used.
+    """
+    readings = {}
+    for node in nodes:
+        try:
+            conn = psycopg2.connect(dsn_for(node), connect_timeout=2)
+        except psycopg2.Error:
+            continue
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT sum(value)
+                    FROM crdb_internal.node_metrics
+                    WHERE name IN %s;
+                """, (CPU_METRICS,))
+                value = cur.fetchone()[0]
+            if value is not None:
+                readings[node] = float(value) / 1e9
+        except psycopg2.Error:
+            pass
+        finally:
+            conn.close()
+    return readings
+
+
+# CRDB_FAKE=<spec> points every script (and worker process) at the stand-in
+if os.environ.get(fakedb.ENV_VAR) is not None:
+    fakedb.install_from_env()
@@ -0,0 +1,333 @@
+"""
+Statistical comparison of result bundles (load_test.py --bundle DIR).
+
+Takes a baseline and a candidate, each one or more bundles (or a directory
+of them; several runs of one side are pooled), and reports for TPS, mean
+and p50/p95/p99/p99.9 latency and the error rate:
+
+- the point estimate of each side over its measured (post-warmup) intervals
+- the candidate's change against the baseline
+- a bootstrap confidence interval for that change
+
+The bootstrap resamples whole export intervals, each carrying its own
+latency histogram, so percentiles are recomputed from merged buckets
+rather than averaged. Neighbouring intervals are correlated (a GC pause
+or a lease transfer spans several), so intervals are drawn in blocks of
+consecutive ones (moving block bootstrap, --block); a block never spans
+two pooled runs, whose intervals aren't consecutive. A metric is flagged as
+a REGRESSION or an IMPROVEMENT only when its interval excludes zero
+and the change is at least --min-effect; the error rate is compared in
+percentage points, since a baseline without errors has no relative change.
+
+The exit status is 1 when any metric regressed, so the script can gate CI:
+
+    python compare.py results/main results/branch --min-effect 3%
+"""
+import argparse
+import math
+import random
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from bundle import load_bundles
+from histogram import LatencyHistogram
+
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_RESAMPLES = 1000
+DEFAULT_MIN_EFFECT = 1.0  # Percent
+
+LATENCY_PERCENTILES = (50, 95, 99, 99.9)
+# Metric name -> True when a higher value is better
+METRICS = {'tps': True, 'mean': False, 'p50': False, 'p95': False, 'p99': False,
+           'p99.9': False, 'error_rate': False}
+_LABELS = {'tps': "TPS", 'mean': "Mean (ms)", 'p50': "p50 (ms)", 'p95': "p95 (ms)",
+           'p99': "p99 (ms)", 'p99.9': "p99.9 (ms)", 'error_rate': "Errors (%)"}
+# config and cluster keys that are expected to differ between two runs
+_IGNORED = {'argv', 'label', 'error'}
+
+
+class Sample:
+    """
+    The measured intervals of one side, laid out for fast resampling.
+
+    Every interval's histogram is turned into cumulative counts over the
+    union of buckets populated by any interval, so the percentile of a
+    weighted set of intervals is a binary search over buckets in which each
+    probe sums one column.
+    """
+
+    def __init__(self, bundles: List[dict]):
+        self.paths = [bundle['path'] for bundle in bundles]
+        intervals = []
+        self.runs: List[Tuple[int, int]] = []  # [first, end) of each bundle's intervals
+        for bundle in bundles:
+            first = len(intervals)
+            intervals.extend(interval for interval in bundle['intervals'] if interval['measured'])
+            if len(intervals) > first:
+                self.runs.append((first, len(intervals)))
+        if len(intervals) < 2:
+            raise ValueError(f"{', '.join(self.paths)}: fewer than 2 measured intervals "
+                             "to resample (run longer or lower --export-interval)")
+        histograms = [LatencyHistogram.from_dict(interval['histogram']) for interval in intervals]
+        self.template = histograms[0]
+        for hist in histograms[1:]:
+            self.template._check_compatible(hist)
+
+        self.elapsed = [interval['elapsed'] for interval in intervals]
+        self.counts = [hist.count for hist in histograms]
+        self.errors = [interval['errors'] for interval in intervals]
+        self.total_us = [hist.total_us for hist in histograms]
+        self.max_us = [hist.max_us for hist in histograms]
+        self.buckets = sorted({index for hist in histograms for index, _ in hist.nonzero()})
+        position = {index: k for k, index in enumerate(self.buckets)}
+        self.cumulative = []
+        for hist in histograms:
+            row = [0] * len(self.buckets)
+            for index, count in hist.nonzero():
+                row[position[index]] = count
+            running = 0
+            for k, count in enumerate(row):
+                running += count
+                row[k] = running
+            self.cumulative.append(row)
+
+    def __len__(self) -> int:
+        return len(self.elapsed)
+
+    def metrics(self, weights: Sequence[Tuple[int, int]]) -> Dict[str, float]:
+        """Every metric over the intervals in `weights`, as (interval, times drawn) pairs."""
+        elapsed = sum(self.elapsed[i] * w for i, w in weights)
+        count = sum(self.counts[i] * w for i, w in weights)
+        errors = sum(self.errors[i] * w for i, w in weights)
+        result = {
+            'tps': count / elapsed if elapsed > 0 else 0.0,
+            'mean': sum(self.total_us[i] * w for i, w in weights) / count / 1000.0 if count else 0.0,
+            'error_rate': 100.0 * errors / (count + errors) if count + errors else 0.0,
+        }
+        highest = max(self.max_us[i] for i, _ in weights)
+        cumulative = self.cumulative
+        for p in LATENCY_PERCENTILES:
+            if count == 0:
+                result[f"p{p:g}"] = 0.0
+                continue
+            # Same rank as LatencyHistogram.percentiles_us: the first bucket reaching it
+            target = max(1, math.ceil(p / 100.0 * count))
+            low, high = 0, len(self.buckets) - 1
+            while low < high:
+                middle = (low + high) // 2
+                if sum(cumulative[i][middle] * w for i, w in weights) >= target:
+                    high = middle
+                else:
+                    low = middle + 1
+            value = min(self.template.value_at(self.buckets[low]), highest)
+            result[f"p{p:g}"] = value / 1000.0
+        return result
+
+    def everything(self) -> List[Tuple[int, int]]:
+        return [(i, 1) for i in range(len(self))]
+
+    def resample(self, rng: random.Random, block: int) -> List[Tuple[int, int]]:
+        """
+        A moving block bootstrap draw of as many intervals as there are.
+        Blocks are drawn within one run; a run shorter than a block is one
+        block of its own.
+        """
+        n = len(self)
+        starts = []  # (first interval, length) of every block a draw can pick
+        for first, end in self.runs:
+            length = min(block, end - first)
+            starts.extend((start, length) for start in range(first, end - length + 1))
+        drawn = [0] * n
+        taken = 0
+        while taken < n:
+            start, length = starts[rng.randrange(len(starts))]
+            length = min(length, n - taken)
+            for i in range(start, start + length):
+                drawn[i] += 1
+            taken += length
+        return [(i, w) for i, w in enumerate(drawn) if w]
+
+
+def default_block(n: int) -> int:
+    """Block length for n intervals: the usual n^(1/3) rule of thumb."""
+    return max(1, round(n ** (1 / 3)))
+
+
+def delta(metric: str, baseline: float, candidate: float) -> Optional[float]:
+    """Candidate's change: percent for most metrics, percentage points for the error rate."""
+    if metric == 'error_rate':
+        return candidate - baseline
+    if baseline == 0:
+        return 0.0 if candidate == 0 else None
+    return (candidate - baseline) / baseline * 100.0
+
+
+def quantile(values: List[float], q: float) -> float:
+    """q-quantile of sorted values (linear interpolation)."""
+    position = q * (len(values) - 1)
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def compare(baseline: Sample, candidate: Sample, confidence: float = DEFAULT_CONFIDENCE,
+            resamples: int = DEFAULT_RESAMPLES, min_effect: float = DEFAULT_MIN_EFFECT,
+            block: Optional[int] = None, seed: Optional[int] = None) -> List[dict]:
+    """
+    Bootstrap the change of every metric from baseline to candidate.
+
+    Returns:
+        One dict per metric with baseline, candidate, delta, low, high
+        (the confidence interval of delta) and verdict
+    """
+    rng = random.Random(seed)
+    base_block = block or default_block(len(baseline))
+    cand_block = block or default_block(len(candidate))
+    point_base = baseline.metrics(baseline.everything())
+    point_cand = candidate.metrics(candidate.everything())
+
+    draws: Dict[str, List[float]] = {metric: [] for metric in METRICS}
+    for _ in range(resamples):
+        base = baseline.metrics(baseline.resample(rng, base_block))
+        cand = candidate.metrics(candidate.resample(rng, cand_block))
+        for metric in METRICS:
+            change = delta(metric, base[metric], cand[metric])
+            if change is not None:
+                draws[metric].append(change)
+
+    tail = (1.0 - confidence) / 2
+    results = []
+    for metric, higher_is_better in METRICS.items():
+        result = {'metric': metric, 'baseline': point_base[metric],
+                  'candidate': point_cand[metric],
+                  'delta': delta(metric, point_base[metric], point_cand[metric]),
+                  'low': None, 'high': None, 'verdict': ""}
+        values = sorted(draws[metric])
+        if len(values) >= resamples / 2:
+            result['low'] = quantile(values, tail)
+            result['high'] = quantile(values, 1.0 - tail)
+            threshold = 0.0 if metric == 'error_rate' else min_effect
+            if result['low'] > 0 or result['high'] < 0:
+                if abs(result['delta'] or 0.0) >= threshold:
+                    worse = (result['delta'] < 0) == higher_is_better
+                    result['verdict'] = "REGRESSION" if worse else "IMPROVEMENT"
+        results.append(result)
+    return results
+
+
+def differences(baseline: dict, candidate: dict) -> List[Tuple[str, object, object]]:
+    """Config and cluster settings that differ between two bundles."""
+    found = []
+    for section in ('config', 'cluster'):
+        before, after = baseline.get(section, {}), candidate.get(section, {})
+        for key in sorted(before.keys() | after.keys()):
+            if key in _IGNORED or before.get(key) == after.get(key):
+                continue
+            if isinstance(before.get(key), dict) and isinstance(after.get(key), dict):
+                # Workload specs: only the fields that changed
+                inner = before[key].keys() | after[key].keys()
+                for field in sorted(inner):
+                    if before[key].get(field) != after[key].get(field):
+                        found.append((f"{section}.{key}.{field}", before[key].get(field),
+                                      after[key].get(field)))
+            else:
+                found.append((f"{section}.{key}", before.get(key), after.get(key)))
+    return found
+
+
+def _describe(name: str, sample: Sample) -> str:
+    runs = f"{len(sample.paths)} runs" if len(sample.paths) > 1 else sample.paths[0]
+    return f"{name}: {runs} ({len(sample)} intervals, {sum(sample.elapsed):.0f}s measured)"
+
+
+def print_comparison(results: List[dict], baseline: Sample, candidate: Sample,
+                     confidence: float, resamples: int,
+                     changed: List[Tuple[str, object, object]]):
+    print("\n" + "="*70)
+    print(f"RESULT COMPARISON ({confidence:.0%} bootstrap CI, {resamples} resamples)")
+    print("="*70)
+    print(_describe("Baseline", baseline))
+    print(_describe("Candidate", candidate))
+    if changed:
+        print("\nDifferences:")
+        for key, before, after in changed:
+            print(f"  {key}: {before} -> {after}")
+
+    print(f"\n{'Metric':<12} {'Baseline':>10} {'Candidate':>10} {'Change':>10} "
+          f"{'CI':>21}  Verdict")
+    for result in results:
+        unit = "pp" if result['metric'] == 'error_rate' else "%"
+        change = "n/a" if result['delta'] is None else f"{result['delta']:+.1f}{unit}"
+        interval = ("" if result['low'] is None else
+                    f"[{result['low']:+.1f}, {result['high']:+.1f}]{unit}")
+        print(f"{_LABELS[result['metric']]:<12} {result['baseline']:10.2f} "
+              f"{result['candidate']:10.2f} {change:>10} {interval:>21}  {result['verdict']}")
+
+    regressions = [_LABELS[r['metric']] for r in results if r['verdict'] == "REGRESSION"]
+    print(f"\n{'-' * 70}")
+    if regressions:
+        print(f"✗ Significant regression in {', '.join(regressions)}")
+    else:
+        print("✓ No significant regression")
+    print("="*70 + "\n")
+
+
+def parse_percent(value: str) -> float:
+    """Parse an effect size such as "2%" or "2"."""
+    try:
+        number = float(value.strip().rstrip('%'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid effect size '{value}' (expected e.g. 2%)")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"invalid effect size '{value}' (must not be negative)")
+    return number
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare two sets of result bundles with bootstrap confidence intervals.",
+        epilog="Example: python compare.py results/baseline results/candidate --min-effect 3%",
+    )
+    parser.add_argument("baseline", help="Baseline bundle, or a comma-separated list / directory "
+                                         "of bundles to pool")
+    parser.add_argument("candidate", help="Candidate bundle(s), same forms as baseline")
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE,
+                        help=f"Confidence level of the intervals (default: {DEFAULT_CONFIDENCE})")
+    parser.add_argument("--resamples", type=int, default=DEFAULT_RESAMPLES,
+                        help=f"Bootstrap resamples (default: {DEFAULT_RESAMPLES})")
+    parser.add_argument("--min-effect", type=parse_percent, default=DEFAULT_MIN_EFFECT,
+                        metavar="PCT",
+                        help="Smallest change reported as a regression or improvement, "
+                             f"e.g. 2%% (default: {DEFAULT_MIN_EFFECT:g}%%)")
+    parser.add_argument("--block", type=int, default=None, metavar="N",
+                        help="Consecutive intervals per bootstrap block "
+                             "(default: cube root of the interval count)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Random seed, for reproducible intervals")
+    args = parser.parse_args()
+
+    if not 0.5 <= args.confidence < 1:
+        parser.error("--confidence must be between 0.5 and 1")
+    if args.resamples < 100:
+        parser.error("--resamples must be at least 100")
+    if args.block is not None and args.block < 1:
+        parser.error("--block must be at least 1")
+    try:
+        base_bundles = load_bundles(args.baseline.split(','))
+        cand_bundles = load_bundles(args.candidate.split(','))
+        baseline = Sample(base_bundles)
+        candidate = Sample(cand_bundles)
+        baseline.template._check_compatible(candidate.template)
+    except (OSError, ValueError) as e:
+        print(f"✗ {e}", file=sys.stderr)
+        sys.exit(2)
+
+    results = compare(baseline, candidate, args.confidence, args.resamples,
+                      args.min_effect, args.block, args.seed)
+    print_comparison(results, baseline, candidate, args.confidence, args.resamples,
+                     differences(base_bundles[0], cand_bundles[0]))
+    sys.exit(1 if any(r['verdict'] == "REGRESSION" for r in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Reporting off the transaction loop.
+
+The loops that drive load (LoadTester.run's sample loop, load_gen.py's
+transaction loop) only swap out their interval state and hand it over;
+an Aggregator thread does the percentile math, the rendering and the
+export. Handing over is a put on a SimpleQueue, which never blocks.
+
+On a terminal, Dashboard redraws one block of metrics in place instead of
+scrolling a new block every interval; messages (scenario events, gateway
+ejections, transaction errors) are kept in a short log below it. When
+stdout is not a terminal (e.g. redirected to a file) every frame is
+printed as before.
+"""
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from typing import Callable, List
+
+DASHBOARD_REFRESH = 1.0  # Seconds between dashboard redraws
+MESSAGE_LINES = 8
+
+_STOP = object()
+_HOME_CLEAR = "\x1b[H\x1b[J"  # Cursor to the top left, clear to the end of screen
+
+
+class Aggregator:
+    """Runs submitted reporting jobs, in order, on a background thread."""
+
+    def __init__(self, name: str = "aggregator"):
+        self.failures = 0
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, job: Callable, *args):
+        """Queue job(*args). Never blocks."""
+        self._queue.put((job, args))
+
+    def close(self):
+        """Run everything still queued, then stop the thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            job, args = item
+            try:
+                job(*args)
+            except Exception as e:
+                # A broken report must not take the reporting thread down with it
+                self.failures += 1
+                print(f"\n✗ Reporting failed: {e}")
+
+
+class Dashboard:
+    """One block of lines redrawn in place, with a log of recent messages below."""
+
+    def __init__(self, stream=None, message_lines: int = MESSAGE_LINES):
+        self.stream = stream or sys.stdout
+        self.live = self.stream.isatty()
+        self._messages: deque = deque(maxlen=message_lines)
+
+    def message(self, text: str):
+        """Show a one-off message (thread-safe); printed directly when not live."""
+        if self.live:
+            self._messages.append(f"[{time.strftime('%H:%M:%S')}] {text}")
+        else:
+            print(f"\n{text}", file=self.stream)
+
+    def update(self, lines: List[str]):
+        """Replace the block (call from one thread, e.g. the Aggregator)."""
+        if not self.live:
+            print("\n".join(lines), file=self.stream)
+            return
+        frame = list(lines)
+        messages = list(self._messages)
+        if messages:
+            frame += ["Recent messages:"] + [f"  {text}" for text in messages]
+        self.stream.write(_HOME_CLEAR + "\n".join(frame) + "\n")
+        self.stream.flush()
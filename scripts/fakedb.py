@@ -0,0 +1,446 @@
+"""
+In-process stand-in for the CockroachDB cluster.
+
+install() swaps psycopg2.connect for a fake driver, so the harness
+(engine, retries, gateway failover, reporting) can run on a laptop or in
+CI without docker, and fast enough that the database is never the
+bottleneck. It accepts the statements the scripts issue: DML on
+transactions, PREPARE/EXECUTE, the cockroach_restart savepoint protocol,
+DDL, COPY, SHOW RANGES and the crdb_internal queries (which return no
+rows, apart from gossip_nodes/gossip_liveness listing the `nodes` that
+are up and the range tables listing the same ranges as SHOW RANGES).
+
+The behaviour is a JSON spec (inline or a file path):
+
+    {
+      "latency": {"select": "lognormal(0.8ms, 0.5)", "insert": "1ms",
+                  "commit": "uniform(1ms, 3ms)", "default": "0"},
+      "retry_rate": 0.01,
+      "down": ["localhost:26258@30-60", "26259@45s-90s"],
+      "rows": 5
+    }
+
+- latency: per statement kind (select, insert, update, delete, commit,
+  ddl, other, default): a fixed duration ("250us", "1ms", "0.01s") or
+  uniform(lo, hi), normal(mean, sd), lognormal(median, sigma) or
+  exponential(mean). Commit covers RELEASE SAVEPOINT and COMMIT.
+- retry_rate: share of commits that fail with 40001.
+- down: "NODE@START-END" windows, in seconds from install(). Connecting
+  to a node that is down is refused, and open connections to it fail on
+  their next statement.
+- ranges: ranges SHOW RANGES lists (default 10), spread over `nodes`;
+  their leases and replicas move off nodes while they are down.
+- rows: rows each SELECT returns (at most; "id > x" and "LIMIT n" are
+  honoured, so keyset pagination works).
+
+Setting CRDB_FAKE=<spec> in the environment installs it in every script
+(cluster.py checks on import), which also carries it into the worker
+processes of load_test.py --procs. load_test.py --fake does this for you.
+"""
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.errors
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+ENV_VAR = "CRDB_FAKE"
+KINDS = ('select', 'insert', 'update', 'delete', 'commit', 'ddl', 'other')
+DEFAULT_NODES = [f"localhost:{26257 + i}" for i in range(5)]
+
+_DURATION = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(us|ms|s)?\s*$")
+_UNITS_MS = {'us': 0.001, 'ms': 1.0, 's': 1000.0, None: 1.0}
+_DISTRIBUTION = re.compile(r"^\s*(\w+)\s*\((.*)\)\s*$")
+_WINDOW = re.compile(r"^\s*([^@\s]+)\s*@\s*(\d+(?:\.\d+)?)s?\s*-\s*(\d+(?:\.\d+)?)s?\s*$")
+_NODE = re.compile(r"@([^/?]+)")
+_ROW_SEPARATOR = re.compile(r"\)\s*,\s*\(")
+_PLACEHOLDER = r"(\d+|%S|\$\d+)"
+_AFTER_ID = re.compile(r"\bID > " + _PLACEHOLDER)
+_LIMIT = re.compile(r"\bLIMIT " + _PLACEHOLDER + r"\s*;?\s*$")
+
+_installed: Optional["FakeCluster"] = None
+_real_connect = psycopg2.connect
+
+
+class SerializationFailure(psycopg2.errors.SerializationFailure):
+    pgcode = "40001"
+
+
+def parse_duration_ms(value: str) -> float:
+    """"250us", "1ms", "0.01s" or a bare number of ms, as milliseconds."""
+    match = _DURATION.match(str(value))
+    if not match:
+        raise ValueError(f"invalid duration '{value}' (expected e.g. 1ms)")
+    return float(match.group(1)) * _UNITS_MS[match.group(2)]
+
+
+def parse_latency(value: str) -> Callable[[random.Random], float]:
+    """Parse a latency distribution into a sampler returning milliseconds."""
+    match = _DISTRIBUTION.match(str(value))
+    if not match:
+        fixed = parse_duration_ms(value)
+        return lambda rng: fixed
+
+    kind, args = match.group(1), [arg.strip() for arg in match.group(2).split(',')]
+    try:
+        if kind == 'uniform' and len(args) == 2:
+            low, high = parse_duration_ms(args[0]), parse_duration_ms(args[1])
+            return lambda rng: rng.uniform(low, high)
+        if kind == 'normal' and len(args) == 2:
+            mean, sd = parse_duration_ms(args[0]), parse_duration_ms(args[1])
+            return lambda rng: max(0.0, rng.gauss(mean, sd))
+        if kind == 'lognormal' and len(args) == 2:
+            mu, sigma = math.log(parse_duration_ms(args[0])), float(args[1])
+            return lambda rng: rng.lognormvariate(mu, sigma)
+        if kind == 'exponential' and len(args) == 1:
+            mean = parse_duration_ms(args[0])
+            return lambda rng: rng.expovariate(1.0 / mean) if mean > 0 else 0.0
+    except ValueError as e:
+        raise ValueError(f"invalid latency '{value}': {e}")
+    raise ValueError(f"invalid latency '{value}' (expected e.g. 1ms, uniform(1ms, 2ms), "
+                     f"normal(mean, sd), lognormal(median, sigma) or exponential(mean))")
+
+
+def parse_window(value: str) -> Tuple[str, float, float]:
+    """"localhost:26258@30-60" (or "26258@30s-60s") -> (node, start, end)."""
+    match = _WINDOW.match(value)
+    if not match:
+        raise ValueError(f"invalid down window '{value}' (expected NODE@START-END, e.g. 26258@30-60)")
+    node = match.group(1)
+    if node.isdigit():
+        node = f"localhost:{node}"
+    elif ':' not in node:
+        node = f"{node}:26257"
+    return node, float(match.group(2)), float(match.group(3))
+
+
+def load_spec(spec) -> dict:
+    """A spec dict from a dict, a JSON file path or inline JSON ('' = defaults)."""
+    if isinstance(spec, dict):
+        return dict(spec)
+    if not spec:
+        return {}
+    if os.path.exists(spec):
+        with open(spec) as f:
+            return json.load(f)
+    try:
+        return json.loads(spec)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"fake spec is neither a file nor JSON: {e}")
+
+
+class FakeCluster:
+    """Shared state of the stand-in: config, clock origin and row counter."""
+
+    def __init__(self, spec: dict):
+        latency = spec.get('latency', {})
+        unknown = set(latency) - set(KINDS) - {'default'}
+        if unknown:
+            raise ValueError(f"unknown latency kinds: {', '.join(sorted(unknown))} "
+                             f"(choose from {', '.join(KINDS)}, default)")
+        default = parse_latency(latency.get('default', '0'))
+        self.latency = {kind: parse_latency(latency[kind]) if kind in latency else default
+                        for kind in KINDS}
+        self.retry_rate = float(spec.get('retry_rate', 0.0))
+        if not 0.0 <= self.retry_rate <= 1.0:
+            raise ValueError("retry_rate must be between 0 and 1")
+        self.down = [parse_window(window) for window in spec.get('down', [])]
+        self.nodes = list(spec.get('nodes', DEFAULT_NODES))
+        self.rows = int(spec.get('rows', 5))
+        self.ranges = int(spec.get('ranges', 10))
+        self.epoch = float(spec.get('epoch', time.time()))
+        self.spec = dict(spec, epoch=self.epoch)
+        self.inserted = 0
+        self._lock = threading.Lock()
+
+    def is_down(self, node: str) -> bool:
+        elapsed = time.time() - self.epoch
+        return any(down == node and start <= elapsed < end for down, start, end in self.down)
+
+    def range_rows(self) -> List[tuple]:
+        """
+        SHOW RANGES rows (range_id, lease_holder, replicas): each range has
+        three home nodes and its lease on one of them; replicas and leases
+        on nodes that are down move to the next live nodes.
+        """
+        ids = list(range(1, len(self.nodes) + 1))
+        live = [i for i, node in zip(ids, self.nodes) if not self.is_down(node)]
+        rows = []
+        for r in range(self.ranges):
+            home = [ids[(r + k) % len(ids)] for k in range(min(3, len(ids)))]
+            replicas = [node for node in home if node in live]
+            replicas += [node for node in live if node not in home][:len(home) - len(replicas)]
+            lease = home[r % len(home)]
+            if lease not in live:
+                lease = replicas[0] if replicas else None
+            rows.append((r + 1, lease, sorted(replicas)))
+        return rows
+
+    def add_rows(self, count: int):
+        with self._lock:
+            self.inserted += count
+
+    def connect(self, dsn: str = "", **kwargs) -> "FakeConnection":
+        match = _NODE.search(dsn)
+        node = match.group(1) if match else DEFAULT_NODES[0]
+        if self.is_down(node):
+            raise psycopg2.OperationalError(
+                f'connection to server at "{node}" failed: Connection refused (fake node down)')
+        return FakeConnection(self, node)
+
+
+class FakeConnection:
+    """Enough of psycopg2's connection for the scripts."""
+
+    encoding = 'UTF8'
+
+    def __init__(self, cluster: FakeCluster, node: str):
+        self.cluster = cluster
+        self.node = node
+        self.autocommit = False
+        self.closed = 0
+        self.prepared: Dict[str, str] = {}  # Statement name -> upper-cased body
+        self.rng = random.Random()
+        self._in_txn = False  # Statements ran since the last commit/rollback
+        self._released = False  # RELEASE SAVEPOINT already committed this transaction
+
+    def cursor(self, *args, **kwargs) -> "FakeCursor":
+        self._check()
+        return FakeCursor(self)
+
+    def commit(self):
+        self._check()
+        in_txn, released = self._in_txn, self._released
+        self._in_txn = self._released = False
+        if in_txn and not released:
+            self._commit_point()
+
+    def rollback(self):
+        self._check()
+        self._in_txn = self._released = False
+
+    def close(self):
+        self.closed = 1
+
+    def set_isolation_level(self, level: int):
+        self.autocommit = level == ISOLATION_LEVEL_AUTOCOMMIT
+
+    def set_session(self, autocommit: Optional[bool] = None, **kwargs):
+        if autocommit is not None:
+            self.autocommit = autocommit
+
+    def _check(self):
+        if self.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        if self.cluster.is_down(self.node):
+            self.closed = 2
+            raise psycopg2.OperationalError("server closed the connection unexpectedly "
+                                            "(fake node down)")
+
+    def _wait(self, kind: str):
+        ms = self.cluster.latency[kind](self.rng)
+        if ms > 0:
+            time.sleep(ms / 1000.0)
+
+    def _commit_point(self):
+        """RELEASE SAVEPOINT or COMMIT: commit latency, then maybe a 40001."""
+        self._wait('commit')
+        if self.cluster.retry_rate and self.rng.random() < self.cluster.retry_rate:
+            raise SerializationFailure("restart transaction: TransactionRetryWithProtoRefreshError "
+                                       "(injected by fakedb)")
+
+
+class FakeCursor:
+    """Enough of psycopg2's cursor for the scripts."""
+
+    def __init__(self, conn: FakeConnection):
+        self.connection = conn
+        self.rowcount = -1
+        self.description = None
+        self._rows: List[tuple] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._rows = []
+
+    def mogrify(self, sql, params=None) -> bytes:
+        if isinstance(sql, bytes):
+            sql = sql.decode()
+        if params is not None:
+            sql = sql % tuple(_quote(value) for value in params)
+        return sql.encode()
+
+    def execute(self, sql, params=None):
+        conn = self.connection
+        conn._check()
+        if isinstance(sql, bytes):
+            sql = sql.decode()
+        text = " ".join(sql.split())
+        upper = text.upper()
+        self._rows = []
+        self.rowcount = -1
+        if not conn.autocommit:
+            conn._in_txn = True
+
+        if upper.startswith("PREPARE "):
+            name, _, body = text[len("PREPARE "):].partition(" AS ")
+            conn.prepared[name.strip()] = body.upper()
+            return
+        if upper.startswith("EXECUTE "):
+            name = text[len("EXECUTE "):].split("(")[0].strip()
+            if name not in conn.prepared:
+                raise psycopg2.ProgrammingError(f'prepared statement "{name}" does not exist')
+            upper = conn.prepared[name]
+            kind = _kind(upper)
+        elif upper.startswith("RELEASE SAVEPOINT"):
+            conn._commit_point()
+            conn._released = True
+            return
+        elif upper.startswith(("SAVEPOINT", "ROLLBACK TO", "BEGIN", "SET ", "SHOW ")):
+            conn._released = False
+            return
+        elif upper.startswith("COMMIT"):
+            if not conn.autocommit:
+                conn.commit()
+            return
+        else:
+            kind = _kind(upper)
+
+        conn._wait(kind)
+        if kind == 'insert':
+            # Our inserts write 3 columns per row; execute_values sends the rows inline
+            rows = max(1, len(params) // 3) if params else len(_ROW_SEPARATOR.findall(text)) + 1
+            conn.cluster.add_rows(rows)
+            self.rowcount = rows
+        elif kind == 'select':
+            self._rows = self._select(upper, params)
+            self.rowcount = len(self._rows)
+        elif kind in ('update', 'delete'):
+            self.rowcount = 1
+
+    def _select(self, upper: str, params=None) -> List[tuple]:
+        cluster = self.connection.cluster
+        if "SHOW RANGES" in upper or "CRDB_INTERNAL.RANGES" in upper:
+            return cluster.range_rows()
+        if "GOSSIP_" in upper:
+            live = [node for node in cluster.nodes if not cluster.is_down(node)]
+            return [(len(live),)] if "COUNT(" in upper else [(node,) for node in live]
+        if "COUNT(" in upper:
+            return [(cluster.inserted,)]
+        if "SUM(" in upper:
+            return [(None,)]
+        if "CRDB_INTERNAL" in upper or "PG_" in upper or "INFORMATION_SCHEMA" in upper:
+            return []
+        if "FROM" not in upper:
+            return [(1,)]
+        # Ids 1..rows, honouring "id > x" and "LIMIT n" so keyset paging ends
+        after = _bound(_AFTER_ID.search(upper), params) or 0
+        limit = _bound(_LIMIT.search(upper), params)
+        end = cluster.rows if limit is None else min(cluster.rows, after + limit)
+        now = datetime.now()
+        return [(i + 1, i, 10.5, now) for i in range(after, end)]
+
+    def copy_expert(self, sql, file):
+        self.connection._check()
+        rows = sum(1 for line in file.read().splitlines() if line)
+        self.connection._wait('insert')
+        self.connection.cluster.add_rows(rows)
+        self.rowcount = rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size: int = 1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+
+def _kind(upper: str) -> str:
+    verb = upper.lstrip("( ").split(" ", 1)[0]
+    if verb in ('SELECT', 'WITH'):
+        return 'select'
+    if verb in ('INSERT', 'UPSERT'):
+        return 'insert'
+    if verb in ('UPDATE', 'DELETE'):
+        return verb.lower()
+    if verb in ('CREATE', 'DROP', 'ALTER'):
+        return 'ddl'
+    return 'other'
+
+
+def _bound(match, params) -> Optional[int]:
+    """The integer a _PLACEHOLDER matched: a literal, or the parameter it stands for."""
+    if not match:
+        return None
+    token = match.group(1)
+    if token.isdigit():
+        return int(token)
+    if not params:
+        return None
+    if token == "%S":
+        # Bounds are the statements' last parameters: LIMIT last, "id >" before it
+        index = -1
+        if match.re is _AFTER_ID and _LIMIT.search(match.string):
+            index = -2
+    else:
+        index = int(token[1:]) - 1
+    try:
+        return int(params[index])
+    except (IndexError, TypeError, ValueError):
+        return None
+
+
+def _quote(value) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return "(" + ", ".join(_quote(item) for item in value) + ")"
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def install(spec=None) -> FakeCluster:
+    """
+    Point psycopg2.connect at a FakeCluster built from spec (see the module
+    docstring) and export it in CRDB_FAKE for child processes.
+    """
+    global _installed
+    cluster = FakeCluster(load_spec(spec))
+    os.environ[ENV_VAR] = json.dumps(cluster.spec)
+    psycopg2.connect = cluster.connect
+    _installed = cluster
+    return cluster
+
+
+def uninstall():
+    global _installed
+    psycopg2.connect = _real_connect
+    os.environ.pop(ENV_VAR, None)
+    _installed = None
+
+
+def install_from_env() -> Optional[FakeCluster]:
+    """install() the CRDB_FAKE spec, if set and not installed yet."""
+    if _installed is None and os.environ.get(ENV_VAR) is not None:
+        return install(os.environ[ENV_VAR])
+    return _installed
@@ -2,14 +2,130 @@
 generate_graphs.py
 Creates dual-axis plots for TPS and Latency from test CSVs.
 Updates: specific Y-axis scaling (0 to max + padding).
+Also reads the binary columnar files written by load_test.py --output x.bin.
+
+Long runs: CSVs are read in chunks, keeping only the plotted columns as
+float32, and every series is downsampled with largest-triangle-three-buckets
+(LTTB) to --points points, which keeps spikes that plain decimation drops.
+Several files can be given at once; --overlay draws them on shared,
+aligned time axes (e.g. baseline vs experiment).
+
+Scenario events (load_test.py --scenario, saved next to the export as
+<name>.events.csv) are drawn as vertical markers: a solid line where an
+action started and a dotted one where it finished.
+
+Capacity curves (load_test.py --find-capacity --capacity-output curve.csv)
+are plotted with --capacity: achieved TPS and p99 against offered load, one
+line per --label, so 3-node and 5-node searches can be compared directly.
+
+Usage:
+    python generate_graphs.py run.csv "Baseline"
+    python generate_graphs.py a.csv b.csv c.bin --title "Soak"
+    python generate_graphs.py baseline.csv index.csv --overlay --title "Index build"
+    python generate_graphs.py curve.csv --capacity --title "3 vs 5 nodes"
 """
-import pandas as pd
+import argparse
+import os
+
 import matplotlib.pyplot as plt
-import sys
+import numpy as np
+import pandas as pd
+
+from metrics_export import read_binary_columns
+from scenario import events_path, read_events
+
+PLOT_COLUMNS = ['time_elapsed', 'tps', 'p95_latency', 'p99_latency']
+CHUNK_ROWS = 100_000
+DEFAULT_POINTS = 2000
+
+
+def load_metrics(filename, columns=PLOT_COLUMNS, chunksize=CHUNK_ROWS):
+    """
+    Load interval metrics from a CSV or a binary columnar export.
+
+    Only `columns` are kept; time stays float64 and everything else is
+    float32. CSVs are parsed `chunksize` rows at a time.
+    """
+    dtypes = {col: np.float64 if col == 'time_elapsed' else np.float32 for col in columns}
+    if not filename.lower().endswith('.csv'):
+        data = read_binary_columns(filename)
+        return pd.DataFrame({col: np.asarray(data[col], dtype=dtypes[col]) for col in columns})
+
+    chunks = pd.read_csv(filename, usecols=columns, dtype=dtypes, chunksize=chunksize)
+    df = pd.concat(chunks, ignore_index=True)
+    return df[columns]
+
+
+def lttb(x, y, threshold):
+    """
+    Indices of the points largest-triangle-three-buckets keeps.
 
-def plot_data(filename, title):
+    The first and last points are always kept; in between, each of
+    threshold - 2 buckets contributes the point forming the largest
+    triangle with the previously kept point and the next bucket's average.
+    """
+    n = len(x)
+    if threshold <= 2 or threshold >= n:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a])
+                      - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def _series(df, column, points):
+    """(x, y) of one column, downsampled to `points` (0 = keep everything)."""
+    x = df['time_elapsed'].to_numpy()
+    y = df[column].to_numpy()
+    if points:
+        index = lttb(x, y, points)
+        return x[index], y[index]
+    return x, y
+
+
+def load_events(filename):
+    """Scenario events recorded alongside a metrics file, if any."""
+    path = events_path(filename)
+    return read_events(path) if os.path.exists(path) else []
+
+
+def _draw_events(ax, events, color='dimgray'):
+    """Vertical markers for scenario events, labelled at the top of the axes."""
+    for elapsed, event, detail in events:
+        if detail == 'start':
+            ax.axvline(elapsed, color=color, linestyle='-', linewidth=1, alpha=0.7)
+            ax.text(elapsed, 0.98, f" {event}", transform=ax.get_xaxis_transform(),
+                    rotation=90, va='top', ha='left', fontsize=8, color=color)
+        else:
+            ax.axvline(elapsed, color=color, linestyle=':', linewidth=1, alpha=0.7)
+
+
+def _output_path(filename, suffix=''):
+    return os.path.splitext(filename)[0] + suffix + '.png'
+
+
+def plot_data(filename, title, points=DEFAULT_POINTS):
     try:
-        df = pd.read_csv(filename)
+        df = load_metrics(filename)
     except FileNotFoundError:
         print(f"Error: Could not find {filename}")
         return
@@ -21,7 +137,7 @@ def plot_data(filename, title):
     color = 'tab:blue'
     ax1.set_xlabel('Time (seconds)')
     ax1.set_ylabel('TPS (Transactions/Sec)', color=color, fontweight='bold')
-    ax1.plot(df['time_elapsed'], df['tps'], color=color, linewidth=2, label='TPS')
+    ax1.plot(*_series(df, 'tps', points), color=color, linewidth=2, label='TPS')
     ax1.tick_params(axis='y', labelcolor=color)
     ax1.grid(True, alpha=0.3)
 
@@ -30,13 +146,14 @@ def plot_data(filename, title):
     # If max is 0 (e.g. errors), default to 10 so graph doesn't break
     top_limit = tps_max + 10 if tps_max > 0 else 10
     ax1.set_ylim(bottom=0, top=top_limit)
+    _draw_events(ax1, load_events(filename))
 
     # --- RIGHT Y-AXIS (Latency) ---
     ax2 = ax1.twinx()
     color = 'tab:red'
     ax2.set_ylabel('Latency (ms)', color=color, fontweight='bold')
-    ax2.plot(df['time_elapsed'], df['p99_latency'], color=color, linestyle='--', label='p99 Latency')
-    ax2.plot(df['time_elapsed'], df['p95_latency'], color='orange', linestyle=':', label='p95 Latency')
+    ax2.plot(*_series(df, 'p99_latency', points), color=color, linestyle='--', label='p99 Latency')
+    ax2.plot(*_series(df, 'p95_latency', points), color='orange', linestyle=':', label='p95 Latency')
     ax2.tick_params(axis='y', labelcolor=color)
 
     # FIX 2: Set Latency Axis from 0 to Max + 20% buffer (keeps spikes visible but grounded)
@@ -47,20 +164,146 @@ def plot_data(filename, title):
 
     # --- TITLE & SAVING ---
     plt.title(f"CockroachDB System Study: {title}", fontsize=14, pad=20)
-    
+
     # Combined Legend
     lines1, labels1 = ax1.get_legend_handles_labels()
     lines2, labels2 = ax2.get_legend_handles_labels()
     ax1.legend(lines1 + lines2, labels1 + labels2, loc="upper center", bbox_to_anchor=(0.5, -0.15), ncol=3)
 
     fig.tight_layout()
-    
-    output_file = filename.replace('.csv', '.png')
+
+    output_file = _output_path(filename)
     plt.savefig(output_file, dpi=300, bbox_inches='tight')
+    plt.close(fig)
     print(f"Graph saved to {output_file} (Y-axis fixed to start at 0)")
 
-if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: python generate_graphs.py <file.csv> <Title String>")
+
+def plot_overlay(filenames, title, labels=None, points=DEFAULT_POINTS, output_file=None):
+    """
+    Overlay several runs: TPS on top, p99 latency below, sharing one time axis.
+
+    Each run's time_elapsed starts at its own test start, so runs line up
+    at t=0 regardless of when they were recorded.
+    """
+    labels = labels or [os.path.splitext(os.path.basename(f))[0] for f in filenames]
+    fig, (ax_tps, ax_lat) = plt.subplots(2, 1, figsize=(12, 8), sharex=True)
+
+    tps_max = lat_max = 0.0
+    for filename, label in zip(filenames, labels):
+        try:
+            df = load_metrics(filename)
+        except FileNotFoundError:
+            print(f"Error: Could not find {filename}")
+            continue
+        line, = ax_tps.plot(*_series(df, 'tps', points), linewidth=1.5, label=label)
+        ax_lat.plot(*_series(df, 'p99_latency', points), color=line.get_color(),
+                    linewidth=1.5, label=f"{label} p99")
+        for ax in (ax_tps, ax_lat):
+            _draw_events(ax, load_events(filename), color=line.get_color())
+        tps_max = max(tps_max, df['tps'].max())
+        lat_max = max(lat_max, df['p99_latency'].max())
+
+    ax_tps.set_ylabel('TPS (Transactions/Sec)', fontweight='bold')
+    ax_tps.set_ylim(bottom=0, top=tps_max + 10 if tps_max > 0 else 10)
+    ax_tps.grid(True, alpha=0.3)
+    ax_tps.legend(loc="upper right")
+    ax_tps.set_title(f"CockroachDB System Study: {title}", fontsize=14, pad=20)
+
+    ax_lat.set_xlabel('Time (seconds)')
+    ax_lat.set_ylabel('p99 Latency (ms)', fontweight='bold')
+    ax_lat.set_ylim(bottom=0, top=lat_max * 1.2 if lat_max > 0 else 100)
+    ax_lat.grid(True, alpha=0.3)
+    ax_lat.legend(loc="upper right")
+
+    fig.tight_layout()
+    output_file = output_file or _output_path(filenames[0], '_overlay')
+    plt.savefig(output_file, dpi=300, bbox_inches='tight')
+    plt.close(fig)
+    print(f"Overlay of {len(filenames)} run(s) saved to {output_file}")
+
+
+def plot_capacity(filename, title, output_file=None):
+    """Achieved TPS (top) and p99 (bottom) vs offered load, one line per label."""
+    try:
+        df = pd.read_csv(filename, keep_default_na=False)
+    except FileNotFoundError:
+        print(f"Error: Could not find {filename}")
+        return
+
+    fig, (ax_tps, ax_lat) = plt.subplots(2, 1, figsize=(10, 8), sharex=True)
+    for label, curve in df.groupby('label', sort=False):
+        curve = curve.sort_values('offered')
+        name = label or os.path.splitext(os.path.basename(filename))[0]
+        line, = ax_tps.plot(curve['offered'], curve['tps'], marker='o', linewidth=1.5, label=name)
+        ax_lat.plot(curve['offered'], curve['p99_latency'], marker='o', linewidth=1.5,
+                    color=line.get_color(), label=f"{name} p99")
+        # Hollow markers for the steps that broke the SLO
+        failed = curve[curve['passed'] == 0]
+        for ax, column in ((ax_tps, 'tps'), (ax_lat, 'p99_latency')):
+            ax.scatter(failed['offered'], failed[column], s=80, facecolors='white',
+                       edgecolors=line.get_color(), zorder=3)
+
+    ax_tps.set_ylabel('Achieved TPS', fontweight='bold')
+    ax_tps.set_ylim(bottom=0)
+    ax_tps.grid(True, alpha=0.3)
+    ax_tps.legend(loc="upper left")
+    ax_tps.set_title(f"CockroachDB System Study: {title}", fontsize=14, pad=20)
+
+    ax_lat.set_xlabel(f"Offered load ({df['knob'].iloc[0] if len(df) else 'connections'})")
+    ax_lat.set_ylabel('p99 Latency (ms)', fontweight='bold')
+    ax_lat.set_ylim(bottom=0)
+    ax_lat.grid(True, alpha=0.3)
+    ax_lat.legend(loc="upper left")
+
+    fig.tight_layout()
+    output_file = output_file or _output_path(filename)
+    plt.savefig(output_file, dpi=300, bbox_inches='tight')
+    plt.close(fig)
+    print(f"Capacity curve saved to {output_file}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Plot TPS and p95/p99 latency from load_test.py exports.",
+        epilog='Example: python generate_graphs.py baseline.csv index.csv --overlay '
+               '--title "Online index"',
+    )
+    parser.add_argument("files", nargs="+", metavar="FILE",
+                        help="CSV or binary exports; a trailing argument that is not a "
+                             "file is taken as the title (old usage)")
+    parser.add_argument("--title", default=None, help="Plot title")
+    parser.add_argument("--overlay", action="store_true",
+                        help="Draw all files in one figure on aligned time axes")
+    parser.add_argument("--capacity", action="store_true",
+                        help="FILE is a load_test.py --capacity-output curve")
+    parser.add_argument("--labels", default=None,
+                        help="Comma-separated legend labels for --overlay (default: file names)")
+    parser.add_argument("--points", type=int, default=DEFAULT_POINTS,
+                        help=f"LTTB target points per series, 0 plots every row "
+                             f"(default: {DEFAULT_POINTS})")
+    parser.add_argument("--output", default=None,
+                        help="Output PNG for --overlay or --capacity "
+                             "(default: <first file>_overlay.png / <file>.png)")
+    args = parser.parse_args()
+
+    files = args.files
+    title = args.title
+    if title is None and len(files) > 1 and not os.path.exists(files[-1]):
+        files, title = files[:-1], files[-1]
+    title = title or "Load Test"
+
+    if args.capacity:
+        for filename in files:
+            plot_capacity(filename, title, output_file=args.output if len(files) == 1 else None)
+    elif args.overlay:
+        labels = args.labels.split(",") if args.labels else None
+        if labels and len(labels) != len(files):
+            parser.error("--labels needs one label per file")
+        plot_overlay(files, title, labels=labels, points=args.points, output_file=args.output)
     else:
-        plot_data(sys.argv[1], sys.argv[2])
\ No newline at end of file
+        for filename in files:
+            plot_data(filename, title, points=args.points)
+
+
+if __name__ == "__main__":
+    main()
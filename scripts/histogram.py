@@ -0,0 +1,210 @@
+"""
+Constant-memory latency histogram for the load testing scripts.
+
+HDR-style log-bucketed layout: values (integer microseconds) fall into
+power-of-two buckets, each split linearly into sub-buckets, so every
+recorded value is kept to a fixed number of significant digits. Counts
+live in one preallocated array, which makes recording O(1), memory
+independent of sample count, and merging two histograms a lossless
+element-wise add.
+"""
+import math
+from array import array
+from itertools import compress
+from typing import Dict, Iterable, List
+
+DEFAULT_HIGHEST_US = 60_000_000  # 60 seconds
+DEFAULT_SIGNIFICANT_FIGURES = 3
+
+
+class LatencyHistogram:
+    def __init__(self, highest_us: int = DEFAULT_HIGHEST_US,
+                 significant_figures: int = DEFAULT_SIGNIFICANT_FIGURES):
+        """
+        Initialize an empty histogram.
+
+        Args:
+            highest_us: Largest trackable latency in microseconds; larger
+                values are clamped into the top bucket (max stays exact)
+            significant_figures: Precision kept for every value (1-5)
+        """
+        if not 1 <= significant_figures <= 5:
+            raise ValueError("significant_figures must be between 1 and 5")
+        if highest_us < 2:
+            raise ValueError("highest_us must be at least 2")
+
+        self.highest_us = highest_us
+        self.significant_figures = significant_figures
+
+        # Enough linear sub-buckets to resolve 10^figures distinct values
+        self._sub_bucket_bits = math.ceil(math.log2(2 * 10 ** significant_figures))
+        self._sub_bucket_count = 1 << self._sub_bucket_bits
+        self._half_count = self._sub_bucket_count // 2
+        top_bucket = max(highest_us.bit_length() - self._sub_bucket_bits, 0)
+        self._counts = array('q', bytes(8 * (top_bucket + 2) * self._half_count))
+
+        self.count = 0
+        self.total_us = 0
+        self.min_us = 0
+        self.max_us = 0
+
+    # --- Recording -------------------------------------------------------
+
+    def _index(self, value: int) -> int:
+        bucket = max(value.bit_length() - self._sub_bucket_bits, 0)
+        return bucket * self._half_count + (value >> bucket)
+
+    def _value_at(self, index: int) -> int:
+        """Highest value that maps to the given counts index."""
+        if index < self._sub_bucket_count:
+            return index
+        bucket = index // self._half_count - 1
+        sub_bucket = index - bucket * self._half_count
+        return ((sub_bucket + 1) << bucket) - 1
+
+    def record_us(self, value: int, count: int = 1):
+        """Record a latency in whole microseconds."""
+        if value < 0:
+            value = 0
+        clamped = value if value <= self.highest_us else self.highest_us
+        self._counts[self._index(clamped)] += count
+
+        if self.count == 0 or value < self.min_us:
+            self.min_us = value
+        if value > self.max_us:
+            self.max_us = value
+        self.count += count
+        self.total_us += value * count
+
+    def record(self, latency_ms: float):
+        """Record a latency in milliseconds (the unit the scripts report in)."""
+        self.record_us(int(latency_ms * 1000))
+
+    # --- Combining -------------------------------------------------------
+
+    def _check_compatible(self, other: "LatencyHistogram"):
+        if (other.highest_us, other.significant_figures) != (self.highest_us, self.significant_figures):
+            raise ValueError("Cannot merge histograms with different ranges or precision")
+
+    def merge(self, other: "LatencyHistogram"):
+        """Add another histogram's samples into this one (lossless)."""
+        self._check_compatible(other)
+        if other.count == 0:
+            return
+        counts = self._counts
+        for index, count in other.nonzero():
+            counts[index] += count
+
+        if self.count == 0 or other.min_us < self.min_us:
+            self.min_us = other.min_us
+        if other.max_us > self.max_us:
+            self.max_us = other.max_us
+        self.count += other.count
+        self.total_us += other.total_us
+
+    def copy(self) -> "LatencyHistogram":
+        clone = LatencyHistogram(self.highest_us, self.significant_figures)
+        clone.merge(self)
+        return clone
+
+    def reset(self):
+        """Clear all samples, keeping the allocated counts array."""
+        span = self._span()
+        if span:
+            self._counts[span.start:span.stop] = array('q', bytes(8 * len(span)))
+        self.count = 0
+        self.total_us = 0
+        self.min_us = 0
+        self.max_us = 0
+
+    def _span(self) -> range:
+        """Indexes that can be populated: the buckets of min_us through max_us."""
+        if self.count == 0:
+            return range(0)
+        return range(self._index(min(self.min_us, self.highest_us)),
+                      self._index(min(self.max_us, self.highest_us)) + 1)
+
+    def nonzero(self) -> List[tuple]:
+        """(index, count) for every populated bucket, in value order."""
+        # Only the touched span is scanned, not all ~17k buckets
+        counts = self._counts
+        span = self._span()
+        return [(i, counts[i]) for i in compress(span, counts[span.start:span.stop])]
+
+    # --- Queries ---------------------------------------------------------
+
+    def percentiles_us(self, percentiles: Iterable[float]) -> Dict[float, int]:
+        """
+        Value at each requested percentile, in microseconds, in one pass.
+
+        Reported values are the top of the matching bucket (never an
+        under-estimate), capped at the exact recorded max.
+        """
+        wanted = sorted(percentiles)
+        result = {p: 0 for p in wanted}
+        if self.count == 0:
+            return result
+
+        targets = [(p, max(1, math.ceil(p / 100.0 * self.count))) for p in wanted]
+        position = 0
+        seen = 0
+        for index, count in self.nonzero():
+            seen += count
+            while position < len(targets) and seen >= targets[position][1]:
+                result[targets[position][0]] = min(self._value_at(index), self.max_us)
+                position += 1
+            if position == len(targets):
+                break
+        return result
+
+    def percentiles(self, percentiles: Iterable[float]) -> Dict[float, float]:
+        """Same as percentiles_us, in milliseconds."""
+        return {p: v / 1000.0 for p, v in self.percentiles_us(percentiles).items()}
+
+    def mean(self) -> float:
+        """Mean latency in milliseconds."""
+        return self.total_us / self.count / 1000.0 if self.count else 0.0
+
+    # --- Serialization ---------------------------------------------------
+
+    def to_dict(self) -> dict:
+        """JSON-friendly form (sparse buckets); the inverse of from_dict."""
+        return {
+            'highest_us': self.highest_us,
+            'significant_figures': self.significant_figures,
+            'count': self.count,
+            'total_us': self.total_us,
+            'min_us': self.min_us,
+            'max_us': self.max_us,
+            'buckets': [[index, count] for index, count in self.nonzero()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LatencyHistogram":
+        hist = cls(data['highest_us'], data['significant_figures'])
+        for index, count in data['buckets']:
+            hist._counts[index] = count
+        hist.count = data['count']
+        hist.total_us = data['total_us']
+        hist.min_us = data['min_us']
+        hist.max_us = data['max_us']
+        return hist
+
+    def value_at(self, index: int) -> int:
+        """Reported value (bucket top, microseconds) of a nonzero() index."""
+        return self._value_at(index)
+
+    def __getstate__(self) -> dict:
+        # Pickle sparsely: a worker's interval histogram usually populates
+        # a few hundred of its ~17k buckets, and these cross process queues.
+        state = dict(self.__dict__)
+        state['_counts'] = list(self.nonzero())
+        return state
+
+    def __setstate__(self, state: dict):
+        sparse = state.pop('_counts')
+        self.__dict__.update(state)
+        top_bucket = max(self.highest_us.bit_length() - self._sub_bucket_bits, 0)
+        self._counts = array('q', bytes(8 * (top_bucket + 2) * self._half_count))
+        for index, count in sparse:
+            self._counts[index] = count
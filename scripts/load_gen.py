@@ -1,98 +1,114 @@
 import psycopg2
 import time
 import random
-import statistics
-import uuid
+from functools import partial
+
+from dashboard import Aggregator
+from histogram import LatencyHistogram
+from prepared import StatementCache
+from retry import RetryPolicy, RetryStats, run_in_transaction
+from setup_database import create_schema
 
 # --- CONFIGURATION ---
 DSN = "postgresql://root@localhost:26257/study_db?sslmode=disable"
 PRINT_WINDOW = 10  # Print stats every 10 seconds
 
+SCHEMA = "uuid"  # Used only if setup_database.py hasn't created the table yet
+USERS = 100
+
+INSERT_SQL = "INSERT INTO transactions (user_id, amount, description) VALUES (%s, %s, %s)"
+READ_SQL = "SELECT * FROM transactions ORDER BY created_at DESC LIMIT 5"
+
 def setup_schema(conn):
-    """Creates the table if it doesn't exist."""
+    """Creates the table if it doesn't exist (same columns as setup_database.py)."""
     with conn.cursor() as cur:
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-                value INT,
-                created_at TIMESTAMP DEFAULT now()
-            );
-        """)
+        create_schema(cur, SCHEMA, if_not_exists=True)
         # Create an index to test the "Online Indexing" experiment later
         # (We will add a secondary index manually during that experiment, 
         # so for now, we just stick to the base table).
     conn.commit()
     print("✅ Schema initialized.")
 
+def transaction_body(conn, statements):
+    """The Transaction: Insert 1 row, Read 5 rows (re-run on retry)."""
+    with conn.cursor() as cur:
+        # INSERT
+        val = random.randint(0, 1000)
+        statements.execute(cur, INSERT_SQL, (random.randrange(USERS), val, "load_gen"))
+
+        # READ (simulating a read-heavy workload)
+        return statements.execute(cur, READ_SQL).fetchall()
+
+def report_window(latencies, retry_stats, duration):
+    """Aggregator job: percentiles and the stats line for one finished window."""
+    tps = latencies.count / duration
+
+    # Percentiles
+    pct = latencies.percentiles((50, 95, 99))
+    p50, p95, p99 = pct[50], pct[95], pct[99]
+
+    print(f"[{time.strftime('%H:%M:%S')}] "
+          f"TPS: {tps:.2f} | "
+          f"Latencies (ms) -> P50: {p50:.2f}, P95: {p95:.2f}, P99: {p99:.2f} | "
+          f"Retries: {retry_stats.retries} ({retry_stats.retry_cost_ms:.0f} ms) | "
+          f"Aborts: {retry_stats.format_aborts()}")
+
 def run_load():
     """Runs the transaction loop and prints metrics."""
     conn = psycopg2.connect(DSN)
     setup_schema(conn)
+
+    # Parse and plan both statements once; the loop runs them by name
+    statements = StatementCache(conn)
+    statements.prepare_all([INSERT_SQL, READ_SQL])
+    body = partial(transaction_body, statements=statements)
     
     print(f"🚀 Load generator started. Printing stats every {PRINT_WINDOW} seconds...")
     print("Press CTRL+C to stop.")
 
-    latencies = []
+    latencies = LatencyHistogram()
+    retry_policy = RetryPolicy()
+    retry_stats = RetryStats()
     start_window = time.time()
+    # Reporting runs on its own thread; the loop only hands finished windows over
+    aggregator = Aggregator()
     
     try:
         while True:
             # 1. Start Timer
             t0 = time.time()
 
-            # 2. The Transaction: Insert 1 row, Read 5 rows
+            # 2. The Transaction, retried in place on serialization failures
             try:
-                with conn.cursor() as cur:
-                    # INSERT
-                    val = random.randint(0, 1000)
-                    cur.execute("INSERT INTO transactions (value) VALUES (%s)", (val,))
-                    
-                    # READ (simulating a read-heavy workload)
-                    cur.execute("SELECT * FROM transactions ORDER BY created_at DESC LIMIT 5")
-                    rows = cur.fetchall()
-                
-                conn.commit()
-                
+                run_in_transaction(conn, body, retry_policy, retry_stats)
+
                 # 3. Stop Timer & Record Latency (ms)
-                latencies.append((time.time() - t0) * 1000)
+                latencies.record((time.time() - t0) * 1000)
 
             except psycopg2.OperationalError as e:
-                # Handle retries for serialization failures (common in CRDB)
-                conn.rollback()
-                continue
+                # Retry budget spent (40001) or connection trouble: count it, keep going
+                retry_stats.record_abort(e)
             except Exception as e:
+                retry_stats.record_abort(e)
                 print(f"Error: {e}")
-                conn.rollback()
                 time.sleep(1)
 
             # 4. Reporting Window
             now = time.time()
             if now - start_window >= PRINT_WINDOW:
-                if not latencies:
+                if not latencies.count:
                     continue
 
-                # Calculate Metrics
-                count = len(latencies)
-                duration = now - start_window
-                tps = count / duration
-                
-                # Percentiles
-                latencies.sort()
-                p50 = latencies[int(count * 0.50)]
-                p95 = latencies[int(count * 0.95)]
-                p99 = latencies[int(count * 0.99)]
-
-                print(f"[{time.strftime('%H:%M:%S')}] "
-                      f"TPS: {tps:.2f} | "
-                      f"Latencies (ms) -> P50: {p50:.2f}, P95: {p95:.2f}, P99: {p99:.2f}")
-
-                # Reset for next window
-                latencies = []
-                start_window = time.time()
+                # Hand the window over and start a fresh one
+                aggregator.submit(report_window, latencies, retry_stats, now - start_window)
+                latencies = LatencyHistogram()
+                retry_stats = RetryStats()
+                start_window = now
 
     except KeyboardInterrupt:
         print("\n🛑 Load generator stopped.")
     finally:
+        aggregator.close()
         conn.close()
 
 if __name__ == "__main__":
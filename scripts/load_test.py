@@ -2,219 +2,1965 @@
 Load testing script for CockroachDB cluster study.
 Runs continuous transactions and collects performance metrics.
 """
+import argparse
+import asyncio
+import math
+import multiprocessing
+import os
 import psycopg2
+import queue
+import signal
+import threading
 import time
-import statistics
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List
+from functools import partial
+from typing import Dict, List, Optional
 
-DSN_APP = "postgresql://root@localhost:26257/study_db?sslmode=disable"
+from bundle import BUNDLE_INTERVAL, ResultBundle, probe_cluster
+from capacity import append_curve, find_capacity, parse_latency_ms, print_curve
+from check_cluster import COLLECT_COLUMNS, ClusterCollector
+from cluster import (DEFAULT_NODES, GatewayPool, NoGatewayError, discover_nodes, dsn_for,
+                     gateway_cpu_seconds, is_connection_error, parse_nodes)
+import fakedb
+from dashboard import DASHBOARD_REFRESH, Aggregator, Dashboard
+from histogram import LatencyHistogram
+from metrics_export import IntervalWriter, open_interval_writer
+from prepared import StatementCache
+from profiler import PROFILE_INTERVAL, SamplingProfiler
+from ranges import RangeTracker, ranges_path
+from retry import RetryPolicy, RetryStats, run_in_transaction
+from scans import SCAN_BY, SCAN_METHODS, ScanStats, peak_rss_mb
+from scenario import ACTIONS, EventLog, ScenarioRunner, events_path, load_actions, read_scenario
+from setup_database import USER_INDEX_SCHEMAS, has_user_index, parse_schemas, setup_database
+from txlog import TXLOG_MAX_MB, TxLogWriter, TxRecorder, txlog_phases
+from workloads import (DEFAULTS as WORKLOAD_DEFAULTS, READ_MODES, READ_OPS, Workload, describe,
+                       list_workloads, load_workload)
+
+FLUSH_INTERVAL = 1.0  # Seconds between worker -> parent sample handoffs
+SAMPLE_LAG = 0.25  # Seconds an interval stays open after its end for samples still in flight
+PERCENTILES = (50, 95, 99, 99.9)
+PHASE_PERCENTILES = (50, 95, 99)
 
 class LoadTester:
-    def __init__(self, report_interval=10):
+    def __init__(self, report_interval=10, worker_id=0, significant_figures=3,
+                 exporter: Optional[IntervalWriter] = None, export_interval=None,
+                 retry_policy: Optional[RetryPolicy] = None, workload: Optional[dict] = None,
+                 prepare: bool = True, event_log: Optional[EventLog] = None,
+                 phase_timing: bool = True, quiet: bool = False,
+                 bundle: Optional[ResultBundle] = None,
+                 txlog: Optional[TxLogWriter] = None, txlog_layout: Optional[dict] = None,
+                 flush_epoch: Optional[float] = None):
         """
         Initialize load tester.
 
         Args:
             report_interval: Seconds between metric reports
+            worker_id: Offsets the generated user_ids so concurrent workers
+                don't all hit the same user in lockstep
+            significant_figures: Precision of the latency histograms
+            exporter: Optional writer that receives one row per export interval
+            export_interval: Seconds per exported row (default: report_interval);
+                may be sub-second
+            retry_policy: Client-side retry budget and backoff for 40001 errors
+            workload: Workload spec from workloads.load_workload (default: 'default')
+            prepare: Run workload statements as server-side prepared statements
+            event_log: Optional sidecar file that receives scenario events
+            phase_timing: Time every statement and the commit separately
+                (perf_counter_ns spans into per-phase histograms)
+            quiet: Don't print transaction errors; pass the latest one on
+                with each sample instead (for the live dashboard)
+            bundle: Optional result bundle that receives every export
+                interval, with its histogram (works without an exporter)
+            txlog: Optional per-transaction log the workers' records are
+                appended to (parent side)
+            txlog_layout: Record one entry per transaction for a txlog with
+                this TxLogWriter.layout() (worker side)
+            flush_epoch: Start of the grid of flush times samples are taken
+                on (worker side; the parent's run start)
         """
         self.report_interval = report_interval
-        self.latencies: List[float] = []
+        self.worker_id = worker_id
+        self.significant_figures = significant_figures
+        self.latencies = self._new_histogram()  # Current interval
+        self.total_latencies = self._new_histogram()  # Whole run
         self.transaction_count = 0
         self.error_count = 0
+        self.row_latencies = self._new_histogram()  # Current interval, per inserted row
+        self.total_row_latencies = self._new_histogram()
+        self.row_count = 0  # Rows inserted by successful transactions
+        self.last_rows = 0  # Rows the last run_transaction() inserted
+        self.scan_stats = ScanStats(significant_figures)  # Current interval, bigscans
+        self.total_scan_stats = ScanStats(significant_figures)
+        self.last_scans: List[tuple] = []  # bigscan results of the last run_transaction()
+        self.last_start_ns = self.last_end_ns = 0  # Wall clock of the last run_transaction()
+        self.last_retries = 0  # Retries the last run_transaction() took
+        self.peak_rss: Dict[int, float] = {}  # Peak RSS (MB) by client process id
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retry_stats = RetryStats()  # Current interval
+        self.total_retry_stats = RetryStats()
+        self.last_error: Optional[Exception] = None
+        self.quiet = quiet
+        self._error_text: Optional[str] = None  # Latest error not yet sampled (quiet)
+        self.workload_spec = workload or load_workload('default')
+        self.workload = Workload(self.workload_spec, worker_id)
+        self.prepare = prepare
+        self._statements: Optional[StatementCache] = None
+
+        # Per-phase breakdown: one histogram per statement name plus 'commit'
+        self.phase_timing = phase_timing
+        self.phase_latencies: Dict[str, LatencyHistogram] = {}  # Current interval
+        self.total_phase_latencies: Dict[str, LatencyHistogram] = {}
+        self.span_overhead_ns = 0.0  # Measured cost of one span, see measure_span_overhead
+
+        # Per-gateway breakdown; a worker only ever fills its current gateway
+        self._gateway: Optional[str] = None  # See gateway
+        self.gateway_latencies: Dict[str, LatencyHistogram] = {}  # Current interval
+        self.gateway_errors: Dict[str, int] = {}  # Current interval
+        self.total_gateway_latencies: Dict[str, LatencyHistogram] = {}
         self.start_time = time.time()
-        self.last_report_time = time.time()
+        self.measure_start = self.start_time  # Totals cover time since here (after warmup)
+        self._warmup_end: Optional[float] = None  # Set by run() while warming up
+        self._held_totals: List[dict] = []  # Samples from after the warmup, until it ends
+        self.total_elapsed = 0.0  # Measured seconds, set by run()
+        self.last_report_time = time.time()  # Start of the current report interval
+        self._sampled_transactions = 0
+        self._sampled_errors = 0
+        self._sampled_rows = 0
+        self._sample_start = time.time()  # Start of the window the next sample covers
+        self._merged_until = self.start_time  # End of the latest window merged into the totals
+        self.flush_epoch = flush_epoch
+        self.interval_rows = 0  # Rows credited to the current report interval
+
+        # Samples are credited to intervals by their window (see merge_sample);
+        # ones from past the end of the current interval wait until it rotates
+        self._report_end = float('inf')  # Set by run()
+        self._report_until = 0.0  # End of the latest window credited to this interval
+        self._held_report: List[dict] = []
+
+        self.exporter = exporter
+        self.bundle = bundle
+        self.export_interval = export_interval or report_interval
+        self.export_latencies = self._new_histogram()
+        self.export_row_latencies = self._new_histogram()
+        self.export_retry_stats = RetryStats()
+        self.export_scan_stats = ScanStats(significant_figures)
+        self.last_export_time = self.start_time
+        self.export_errors = 0
+        self.export_rows = 0
+        self._export_end = float('inf')
+        self._export_until = 0.0
+        self._held_export: List[dict] = []
+
+        self.event_log = event_log
+        self.events: List[tuple] = []  # (seconds into the run, event, detail)
+        self.cluster_rows: List[dict] = []  # Latest ClusterCollector poll
+        self._dashboard: Optional[Dashboard] = None  # Set by run() while live
+        self.profiler: Optional[SamplingProfiler] = None  # Set by run()
+        self.txlog = txlog
+        self.txlog_recorder = TxRecorder(worker_id=worker_id, **txlog_layout) if txlog_layout else None
+        self._txlog_record = self.txlog_recorder.record if self.txlog_recorder else None
+        self._timer = self._record_phase
+        if self.txlog_recorder:
+            # Phases go straight into the recorder's columns, without a call into it
+            self._txlog_slots = self.txlog_recorder.slots
+            self._txlog_phase_us = self.txlog_recorder.phase_us
+            self._timer = self._record_logged_phase
+
+    @property
+    def gateway(self) -> Optional[str]:
+        """Node this tester's connection goes to (None: a single DSN, or not connected)."""
+        return self._gateway
+
+    @gateway.setter
+    def gateway(self, node: Optional[str]):
+        self._gateway = node
+        if self.txlog_recorder is not None:
+            self.txlog_recorder.set_gateway(node)
+
+    def _new_histogram(self) -> LatencyHistogram:
+        return LatencyHistogram(significant_figures=self.significant_figures)
+
+    def worker_settings(self) -> dict:
+        """Constructor arguments every worker's LoadTester must share with this one."""
+        return {
+            'significant_figures': self.significant_figures,
+            'retry_policy': self.retry_policy,
+            'workload': self.workload_spec,
+            'prepare': self.prepare,
+            'phase_timing': self.phase_timing,
+            'quiet': self.quiet,
+            'txlog_layout': self.txlog.layout() if self.txlog else None,
+            'flush_epoch': self.start_time,
+        }
+
+    def next_flush(self, now: float, flush_interval: float) -> float:
+        """
+        The first flush time after `now` on the flush grid. Workers all hand
+        off on the same grid, so each sample covers one grid cell and lands
+        in one interval instead of straddling two.
+        """
+        epoch = self.flush_epoch or self.start_time
+        return epoch + (math.floor((now - epoch) / flush_interval) + 1) * flush_interval
 
     def run_transaction(self, conn) -> float:
         """
         Execute a single transaction and return its latency.
 
-        Transaction includes:
+        The statements come from the configured workload; the default one:
         - Insert a new row
         - Read a few rows
         - Commit
 
+        Serialization failures (40001) are retried in place using the
+        cockroach_restart savepoint; the returned latency includes any
+        retries. Reads the workload runs outside the transaction
+        (follower, bounded-staleness or separate strong reads) follow
+        the commit and count towards the latency. Only transactions that finally fail count as errors.
+        The number of rows a successful transaction inserted is left in
+        last_rows, the results of its bigscans in last_scans.
+
         Returns:
             Latency in milliseconds
         """
-        start = time.time()
+        start = self.last_start_ns = time.time_ns()
+        self.last_error = None
+        self.last_rows = 0
+        self.last_scans = []
+        retries = self.retry_stats.retries
+        n = self.transaction_count
+        ops = self.workload.next_transaction(n)
 
+        timer = self._timer if self.phase_timing else None
+        writes, reads = self.workload.split_reads(ops)
+        scans = []
         try:
-            with conn.cursor() as cur:
-                # Insert a new transaction
-                user_id = self.transaction_count % 100
-                amount = round((self.transaction_count % 1000) * 0.99, 2)
-
-                cur.execute("""
-                    INSERT INTO transactions (user_id, amount, description)
-                    VALUES (%s, %s, %s);
-                """, (user_id, amount, f"Load test transaction {self.transaction_count}"))
-
-                # Read some recent transactions
-                cur.execute("""
-                    SELECT id, user_id, amount, created_at
-                    FROM transactions
-                    WHERE user_id = %s
-                    ORDER BY created_at DESC
-                    LIMIT 5;
-                """, (user_id,))
-
-                rows = cur.fetchall()
-
-            conn.commit()
-            latency = (time.time() - start) * 1000  # Convert to ms
+            statements = self._statement_cache(conn) if self.prepare else None
+            if writes:
+                body = partial(self.workload.execute, ops=writes, n=n, statements=statements,
+                               timer=timer)
+                run_in_transaction(conn, body, self.retry_policy, self.retry_stats, timer)
+                scans = self.workload.last_scans
+            if reads:
+                self.workload.execute_reads(conn, reads, n, statements, timer)
+            end = self.last_end_ns = time.time_ns()
+            latency = (end - start) / 1e6  # Convert to ms
+            self.last_retries = max(0, self.retry_stats.retries - retries)
+            self.last_rows = self.workload.rows_written(ops)
+            self.last_scans = scans
             return latency
 
         except Exception as e:
-            conn.rollback()
+            self.last_end_ns = time.time_ns()
+            self.last_retries = max(0, self.retry_stats.retries - retries)
+            self.last_error = e
             self.error_count += 1
-            print(f"\n✗ Transaction error: {e}")
+            self.retry_stats.record_abort(e)
+            if self.quiet:
+                self._error_text = str(e)
+            else:
+                print(f"\n✗ Transaction error: {e}")
             return -1
 
-    def calculate_metrics(self) -> dict:
-        """Calculate current performance metrics."""
-        if not self.latencies:
-            return {}
+    def _record_phase(self, phase: str, ns: int):
+        """Timer callback: one statement or commit took `ns` nanoseconds."""
+        hist = self.phase_latencies.get(phase)
+        if hist is None:
+            hist = self.phase_latencies[phase] = self._new_histogram()
+        hist.record_us(ns // 1000)
+
+    def _record_logged_phase(self, phase: str, ns: int):
+        """_record_phase that also adds the span to the phase's txlog column."""
+        us = ns // 1000
+        hist = self.phase_latencies.get(phase)
+        if hist is None:
+            hist = self.phase_latencies[phase] = self._new_histogram()
+        hist.record_us(us)
+        self._txlog_phase_us[self._txlog_slots[phase]] += us
+
+    def measure_span_overhead(self, iterations: int = 20_000) -> float:
+        """
+        Nanoseconds one phase span adds: the two perf_counter_ns calls plus
+        the histogram record, net of the bare loop. Measured on a scratch
+        tester so this one's histograms stay clean.
+        """
+        probe = LoadTester(significant_figures=self.significant_figures,
+                           workload=self.workload_spec)
+        record = probe._record_phase
+        clock = time.perf_counter_ns
+
+        start = clock()
+        for _ in range(iterations):
+            pass
+        empty = clock() - start
+
+        start = clock()
+        for _ in range(iterations):
+            t = clock()
+            record('probe', clock() - t)
+        timed = clock() - start
+
+        self.span_overhead_ns = max(0.0, (timed - empty) / iterations)
+        return self.span_overhead_ns
+
+    def _statement_cache(self, conn) -> StatementCache:
+        """This connection's prepared statements, prepared on first use."""
+        if self._statements is None or self._statements.conn is not conn:
+            cache = StatementCache(conn)
+            cache.prepare_all(self.workload.statements.values())
+            self._statements = cache
+        return self._statements
 
-        elapsed = time.time() - self.last_report_time
-        total_elapsed = time.time() - self.start_time
+    def record_result(self, latency: float):
+        """Record one finished transaction (latency < 0 means it failed)."""
+        gateway = self._gateway
+        if latency > 0:
+            latency_us = int(latency * 1000)  # Converted once for the histograms and the txlog
+            self.latencies.record_us(latency_us)
+            if self.last_rows:
+                self.row_latencies.record(latency / self.last_rows)
+                self.row_count += self.last_rows
+            for scan in self.last_scans:
+                self.scan_stats.record(*scan)
+            if gateway:
+                hist = self.gateway_latencies.get(gateway)
+                if hist is None:
+                    hist = self.gateway_latencies[gateway] = self._new_histogram()
+                hist.record_us(latency_us)
+            record = self._txlog_record
+            if record is not None:
+                # Open-loop latency runs from the intended start, so derive the start from it
+                record(self.last_end_ns - latency_us * 1000, latency_us, self.last_retries)
+        else:
+            if gateway:
+                self.gateway_errors[gateway] = self.gateway_errors.get(gateway, 0) + 1
+            if self.txlog_recorder is not None:
+                self.txlog_recorder.record_error(
+                    self.last_start_ns, (self.last_end_ns - self.last_start_ns) // 1000,
+                    self.last_retries, self.last_error)
+        self.transaction_count += 1
+
+    def report_state(self, rotate: bool = False) -> dict:
+        """
+        Everything a report needs, detached from this tester.
+
+        With rotate the interval histograms are handed over and replaced,
+        which starts the next interval; otherwise they are copied. Either
+        way this is cheap enough for the sample loop: the percentile math
+        happens later, in calculate_metrics.
+        """
+        if rotate:
+            elapsed = self._report_end - self.last_report_time
+        else:
+            # A partial interval covers as much time as the samples credited to it
+            elapsed = max(0.0, self._report_until - self.last_report_time)
+        state = {
+            'elapsed': elapsed,
+            'total_elapsed': self._merged_until - self.measure_start,
+            'total_latencies': self.total_latencies.copy(),
+            'total_row_latencies': self.total_row_latencies.copy(),
+            'total_retries': self.total_retry_stats.retries,
+            'total_scan_stats': self.total_scan_stats.copy(),
+            'peak_rss': sum(self.peak_rss.values()),
+            'transaction_count': self.transaction_count,
+            'error_count': self.error_count,
+            'row_count': self.row_count,
+            'rows': self.interval_rows,
+            'gateway_errors': dict(self.gateway_errors),
+        }
+        if rotate:
+            state.update(latencies=self.latencies, row_latencies=self.row_latencies,
+                         retry_stats=self.retry_stats, gateway_latencies=self.gateway_latencies,
+                         phase_latencies=self.phase_latencies, scan_stats=self.scan_stats)
+            self.latencies = self._new_histogram()
+            self.row_latencies = self._new_histogram()
+            self.retry_stats = RetryStats()
+            self.scan_stats = ScanStats(self.significant_figures)
+            self.gateway_latencies = {}
+            self.gateway_errors = {}
+            self.phase_latencies = {}
+            self.interval_rows = 0
+            self.last_report_time = self._report_end
+            self._report_end += self.report_interval
+            self._report_until = 0.0
+            held, self._held_report = self._held_report, []
+            for sample in held:
+                self._credit_report(sample)
+        else:
+            retry_stats = RetryStats()
+            retry_stats.merge(self.retry_stats)
+            state.update(latencies=self.latencies.copy(), row_latencies=self.row_latencies.copy(),
+                         retry_stats=retry_stats, scan_stats=self.scan_stats.copy(),
+                         gateway_latencies={node: hist.copy() for node, hist in self.gateway_latencies.items()},
+                         phase_latencies={phase: hist.copy() for phase, hist in self.phase_latencies.items()})
+        return state
 
-        # Filter out failed transactions (-1 latency)
-        valid_latencies = [lat for lat in self.latencies if lat > 0]
+    def calculate_metrics(self, state: Optional[dict] = None) -> dict:
+        """
+        Calculate performance metrics from the latency histograms of a
+        report_state (default: the current, unrotated state).
+        """
+        state = state or self.report_state()
+        elapsed = state['elapsed']
+        total_elapsed = state['total_elapsed']
 
-        if not valid_latencies:
-            return {
-                'tps': 0,
-                'errors': len(self.latencies)
-            }
+        # Only successful transactions are recorded in the histograms
+        interval = state['latencies']
+        total = state['total_latencies']
+        interval_pct = interval.percentiles(PERCENTILES)
+        total_pct = total.percentiles(PERCENTILES)
+        row_pct = state['row_latencies'].percentiles((50, 99))
+        total_row_pct = state['total_row_latencies'].percentiles((50, 99))
 
-        sorted_latencies = sorted(valid_latencies)
-        n = len(sorted_latencies)
+        retries = state['retry_stats']
+        rows = state['rows']
+        row_count = state['row_count']
+        scans = state['scan_stats']
+        total_scans = state['total_scan_stats']
+        first_row_pct = scans.first_row.percentiles((50, 99))
+        total_first_row_pct = total_scans.first_row.percentiles((50, 99))
 
         return {
-            'tps': len(self.latencies) / elapsed if elapsed > 0 else 0,
-            'total_tps': self.transaction_count / total_elapsed if total_elapsed > 0 else 0,
-            'transactions': len(self.latencies),
-            'total_transactions': self.transaction_count,
-            'errors': self.error_count,
-            'p50': sorted_latencies[int(n * 0.50)] if n > 0 else 0,
-            'p95': sorted_latencies[int(n * 0.95)] if n > 0 else 0,
-            'p99': sorted_latencies[int(n * 0.99)] if n > 0 else 0,
-            'min': min(sorted_latencies) if sorted_latencies else 0,
-            'max': max(sorted_latencies) if sorted_latencies else 0,
-            'avg': statistics.mean(sorted_latencies) if sorted_latencies else 0,
+            'phases': _phase_rows(state['phase_latencies']),
+            'tps': interval.count / elapsed if elapsed > 0 else 0,
+            'total_tps': state['transaction_count'] / total_elapsed if total_elapsed > 0 else 0,
+            'transactions': interval.count,
+            'total_transactions': state['transaction_count'],
+            'errors': state['error_count'],
+            'p50': interval_pct[50],
+            'p95': interval_pct[95],
+            'p99': interval_pct[99],
+            'p999': interval_pct[99.9],
+            'min': interval.min_us / 1000.0,
+            'max': interval.max_us / 1000.0,
+            'avg': interval.mean(),
+            'total_p50': total_pct[50],
+            'total_p95': total_pct[95],
+            'total_p99': total_pct[99],
+            'total_p999': total_pct[99.9],
+            'total_max': total.max_us / 1000.0,
+            'rows': rows,
+            'total_rows': row_count,
+            'rows_per_sec': rows / elapsed if elapsed > 0 else 0,
+            'total_rows_per_sec': row_count / total_elapsed if total_elapsed > 0 else 0,
+            'row_p50': row_pct[50],
+            'row_p99': row_pct[99],
+            'total_row_p50': total_row_pct[50],
+            'total_row_p99': total_row_pct[99],
+            'retries': retries.retries,
+            'total_retries': state['total_retries'],
+            'retry_cost_ms': retries.retry_cost_ms,
+            'aborts': retries.format_aborts(),
+            'scans': scans.scans,
+            'total_scans': total_scans.scans,
+            'scan_rows_per_sec': scans.rows / elapsed if elapsed > 0 else 0,
+            'total_scan_rows_per_sec': total_scans.rows / total_elapsed if total_elapsed > 0 else 0,
+            'scan_stream_rate': scans.rows_per_scan_sec,
+            'total_scan_stream_rate': total_scans.rows_per_scan_sec,
+            'first_row_p50': first_row_pct[50],
+            'first_row_p99': first_row_pct[99],
+            'total_first_row_p50': total_first_row_pct[50],
+            'total_first_row_p99': total_first_row_pct[99],
+            'peak_rss': state['peak_rss'],
+            'gateways': [
+                (
+                    node,
+                    hist.count / elapsed if elapsed > 0 else 0,
+                    *hist.percentiles((50, 99)).values(),
+                    state['gateway_errors'].get(node, 0),
+                )
+                for node, hist in sorted(state['gateway_latencies'].items())
+            ],
         }
 
+    def format_metrics(self, metrics: dict, label: str = "") -> List[str]:
+        """Lines of a metrics report (see print_metrics and the live dashboard)."""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        lines = ["", f"{'='*70}"]
+        lines.append(f"[{timestamp}] {label}")
+        lines.append(f"{'='*70}")
+        lines.append(f"Transactions:    {metrics.get('transactions', 0):6d} (interval) | {metrics.get('total_transactions', 0):8d} (total)")
+        lines.append(f"TPS:             {metrics.get('tps', 0):6.1f} (interval) | {metrics.get('total_tps', 0):8.1f} (total)")
+        lines.append(f"Errors:          {metrics.get('errors', 0):6d}")
+        lines.append(f"Retries:         {metrics.get('retries', 0):6d} (interval) | {metrics.get('total_retries', 0):8d} (total)")
+        lines.append(f"Retry cost (ms): {metrics.get('retry_cost_ms', 0):8.1f} (interval)")
+        lines.append(f"Aborts:          {metrics.get('aborts', 'none')} (interval, by SQLSTATE)")
+        lines.append(f"-" * 70)
+        lines.append(f"Latency (ms):")
+        lines.append(f"  p50:           {metrics.get('p50', 0):6.2f} (interval) | {metrics.get('total_p50', 0):8.2f} (total)")
+        lines.append(f"  p95:           {metrics.get('p95', 0):6.2f} (interval) | {metrics.get('total_p95', 0):8.2f} (total)")
+        lines.append(f"  p99:           {metrics.get('p99', 0):6.2f} (interval) | {metrics.get('total_p99', 0):8.2f} (total)")
+        lines.append(f"  p99.9:         {metrics.get('p999', 0):6.2f} (interval) | {metrics.get('total_p999', 0):8.2f} (total)")
+        lines.append(f"  max:           {metrics.get('max', 0):6.2f} (interval) | {metrics.get('total_max', 0):8.2f} (total)")
+        lines.append(f"  avg:           {metrics.get('avg', 0):6.2f}")
+        lines.append(f"  min:           {metrics.get('min', 0):6.2f}")
+        if metrics.get('total_rows'):
+            lines.append(f"-" * 70)
+            lines.append(f"Rows inserted:   {metrics.get('rows', 0):6d} (interval) | {metrics.get('total_rows', 0):8d} (total)")
+            lines.append(f"Rows/sec:        {metrics.get('rows_per_sec', 0):6.1f} (interval) | {metrics.get('total_rows_per_sec', 0):8.1f} (total)")
+            lines.append(f"Per-row latency (ms, transaction latency / rows):")
+            lines.append(f"  p50:           {metrics.get('row_p50', 0):6.3f} (interval) | {metrics.get('total_row_p50', 0):8.3f} (total)")
+            lines.append(f"  p99:           {metrics.get('row_p99', 0):6.3f} (interval) | {metrics.get('total_row_p99', 0):8.3f} (total)")
+        if metrics.get('total_scans'):
+            lines.append(f"-" * 70)
+            lines.append(f"Big scans:       {metrics.get('scans', 0):6d} (interval) | {metrics.get('total_scans', 0):8d} (total)")
+            lines.append(f"Rows/sec:        {metrics.get('scan_rows_per_sec', 0):6.0f} (interval) | {metrics.get('total_scan_rows_per_sec', 0):8.0f} (total)")
+            lines.append(f"Rows/sec/scan:   {metrics.get('scan_stream_rate', 0):6.0f} (interval) | {metrics.get('total_scan_stream_rate', 0):8.0f} (total)")
+            lines.append(f"Time to first row (ms):")
+            lines.append(f"  p50:           {metrics.get('first_row_p50', 0):6.2f} (interval) | {metrics.get('total_first_row_p50', 0):8.2f} (total)")
+            lines.append(f"  p99:           {metrics.get('first_row_p99', 0):6.2f} (interval) | {metrics.get('total_first_row_p99', 0):8.2f} (total)")
+            lines.append(f"Client peak RSS: {metrics.get('peak_rss', 0):6.1f} MB")
+        if metrics.get('gateways'):
+            lines.append(f"-" * 70)
+            lines.append(f"Per gateway (interval):")
+            for node, tps, p50, p99, errors in metrics['gateways']:
+                lines.append(f"  {node:<21} TPS {tps:7.1f} | p50 {p50:7.2f} | p99 {p99:7.2f} | errors {errors}")
+        if metrics.get('phases'):
+            lines.append(f"-" * 70)
+            lines.append(f"Phase latency (ms, interval):")
+            for phase, count, p50, p95, p99 in metrics['phases']:
+                lines.append(f"  {phase:<14} {count:8d} | p50 {p50:7.2f} | p95 {p95:7.2f} | p99 {p99:7.2f}")
+        if self.cluster_rows:
+            lines.append(f"-" * 70)
+            lines.append(f"Cluster (latest poll):")
+            for row in self.cluster_rows:
+                if not row['up']:
+                    lines.append(f"  node {row['node']:<3} down")
+                    continue
+                lines.append(f"  node {row['node']:<3} QPS {row['qps']:7.1f} | p99 {row['p99_latency']:7.2f} | "
+                             f"ranges {row['ranges']:5.0f} | leases {row['leaseholders']:5.0f} | "
+                             f"replQ {row['replicate_queue']:3.0f} | CPU {row['cpu_percent'] * 100:5.1f}%")
+        lines.append(f"{'='*70}")
+        lines.append("")
+        return lines
+
     def print_metrics(self, metrics: dict, label: str = ""):
         """Print metrics in a formatted way."""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"\n{'='*70}")
-        print(f"[{timestamp}] {label}")
-        print(f"{'='*70}")
-        print(f"Transactions:    {metrics.get('transactions', 0):6d} (interval) | {metrics.get('total_transactions', 0):8d} (total)")
-        print(f"TPS:             {metrics.get('tps', 0):6.1f} (interval) | {metrics.get('total_tps', 0):8.1f} (total)")
-        print(f"Errors:          {metrics.get('errors', 0):6d}")
-        print(f"-" * 70)
-        print(f"Latency (ms):")
-        print(f"  p50:           {metrics.get('p50', 0):6.2f}")
-        print(f"  p95:           {metrics.get('p95', 0):6.2f}")
-        print(f"  p99:           {metrics.get('p99', 0):6.2f}")
-        print(f"  avg:           {metrics.get('avg', 0):6.2f}")
-        print(f"  min:           {metrics.get('min', 0):6.2f}")
-        print(f"  max:           {metrics.get('max', 0):6.2f}")
-        print(f"{'='*70}\n")
-
-    def run(self, duration: int = None):
+        print("\n".join(self.format_metrics(metrics, label)))
+
+    def _report(self, state: dict, label: str):
+        """Aggregator job: percentiles and rendering for one report_state."""
+        metrics = self.calculate_metrics(state)
+        if self._dashboard:
+            self._dashboard.update(self.format_metrics(metrics, label))
+        else:
+            self.print_metrics(metrics, label)
+
+    def _message(self, text: str):
+        """Print a one-off message, or log it below the live dashboard."""
+        if self._dashboard:
+            self._dashboard.message(text)
+        else:
+            print(f"\n{text}")
+
+    def take_sample(self) -> dict:
+        """
+        Hand off everything recorded since the previous call (worker side).
+
+        The interval histogram is swapped out rather than copied, so the
+        worker keeps no reference to what it has already reported. The
+        sample is stamped with the [t0, t1] window it covers.
+        """
+        now = time.time()
+        sample = {
+            'worker': self.worker_id,
+            'window': (self._sample_start, now),
+            'latencies': self.latencies,
+            'transactions': self.transaction_count - self._sampled_transactions,
+            'errors': self.error_count - self._sampled_errors,
+            'rows': self.row_count - self._sampled_rows,
+            'row_latencies': self.row_latencies,
+            'retry_stats': self.retry_stats,
+            'gateway_latencies': self.gateway_latencies,
+            'gateway_errors': self.gateway_errors,
+            'phase_latencies': self.phase_latencies,
+            'scan_stats': self.scan_stats,
+            'peak_rss': (os.getpid(), peak_rss_mb()),
+            'error_text': self._error_text,
+            'txlog': self.txlog_recorder.take() if self.txlog_recorder else b"",
+        }
+        self._error_text = None
+        self.latencies = self._new_histogram()
+        self.row_latencies = self._new_histogram()
+        self.retry_stats = RetryStats()
+        self.scan_stats = ScanStats(self.significant_figures)
+        self.gateway_latencies = {}
+        self.gateway_errors = {}
+        self.phase_latencies = {}
+        self._sampled_transactions = self.transaction_count
+        self._sampled_errors = self.error_count
+        self._sampled_rows = self.row_count
+        self._sample_start = now
+        return sample
+
+    def merge_sample(self, sample: dict):
+        """
+        Fold a worker sample into the run totals, and into the report and
+        export intervals it belongs to (parent side).
+
+        A sample belongs to the interval holding the middle of the window
+        the worker stamped on it, not the one open when it arrived, so late
+        or bunched hand-offs don't move transactions between intervals.
+        """
+        t0, t1 = sample['window']
+        self._merged_until = max(self._merged_until, t1)
+        pid, rss = sample['peak_rss']
+        self.peak_rss[pid] = max(rss, self.peak_rss.get(pid, 0.0))
+        if self._warmup_end is not None and (t0 + t1) / 2 >= self._warmup_end:
+            self._held_totals.append(sample)
+        else:
+            self._credit_totals(sample)
+        self._credit_report(sample)
+        if self.exporter or self.bundle:
+            self._credit_export(sample)
+        if self.txlog and sample['txlog']:
+            self.txlog.write(sample['txlog'])
+        if sample.get('error_text'):
+            self._message(f"✗ Transaction error (worker {sample['worker']}): {sample['error_text']}")
+
+    def _credit_totals(self, sample: dict):
+        self.total_latencies.merge(sample['latencies'])
+        self.total_row_latencies.merge(sample['row_latencies'])
+        self.total_retry_stats.merge(sample['retry_stats'])
+        self.total_scan_stats.merge(sample['scan_stats'])
+        for node, hist in sample['gateway_latencies'].items():
+            if node not in self.total_gateway_latencies:
+                self.total_gateway_latencies[node] = self._new_histogram()
+            self.total_gateway_latencies[node].merge(hist)
+        for phase, hist in sample['phase_latencies'].items():
+            if phase not in self.total_phase_latencies:
+                self.total_phase_latencies[phase] = self._new_histogram()
+            self.total_phase_latencies[phase].merge(hist)
+        self.transaction_count += sample['transactions']
+        self.error_count += sample['errors']
+        self.row_count += sample['rows']
+
+    def _credit_report(self, sample: dict):
+        """Merge a sample into the current report interval, or hold it for a later one."""
+        t0, t1 = sample['window']
+        if (t0 + t1) / 2 >= self._report_end:
+            self._held_report.append(sample)
+            return
+        self.latencies.merge(sample['latencies'])
+        self.row_latencies.merge(sample['row_latencies'])
+        self.retry_stats.merge(sample['retry_stats'])
+        self.scan_stats.merge(sample['scan_stats'])
+        for node, hist in sample['gateway_latencies'].items():
+            if node not in self.gateway_latencies:
+                self.gateway_latencies[node] = self._new_histogram()
+            self.gateway_latencies[node].merge(hist)
+        for phase, hist in sample['phase_latencies'].items():
+            if phase not in self.phase_latencies:
+                self.phase_latencies[phase] = self._new_histogram()
+            self.phase_latencies[phase].merge(hist)
+        for node, errors in sample['gateway_errors'].items():
+            self.gateway_errors[node] = self.gateway_errors.get(node, 0) + errors
+        self.interval_rows += sample['rows']
+        self._report_until = max(self._report_until, t1)
+
+    def _credit_export(self, sample: dict):
+        """Merge a sample into the current export interval, or hold it for a later one."""
+        t0, t1 = sample['window']
+        if (t0 + t1) / 2 >= self._export_end:
+            self._held_export.append(sample)
+            return
+        self.export_latencies.merge(sample['latencies'])
+        self.export_row_latencies.merge(sample['row_latencies'])
+        self.export_retry_stats.merge(sample['retry_stats'])
+        self.export_scan_stats.merge(sample['scan_stats'])
+        self.export_errors += sample['errors']
+        self.export_rows += sample['rows']
+        self._export_until = max(self._export_until, t1)
+
+    def _set_cluster_rows(self, rows: List[dict]):
+        self.cluster_rows = rows
+
+    def record_event(self, event: str, detail: str = ""):
+        """Timestamp an experiment event (e.g. a scenario action) on the run's time axis."""
+        elapsed = time.time() - self.start_time
+        self.events.append((elapsed, event, detail))
+        self._message(f"▶ [{elapsed:7.1f}s] {event}: {detail}")
+        if self.event_log:
+            self.event_log.write(elapsed, event, detail)
+
+    def _record_range_changes(self, summary: str, changes: List[tuple]):
+        self.record_event("ranges", summary)
+
+    def _start_measuring(self):
+        """
+        End the warmup: drop everything recorded before it ended from the run
+        totals, and count the samples held back since.
+        """
+        self.total_latencies.reset()
+        self.total_row_latencies.reset()
+        self.total_retry_stats.reset()
+        self.total_scan_stats.reset()
+        self.total_gateway_latencies = {}
+        self.total_phase_latencies = {}
+        self.transaction_count = self.error_count = self.row_count = 0
+        self.measure_start = self._warmup_end
+        self._warmup_end = None
+        held, self._held_totals = self._held_totals, []
+        for sample in held:
+            self._credit_totals(sample)
+        self._message(f"✓ Warmup over, measuring from {self.measure_start - self.start_time:.1f}s")
+
+    def export_row(self):
+        """Queue one time-series row covering everything since the last export."""
+        self._write_export(self._rotate_export(final=True))
+
+    def _fold_tail(self, flush_interval: float):
+        """
+        Fold the last samples of a stopped run into the open intervals when
+        they reach less than half a flush past their end, instead of leaving
+        them a sliver of an interval of their own.
+        """
+        if self._held_report and self._merged_until - self._report_end < flush_interval / 2:
+            held, self._held_report = self._held_report, []
+            self._report_end = float('inf')
+            for sample in held:
+                self._credit_report(sample)
+        if self._held_export and self._merged_until - self._export_end < flush_interval / 2:
+            held, self._held_export = self._held_export, []
+            self._export_end = float('inf')
+            for sample in held:
+                self._credit_export(sample)
+
+    def _rotate_export(self, final: bool = False) -> dict:
+        """
+        Hand over the export histograms and counters, starting the next
+        export interval. A final (partial) interval ends with the last
+        window credited to it.
+        """
+        end = max(self._export_until, self.last_export_time) if final else self._export_end
+        state = {
+            'time_elapsed': end - self.start_time,
+            'elapsed': end - self.last_export_time,
+            'final': final,
+            'measure_offset': self.measure_start - self.start_time,
+            'latencies': self.export_latencies,
+            'row_latencies': self.export_row_latencies,
+            'retry_stats': self.export_retry_stats,
+            'scan_stats': self.export_scan_stats,
+            'errors': self.export_errors,
+            'rows': self.export_rows,
+        }
+        self.export_latencies = self._new_histogram()
+        self.export_row_latencies = self._new_histogram()
+        self.export_retry_stats = RetryStats()
+        self.export_scan_stats = ScanStats(self.significant_figures)
+        self.export_errors = 0
+        self.export_rows = 0
+        self.last_export_time = end
+        self._export_end = end + self.export_interval
+        self._export_until = 0.0
+        held, self._held_export = self._held_export, []
+        for sample in held:
+            self._credit_export(sample)
+        return state
+
+    def _write_export(self, state: dict):
+        """Aggregator job: turn a _rotate_export state into an exported (and bundled) row."""
+        elapsed = state['elapsed']
+        hist = state['latencies']
+        retry_stats = state['retry_stats']
+        pct = hist.percentiles(PERCENTILES)
+        row_pct = state['row_latencies'].percentiles((50, 99))
+        rows = state['rows']
+        scans = state['scan_stats']
+
+        row = {
+            'time_elapsed': state['time_elapsed'],
+            'tps': hist.count / elapsed if elapsed > 0 else 0.0,
+            'transactions': hist.count,
+            'errors': state['errors'],
+            'p50_latency': pct[50],
+            'p95_latency': pct[95],
+            'p99_latency': pct[99],
+            'p999_latency': pct[99.9],
+            'max_latency': hist.max_us / 1000.0,
+            'retries': retry_stats.retries,
+            'retry_cost_ms': retry_stats.retry_cost_ms,
+            'aborts': retry_stats.abort_count,
+            'rows': rows,
+            'rows_per_sec': rows / elapsed if elapsed > 0 else 0.0,
+            'p50_row_latency': row_pct[50],
+            'p99_row_latency': row_pct[99],
+            'scan_rows_per_sec': scans.rows / elapsed if elapsed > 0 else 0.0,
+            'p99_first_row': scans.first_row.percentiles((99,))[99],
+        }
+        if self.exporter:
+            self.exporter.write(row)
+        if self.bundle:
+            # A final partial interval is kept for the record but not compared
+            started = state['time_elapsed'] - elapsed
+            whole = not state['final'] or elapsed >= self.export_interval - 1e-3
+            self.bundle.add_interval(row, hist, elapsed,
+                                     measured=whole and started >= state['measure_offset'] - 1e-3)
+
+    def run(self, duration: int = None, workers: int = 1, procs: int = 1,
+            rate: Optional[float] = None, gateways: Optional[dict] = None,
+            scenario: Optional[ScenarioRunner] = None,
+            collector: Optional[ClusterCollector] = None, warmup: float = 0.0,
+            dashboard: bool = False, profiler: Optional[SamplingProfiler] = None,
+            ranges: Optional[RangeTracker] = None):
         """
         Run the load test.
 
+        Each worker thread owns one connection and its own LoadTester state.
+        With procs > 1 the workers are spread over that many processes so the
+        client is not capped by a single interpreter's GIL. Workers push their
+        samples to this (parent) tester, which merges them into the interval
+        and final reports.
+
+        With a rate the test runs open-loop instead: transactions are issued
+        on a fixed schedule over a pool of `workers` connections per process,
+        and latency is measured from each transaction's intended start time.
+
+        Connections are spread over the gateways by a GatewayPool per process;
+        a gateway that fails is ejected until it passes a health check.
+
+        This (parent) thread only merges samples and swaps out interval
+        state; percentiles, reports and export rows are computed on an
+        Aggregator thread, so reporting never holds up sample handling.
+
         Args:
             duration: Test duration in seconds (None = run indefinitely)
+            workers: Connections (threads) per process
+            procs: Number of worker processes
+            rate: Target transactions/sec across all processes (None = closed loop)
+            gateways: GatewayPool arguments: nodes, policy, health_interval
+                (default: DEFAULT_NODES, round-robin)
+            scenario: Timeline of actions to fire during the run; each one is
+                recorded with record_event
+            collector: Per-node metrics poller, timed from this run's start
+            warmup: Seconds at the start left out of the run totals (the
+                interval reports and export still cover them)
+            dashboard: Redraw the current interval in place every
+                DASHBOARD_REFRESH seconds instead of printing interval
+                reports (falls back to printing when stdout isn't a terminal)
+            profiler: Sample this process' stacks for the run; worker
+                processes sample their own and send the stacks back
+            ranges: Range/lease tracker, timed from this run's start; every
+                poll with changes is recorded as a 'ranges' event
         """
+        gateways = dict(gateways or {})
+        gateways.setdefault('nodes', DEFAULT_NODES)
         print(f"Starting load test...")
         print(f"Report interval: {self.report_interval} seconds")
         if duration:
             print(f"Duration: {duration} seconds")
         else:
             print(f"Duration: Continuous (Ctrl+C to stop)")
+        print(f"Concurrency: {procs} process(es) x {workers} connection(s)")
+        if rate:
+            print(f"Arrival rate: {rate:.0f} tx/s (open loop)")
+        print(f"Workload: {describe(self.workload_spec)}"
+              f"{' (prepared)' if self.prepare else ''}")
+        print(f"Gateways: {', '.join(gateways['nodes'])} "
+              f"({gateways.get('policy', 'round-robin')})")
+        if self.phase_timing:
+            print(f"Phase timing: on (~{self.measure_span_overhead():.0f} ns per span)")
+        else:
+            print(f"Phase timing: off")
         print(f"\nConnecting to database...")
 
-        try:
-            conn = psycopg2.connect(DSN_APP)
-            print("✓ Connected to CockroachDB\n")
+        flush_interval = min(FLUSH_INTERVAL, self.report_interval, self.export_interval)
+        # Workers flush on a grid from here, so the clock starts before they are built
+        self.start_time = time.time()
+        print(f"Run clock: t=0 at Unix time {self.start_time:.3f}")
+        self.measure_start = self.start_time
+        self.last_report_time = self.last_export_time = self._merged_until = self.start_time
+        self._report_end = self.start_time + self.report_interval
+        self._export_end = self.start_time + self.export_interval
+        settings = self.worker_settings()
+        pool = None  # Worker processes build their own
+        if procs > 1:
+            samples = multiprocessing.Queue()
+            stop = multiprocessing.Event()
+            runners = [
+                multiprocessing.Process(
+                    target=_process_main,
+                    args=(p, workers, samples, stop, flush_interval, settings,
+                          gateways, rate and rate / procs, profiler and profiler.interval),
+                    daemon=True,
+                )
+                for p in range(procs)
+            ]
+        elif rate:
+            samples = queue.Queue()
+            stop = threading.Event()
+            pool = _gateway_pool(gateways, 0, samples)
+            runners = [
+                threading.Thread(
+                    target=_open_loop_main,
+                    args=(0, workers, rate, samples, stop, flush_interval, settings, pool),
+                    daemon=True,
+                )
+            ]
+        else:
+            samples = queue.Queue()
+            stop = threading.Event()
+            pool = _gateway_pool(gateways, 0, samples)
+            runners = [
+                threading.Thread(
+                    target=_worker_loop,
+                    args=(w, samples, stop, flush_interval, settings, pool),
+                    daemon=True,
+                )
+                for w in range(workers)
+            ]
 
-            end_time = time.time() + duration if duration else None
+        aggregator = Aggregator()
+        self._dashboard = Dashboard() if dashboard else None
+        live = self._dashboard is not None and self._dashboard.live
+        exporting = self.exporter or self.bundle
+        lag = flush_interval / 2 + SAMPLE_LAG
+        last_refresh = self.start_time
+        end_time = self.start_time + duration if duration else None
+        # The warmup ends on a flush, so no sample straddles it
+        self._warmup_end = (self.start_time + math.ceil(warmup / flush_interval) * flush_interval
+                            if warmup else None)
+        if self.txlog:
+            self.txlog.start(self.start_time, {'workload': self.workload_spec.get('name'),
+                                               'warmup': warmup})
+        for runner in runners:
+            runner.start()
+        if scenario:
+            scenario.on_event = self.record_event
+            scenario.start(self.start_time)
+        if collector:
+            collector.on_sample = self._set_cluster_rows
+            collector.start(self.start_time)
+        if ranges:
+            ranges.on_change = self._record_range_changes
+            ranges.start(self.start_time)
+        self.profiler = profiler
+        if profiler:
+            profiler.start()
 
+        try:
             while True:
                 # Check if we should stop
                 if end_time and time.time() >= end_time:
                     break
+                if not any(runner.is_alive() for runner in runners):
+                    print("\n✗ All workers exited")
+                    break
 
-                # Run transaction
-                latency = self.run_transaction(conn)
-                if latency > 0:
-                    self.latencies.append(latency)
-                self.transaction_count += 1
-
-                # Report metrics at intervals
-                if time.time() - self.last_report_time >= self.report_interval:
-                    metrics = self.calculate_metrics()
-                    self.print_metrics(metrics, f"Interval Report")
-
-                    # Reset interval metrics
-                    self.latencies = []
-                    self.last_report_time = time.time()
-
-            # Final report
-            print("\n" + "="*70)
-            print("FINAL REPORT")
-            print("="*70)
-            total_elapsed = time.time() - self.start_time
-            print(f"Total runtime: {total_elapsed:.1f} seconds")
-            print(f"Total transactions: {self.transaction_count}")
-            print(f"Total errors: {self.error_count}")
-            print(f"Average TPS: {self.transaction_count / total_elapsed:.1f}")
-            print("="*70 + "\n")
+                self._receive(samples, timeout=min(0.1, flush_interval / 2))
 
-            conn.close()
+                # Hand interval state to the aggregator; only swaps happen here.
+                # An interval closes once the samples covering its end have arrived.
+                now = time.time()
+                if self._warmup_end and now >= self._warmup_end + lag:
+                    self._start_measuring()
+
+                if exporting and now >= self._export_end + lag:
+                    aggregator.submit(self._write_export, self._rotate_export())
+
+                if now >= self._report_end + lag:
+                    aggregator.submit(self._report, self.report_state(rotate=True),
+                                      "Interval Report")
+                    last_refresh = now
+                elif live and now - last_refresh >= DASHBOARD_REFRESH:
+                    started = now - self.last_report_time
+                    aggregator.submit(self._report, self.report_state(),
+                                      f"Live ({started:.0f}s into interval)")
+                    last_refresh = now
 
         except KeyboardInterrupt:
             print("\n\n✓ Load test stopped by user")
 
-            # Print final metrics
-            if self.latencies:
-                metrics = self.calculate_metrics()
-                self.print_metrics(metrics, "Final Metrics")
+        finally:
+            if scenario:
+                scenario.stop()
+            if collector:
+                collector.stop()
+            if ranges:
+                ranges.stop()
+            stop.set()
+            self._drain(samples, runners)
+            if profiler:
+                profiler.stop()
+            if pool:
+                pool.close()
+            # Close the intervals whose samples were still in flight at the stop
+            self._fold_tail(flush_interval)
+            while self._held_report:
+                aggregator.submit(self._report, self.report_state(rotate=True), "Interval Report")
+            if exporting:
+                while self._held_export:
+                    aggregator.submit(self._write_export, self._rotate_export())
+                if self.export_latencies.count:
+                    aggregator.submit(self._write_export, self._rotate_export(final=True))
+            aggregator.close()
+            self._dashboard = None
+
+        # Print whatever the last partial interval collected, over the time it covers;
+        # a sliver of an interval is left to the totals
+        state = self.report_state()
+        if self.latencies.count and state['elapsed'] >= flush_interval / 2:
+            self.print_metrics(self.calculate_metrics(state), "Final Metrics")
+
+        # Final report
+        print("\n" + "="*70)
+        print("FINAL REPORT")
+        print("="*70)
+        # Measured time is what the merged samples cover; the wall clock if none arrived
+        until = self._merged_until if self._merged_until > self.measure_start else time.time()
+        total_elapsed = self.total_elapsed = until - self.measure_start
+        self.peak_rss[os.getpid()] = peak_rss_mb()
+        print(f"Total runtime: {total_elapsed:.1f} seconds"
+              f"{f' (after {self.measure_start - self.start_time:g}s warmup)' if warmup else ''}")
+        print(f"Total transactions: {self.transaction_count}")
+        print(f"Total errors: {self.error_count}")
+        print(f"Total retries: {self.total_retry_stats.retries} "
+              f"({self.total_retry_stats.retry_cost_ms:.0f} ms lost)")
+        print(f"Aborts by SQLSTATE: {self.total_retry_stats.format_aborts()}")
+        print(f"Average TPS: {self.transaction_count / total_elapsed:.1f}")
+        if self.row_count:
+            row_pct = self.total_row_latencies.percentiles((50, 99))
+            print(f"Rows inserted: {self.row_count} ({self.row_count / total_elapsed:.1f} rows/sec, "
+                  f"per-row p50 {row_pct[50]:.3f} ms, p99 {row_pct[99]:.3f} ms)")
+        if self.total_scan_stats.scans:
+            scans = self.total_scan_stats
+            first_row = scans.first_row.percentiles((50, 99))
+            print(f"Big scans: {scans.scans} ({scans.rows} rows, {scans.rows / total_elapsed:.0f} rows/sec, "
+                  f"{scans.rows_per_scan_sec:.0f} rows/sec per scan)")
+            print(f"Time to first row: p50 {first_row[50]:.2f} ms, p99 {first_row[99]:.2f} ms")
+        if self.peak_rss:
+            print(f"Client peak RSS: {sum(self.peak_rss.values()):.1f} MB "
+                  f"({len(self.peak_rss)} process(es))")
+        for node, hist in sorted(self.total_gateway_latencies.items()):
+            p99 = hist.percentiles((99,))[99]
+            print(f"  {node:<21} {hist.count:8d} tx | {hist.count / total_elapsed:7.1f} TPS | p99 {p99:.2f} ms")
+        if self.total_phase_latencies:
+            print("Phase latency (ms):")
+            for phase, count, p50, p95, p99 in _phase_rows(self.total_phase_latencies):
+                print(f"  {phase:<14} {count:8d} | p50 {p50:7.2f} | p95 {p95:7.2f} | p99 {p99:7.2f}")
+            spans = sum(hist.count for hist in self.total_phase_latencies.values())
+            overhead_ms = spans * self.span_overhead_ns / 1e6
+            busy_ms = self.total_latencies.total_us / 1000.0
+            share = 100.0 * overhead_ms / busy_ms if busy_ms > 0 else 0.0
+            print(f"Phase timing overhead: ~{self.span_overhead_ns:.0f} ns x {spans} spans = "
+                  f"{overhead_ms:.1f} ms ({share:.3f}% of transaction time)")
+        if self.events:
+            print("Events:")
+            for elapsed, event, detail in self.events:
+                print(f"  {elapsed:7.1f}s  {event}: {detail}")
+        print("="*70 + "\n")
+
+    def _receive(self, samples, timeout: float) -> bool:
+        """Merge one sample from the worker queue. Returns False if none arrived."""
+        try:
+            sample = samples.get(timeout=timeout)
+        except queue.Empty:
+            return False
+
+        if 'failed' in sample:
+            self._message(f"✗ Worker {sample['worker']} failed: {sample['failed']}")
+        elif 'profile' in sample:
+            if self.profiler:
+                self.profiler.merge(sample['profile'])
+        elif 'gateway_event' in sample:
+            node, event = sample['gateway_event']
+            mark = "✗" if event == "ejected" else "✓"
+            self._message(f"{mark} Gateway {node} {event} (process {sample['worker']})")
+        else:
+            self.merge_sample(sample)
+        return True
+
+    def _drain(self, samples, runners):
+        """Wait for stopped workers while collecting their last samples."""
+        # Queues must be emptied before joining processes that feed them
+        while any(runner.is_alive() for runner in runners):
+            self._receive(samples, timeout=0.1)
+        while self._receive(samples, timeout=0.1):
+            pass
+        for runner in runners:
+            runner.join()
+
+
+def _phase_rows(phases: Dict[str, LatencyHistogram]) -> List[tuple]:
+    """(phase, count, p50, p95, p99) per phase: statements by name, then commit."""
+    rows = []
+    for phase in sorted(phases, key=lambda name: (name == 'commit', name)):
+        hist = phases[phase]
+        pct = hist.percentiles(PHASE_PERCENTILES)
+        rows.append((phase, hist.count, pct[50], pct[95], pct[99]))
+    return rows
 
-        except Exception as e:
-            print(f"\n✗ Load test failed: {e}")
-            raise
+
+def _write_profile(profiler: SamplingProfiler, path: str):
+    """Write the folded stacks and print the functions most often on top."""
+    profiler.write_folded(path)
+    total = sum(profiler.stacks.values())
+    print(f"✓ Wrote {len(profiler.stacks)} stacks ({total} samples) to {path}")
+    print("  Most often on top (wall-clock, so threads blocked on a queue or lock count too):")
+    for name, count in profiler.top(5):
+        print(f"  {100.0 * count / total:5.1f}%  {name}")
+
+
+def _gateway_pool(spec: dict, proc_id: int, samples) -> GatewayPool:
+    """Build one process' GatewayPool, reporting ejections to the parent."""
+    def on_change(node, event):
+        samples.put({'worker': proc_id, 'gateway_event': (node, event)})
+    return GatewayPool(start=proc_id, on_change=on_change, **spec)
+
+
+def _connect_worker(worker: LoadTester, pool: GatewayPool, stop):
+    """Reconnect after losing a gateway, waiting for re-admission if none is up."""
+    while not stop.is_set():
+        try:
+            worker.gateway, conn = pool.connect()
+            return conn
+        except NoGatewayError:
+            stop.wait(0.5)
+    return None
+
+
+def _worker_loop(worker_id: int, samples, stop, flush_interval: float, settings: dict,
+                 pool: GatewayPool):
+    """Drive one connection until stopped, pushing samples every flush_interval."""
+    worker = LoadTester(worker_id=worker_id, **settings)
+    try:
+        worker.gateway, conn = pool.connect()
+    except Exception as e:
+        samples.put({'worker': worker_id, 'failed': str(e)})
+        return
+
+    next_flush = worker.next_flush(time.time(), flush_interval)
+    try:
+        while not stop.is_set():
+            latency = worker.run_transaction(conn)
+            worker.record_result(latency)
+
+            # A dead gateway takes its connection with it: eject and move on
+            if latency < 0 and is_connection_error(conn, worker.last_error):
+                conn.close()
+                pool.release(worker.gateway)
+                pool.eject(worker.gateway)
+                conn = _connect_worker(worker, pool, stop)
+                if conn is None:
+                    break
+
+            now = time.time()
+            if now >= next_flush:
+                samples.put(worker.take_sample())
+                next_flush = worker.next_flush(now, flush_interval)
+    finally:
+        samples.put(worker.take_sample())
+        if conn is not None:
+            conn.close()
+            pool.release(worker.gateway)
+
+
+class AsyncConnectionPool:
+    """
+    Fixed-size pool of connections for the asyncio driver.
+
+    psycopg2 has no asyncio API, so each slot pairs a blocking connection
+    with its own LoadTester state and transactions run on a thread executor
+    sized to the pool. Waiting for a free slot is a coroutine, which is what
+    lets the scheduler keep time while every connection is busy.
+
+    Connections come from a GatewayPool. A slot whose gateway dies is
+    reconnected elsewhere; while no gateway is available its transactions
+    fail immediately, which the open-loop schedule records as errors.
+    """
+
+    def __init__(self, size: int, gateways: GatewayPool, first_worker_id: int = 0,
+                 settings: Optional[dict] = None):
+        self.size = size
+        self.gateways = gateways
+        self.first_worker_id = first_worker_id
+        self.settings = settings or {}
+        self.slots: List[list] = []  # [connection or None, LoadTester]
+        self._idle: Optional[asyncio.Queue] = None
+        self._executor = ThreadPoolExecutor(max_workers=size)
+
+    async def open(self):
+        """Open all connections (in the executor, so the loop stays responsive)."""
+        loop = asyncio.get_running_loop()
+        self._idle = asyncio.Queue()
+        for i in range(self.size):
+            tester = LoadTester(worker_id=self.first_worker_id + i, **self.settings)
+            tester.gateway, conn = await loop.run_in_executor(self._executor, self.gateways.connect)
+            slot = [conn, tester]
+            self.slots.append(slot)
+            self._idle.put_nowait(slot)
+
+    def _run_on_slot(self, slot: list) -> float:
+        """Executor side: (re)connect if needed, run, and eject a dead gateway."""
+        conn, tester = slot
+        if conn is None:
+            try:
+                tester.gateway, conn = self.gateways.connect()
+                slot[0] = conn
+            except NoGatewayError as e:
+                tester.last_start_ns = tester.last_end_ns = time.time_ns()
+                tester.last_retries = 0
+                tester.last_error = e
+                tester.error_count += 1
+                return -1
+
+        latency = tester.run_transaction(conn)
+        if latency < 0 and is_connection_error(conn, tester.last_error):
+            conn.close()
+            self.gateways.release(tester.gateway)
+            self.gateways.eject(tester.gateway)
+            tester.gateway = None
+            slot[0] = None
+        return latency
+
+    async def run_transaction(self) -> tuple:
+        """Run one transaction on the next free slot; returns (latency, tester)."""
+        slot = await self._idle.get()
+        try:
+            loop = asyncio.get_running_loop()
+            latency = await loop.run_in_executor(self._executor, self._run_on_slot, slot)
+        finally:
+            self._idle.put_nowait(slot)
+        return latency, slot[1]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for conn, tester in self.slots:
+            if conn is not None:
+                conn.close()
+                self.gateways.release(tester.gateway)
+
+
+async def _drive_open_loop(proc_id: int, connections: int, rate: float,
+                           samples, stop, flush_interval: float, settings: dict,
+                           gateways: GatewayPool):
+    """
+    Issue transactions at a constant arrival rate, independent of completions.
+
+    Transaction i is due at start + i / rate. Each of the pool's runners
+    claims the next due time, waits for it, and records latency from that
+    intended start rather than from when it actually got a connection. When
+    the cluster stalls the schedule keeps advancing, so queued transactions
+    carry the stall in their latency instead of it silently vanishing from
+    the percentiles (coordinated omission).
+    """
+    pool = AsyncConnectionPool(connections, gateways, first_worker_id=proc_id * connections,
+                               settings=settings)
+    try:
+        await pool.open()
+    except Exception as e:
+        samples.put({'worker': proc_id * connections, 'failed': str(e)})
+        pool.close()
+        return
+
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    next_index = 0
+
+    async def runner():
+        nonlocal next_index
+        while not stop.is_set():
+            intended = start + next_index * interval
+            next_index += 1
+
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if stop.is_set():
+                break
+
+            latency, tester = await pool.run_transaction()
+            if latency > 0:
+                latency = (time.perf_counter() - intended) * 1000
+            tester.record_result(latency)
+
+    async def flusher():
+        clock = pool.slots[0][1]
+        while not stop.is_set():
+            now = time.time()
+            await asyncio.sleep(clock.next_flush(now, flush_interval) - now)
+            for _, tester in pool.slots:
+                samples.put(tester.take_sample())
+
+    flush_task = asyncio.create_task(flusher())
+    try:
+        await asyncio.gather(*(runner() for _ in range(connections)))
+    finally:
+        flush_task.cancel()
+        for _, tester in pool.slots:
+            samples.put(tester.take_sample())
+        pool.close()
+
+
+def _open_loop_main(proc_id: int, connections: int, rate: float,
+                    samples, stop, flush_interval: float, settings: dict,
+                    gateways: GatewayPool):
+    """Thread/process entry point for the open-loop driver."""
+    asyncio.run(_drive_open_loop(proc_id, connections, rate, samples, stop,
+                                 flush_interval, settings, gateways))
+
+
+def _process_main(proc_id: int, workers: int, samples, stop, flush_interval: float,
+                  settings: dict, gateways: dict, rate: Optional[float] = None,
+                  profile_interval: Optional[float] = None):
+    """
+    Entry point of a worker process: run `workers` threads until stopped.
+
+    With a profile_interval the process samples its own stacks and sends
+    them to the parent once the workers have stopped.
+    """
+    # Ctrl+C goes to the whole process group; let the parent coordinate shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    pool = _gateway_pool(gateways, proc_id, samples)
+    profiler = SamplingProfiler(profile_interval, root=f"proc{proc_id}") if profile_interval else None
+    if profiler:
+        profiler.start()
+
+    try:
+        if rate:
+            _open_loop_main(proc_id, workers, rate, samples, stop, flush_interval, settings, pool)
+            return
+
+        threads = [
+            threading.Thread(
+                target=_worker_loop,
+                args=(proc_id * workers + w, samples, stop, flush_interval, settings, pool),
+            )
+            for w in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        pool.close()
+        if profiler:
+            profiler.stop()
+            samples.put({'worker': proc_id, 'profile': dict(profiler.stacks)})
+
+
+def _parse_rate(value: str) -> float:
+    """Parse an arrival rate such as "2000", "2000/s" or "6000/m" into tx/sec."""
+    number, _, unit = value.partition("/")
+    per = {"": 1.0, "s": 1.0, "sec": 1.0, "m": 60.0, "min": 60.0}.get(unit.strip().lower())
+    try:
+        rate = float(number) / per if per else 0.0
+    except ValueError:
+        rate = 0.0
+    if rate <= 0:
+        raise argparse.ArgumentTypeError(f"invalid rate '{value}' (expected e.g. 2000/s)")
+    return rate
+
+
+def _sweep_batch_sizes(run_once, prepare: bool, output: Optional[str],
+                       sizes: List[int], workloads: List[dict]):
+    """Run the test once per batch size and print the throughput curve."""
+    results = []
+    for size, workload in zip(sizes, workloads):
+        path = None
+        if output:
+            base, ext = os.path.splitext(output)
+            path = f"{base}.batch{size}{ext}"
+
+        print(f"\n>>> Batch size {size}")
+        tester = run_once(prepare, path, workload)
+        elapsed = tester.total_elapsed  # Measured time: no startup, seeding or warmup
+
+        tx_pct = tester.total_latencies.percentiles((50, 99))
+        row_pct = tester.total_row_latencies.percentiles((50, 99))
+        results.append((size, tester.transaction_count / elapsed if elapsed > 0 else 0.0,
+                        tester.row_count / elapsed if elapsed > 0 else 0.0,
+                        tx_pct[50], tx_pct[99], row_pct[50], row_pct[99], tester.error_count))
+
+    print("="*70)
+    print("BATCH SIZE SWEEP")
+    print("="*70)
+    print(f"{'Batch':>6} {'TPS':>9} {'Rows/sec':>10} {'Tx p50':>8} {'Tx p99':>8} "
+          f"{'Row p50':>8} {'Row p99':>8} {'Errors':>7}")
+    for size, tps, rows, p50, p99, row_p50, row_p99, errors in results:
+        print(f"{size:6d} {tps:9.1f} {rows:10.1f} {p50:8.2f} {p99:8.2f} "
+              f"{row_p50:8.3f} {row_p99:8.3f} {errors:7d}")
+    print("(latencies in ms; row latency = transaction latency / rows inserted)")
+    print("="*70 + "\n")
+
+
+def _compare_read_modes(run_once, prepare: bool, output: Optional[str],
+                        modes: List[str], workloads: List[dict]):
+    """Run the test once per read consistency mode and compare read latency."""
+    results = []
+    for mode, workload in zip(modes, workloads):
+        path = None
+        if output:
+            base, ext = os.path.splitext(output)
+            path = f"{base}.{mode}{ext}"
+
+        print(f"\n>>> Reads: {mode}")
+        tester = run_once(prepare, path, workload)
+        elapsed = tester.total_elapsed  # Measured time: no startup or warmup
+
+        reads = LatencyHistogram(significant_figures=tester.significant_figures)
+        for phase, hist in tester.total_phase_latencies.items():
+            if phase.split('@')[0] in READ_OPS:
+                reads.merge(hist)
+        tx_pct = tester.total_latencies.percentiles((50, 99))
+        read_pct = reads.percentiles((50, 99))
+        results.append((mode, tester.transaction_count / elapsed if elapsed > 0 else 0.0,
+                        tx_pct[50], tx_pct[99], reads.count, read_pct[50], read_pct[99],
+                        tester.error_count))
+
+    print("="*70)
+    print("READ CONSISTENCY")
+    print("="*70)
+    print(f"{'Mode':<9} {'TPS':>9} {'Tx p50':>8} {'Tx p99':>8} {'Reads':>8} "
+          f"{'Read p50':>9} {'Read p99':>9} {'Errors':>7}")
+    for mode, tps, p50, p99, reads, read_p50, read_p99, errors in results:
+        print(f"{mode:<9} {tps:9.1f} {p50:8.2f} {p99:8.2f} {reads:8d} "
+              f"{read_p50:9.2f} {read_p99:9.2f} {errors:7d}")
+    strong = next((row for row in results if row[0] == 'strong'), None)
+    if strong and strong[4]:
+        for mode, _, _, _, reads, read_p50, read_p99, _ in results:
+            if mode != 'strong' and reads:
+                print(f"{mode} reads save {strong[5] - read_p50:.2f} ms at p50, "
+                      f"{strong[6] - read_p99:.2f} ms at p99 vs strong")
+    print("(latencies in ms; read latency needs phase timing)")
+    print("="*70 + "\n")
+
+
+def _check_bounded_reads(node: str):
+    """Exit with the reason unless the table can serve bounded-staleness reads."""
+    try:
+        conn = psycopg2.connect(dsn_for(node), connect_timeout=5)
+    except psycopg2.Error:
+        return  # The run itself reports an unreachable cluster
+    try:
+        conn.autocommit = True
+        indexed = has_user_index(conn)
+    except psycopg2.Error as e:
+        print(f"✗ Couldn't check the transactions table for bounded-staleness reads: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
+    if not indexed:
+        print("✗ Bounded-staleness reads need an index on transactions.user_id: "
+              "with_max_staleness() only serves\n"
+              "  single-range lookups, and without the index every per-user read scans "
+              "the whole table.\n"
+              f"  Recreate the table with one: python setup_database.py --schema "
+              f"{USER_INDEX_SCHEMAS[0]}")
+        sys.exit(1)
+
+
+def _schema_matrix(run_once, args, nodes: List[str], workloads: List[dict]):
+    """Recreate the table as each schema variant and run every workload against it."""
+    users = max(w.get('keys', WORKLOAD_DEFAULTS['keys']) for w in workloads)
+    results = []
+    for schema in args.schemas:
+        print(f"\n>>> Schema {schema}")
+        setup_database(rows=args.seed_rows, users=users, nodes=nodes, schema=schema)
+        for workload in workloads:
+            path = None
+            if args.output:
+                base, ext = os.path.splitext(args.output)
+                path = f"{base}.{schema}.{workload['name']}{ext}"
+
+            print(f"\n>>> Schema {schema}, workload {workload['name']}")
+            tester = run_once(args.prepare, path, workload)
+            elapsed = tester.total_elapsed  # Measured time: no startup or warmup
+
+            pct = tester.total_latencies.percentiles((50, 95, 99))
+            results.append((schema, workload['name'],
+                            tester.transaction_count / elapsed if elapsed > 0 else 0.0,
+                            pct[50], pct[95], pct[99], tester.error_count,
+                            tester.total_retry_stats.retries))
+
+    print("="*70)
+    print("SCHEMA MATRIX")
+    print("="*70)
+    print(f"{'Schema':<13} {'Workload':<12} {'TPS':>9} {'p50':>8} {'p95':>8} {'p99':>8} "
+          f"{'Errors':>7} {'Retries':>8}")
+    for schema, name, tps, p50, p95, p99, errors, retries in results:
+        print(f"{schema:<13} {name:<12} {tps:9.1f} {p50:8.2f} {p95:8.2f} {p99:8.2f} "
+              f"{errors:7d} {retries:8d}")
+    print("(latencies in ms)")
+    print("="*70 + "\n")
+
+
+def _search_capacity(run_once, args):
+    """--find-capacity: step the load with run_once and report the capacity curve."""
+    knob = "tx/s" if args.rate else "connections"
+    integer = not args.rate
+    warmup = args.warmup or min(10.0, args.step_duration / 3)
+
+    def run_step(load: float) -> dict:
+        print(f"\n>>> Offered load: {load:g} {knob}")
+        if integer:
+            load_args = {'workers': int(load) // args.procs}  # find_capacity keeps load a multiple
+        else:
+            load_args = {'rate': load}
+        tester = run_once(args.prepare, None, duration=args.step_duration, warmup=warmup,
+                          **load_args)
+        pct = tester.total_latencies.percentiles((50, 99))
+        elapsed = tester.total_elapsed
+        return {
+            'tps': tester.total_latencies.count / elapsed if elapsed > 0 else 0.0,
+            'p50': pct[50],
+            'p99': pct[99],
+            'errors': tester.error_count,
+            'transactions': tester.total_latencies.count,
+        }
+
+    start = args.rate if args.rate else args.workers * args.procs
+    steps = find_capacity(run_step, start, args.slo_p99, max_error_rate=args.max_error_rate,
+                          integer=integer, max_steps=args.max_steps,
+                          granularity=args.procs if integer else 1)
+    print_curve(steps, knob, args.slo_p99, args.label)
+    if args.capacity_output:
+        append_curve(args.capacity_output, steps, knob, args.label)
+        print(f"✓ Appended {len(steps)} steps to {args.capacity_output}")
+
+
+def _parse_slo(value: str) -> float:
+    try:
+        return parse_latency_ms(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _parse_read_modes(value: str) -> List[str]:
+    modes = [mode.strip() for mode in value.split(',') if mode.strip()]
+    unknown = [mode for mode in modes if mode not in READ_MODES]
+    if not modes or unknown:
+        raise argparse.ArgumentTypeError(
+            f"invalid read mode '{value}' (choose from {', '.join(READ_MODES)})")
+    return modes
+
+
+def _parse_batch_sizes(value: str) -> List[int]:
+    """Parse "100" or a sweep such as "1,10,100,1000" into batch sizes."""
+    try:
+        sizes = [int(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        sizes = []
+    if not sizes or min(sizes) < 1:
+        raise argparse.ArgumentTypeError(f"invalid batch size(s) '{value}' (expected e.g. 1,10,100)")
+    return sizes
 
 
 def main():
     """Main entry point."""
-    # Parse command line arguments
-    duration = None
-    report_interval = 10
+    parser = argparse.ArgumentParser(
+        description="Run continuous transactions against the cluster and report metrics.",
+        epilog="Example: python load_test.py 60 10 --workers 8 --procs 4",
+    )
+    parser.add_argument("duration", nargs="?", type=int, default=None,
+                        help="Test duration in seconds (default: run until Ctrl+C)")
+    parser.add_argument("report_interval", nargs="?", type=int, default=10,
+                        help="Seconds between interval reports (default: 10)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Connections per process, one thread each (default: 1)")
+    parser.add_argument("--procs", type=int, default=1,
+                        help="Worker processes to spread connections over (default: 1)")
+    parser.add_argument("--rate", type=_parse_rate, default=None,
+                        help="Open-loop arrival rate, e.g. 2000/s; latency is measured "
+                             "from each transaction's intended start (default: closed loop)")
+    parser.add_argument("--workload", default="default",
+                        help="Workload name (see --list-workloads) or JSON spec file "
+                             "(default: insert + read, as before); with --schemas, a "
+                             "comma-separated list")
+    parser.add_argument("--read-consistency", type=_parse_read_modes, default=None,
+                        metavar="MODE[,MODE...]",
+                        help="Reads: strong (leaseholder), follower (follower_read_timestamp()) "
+                             "or bounded (with_max_staleness); a list such as "
+                             "strong,follower,bounded runs once per mode and compares them")
+    parser.add_argument("--max-staleness", default=None, metavar="INTERVAL",
+                        help="Staleness bound of bounded reads (default: 10s)")
+    parser.add_argument("--separate-reads", action="store_true", default=None,
+                        help="Run strong reads as their own read-only transactions too")
+    parser.add_argument("--schemas", type=parse_schemas, default=None, metavar="NAME[,NAME...]",
+                        help="Recreate and seed the table as each schema variant (serial, uuid, "
+                             "hash-sharded, covering or all) and run every --workload against "
+                             "it; prints one comparison table. Drops the table!")
+    parser.add_argument("--seed-rows", type=int, default=10_000,
+                        help="Rows seeded into each --schemas variant (default: 10000)")
+    parser.add_argument("--scan-by", choices=SCAN_BY, default=None,
+                        help="bigscan workloads: scan a user_id range, a time window or the "
+                             "whole table")
+    parser.add_argument("--scan-window", default=None, metavar="INTERVAL",
+                        help="bigscan by time: scan rows newer than this (default: 1h)")
+    parser.add_argument("--scan-method", choices=SCAN_METHODS, default=None,
+                        help="bigscan workloads: stream through a named server-side cursor, "
+                             "page by keyset, or fetchall (default: cursor)")
+    parser.add_argument("--itersize", type=int, default=None, metavar="ROWS",
+                        help="bigscan rows per cursor fetch or keyset page (default: 2000)")
+    parser.add_argument("--distribution", default=None,
+                        help="Override the key distribution: sequential, uniform, zipfian, "
+                             "latest or hotspot")
+    parser.add_argument("--zipf", type=float, default=None, metavar="THETA",
+                        help="Zipfian/latest skew, 0 < THETA < 1 (default: 0.99)")
+    parser.add_argument("--keys", type=int, default=None,
+                        help="Key space size (distinct user_ids)")
+    parser.add_argument("--list-workloads", action="store_true",
+                        help="Print the built-in workloads and exit")
+    parser.add_argument("--batch-size", type=_parse_batch_sizes, default=None, metavar="N[,N...]",
+                        help="Rows per multi-row INSERT; a list such as 1,10,100,1000 runs "
+                             "the test once per size and compares them (default: 1)")
+    parser.add_argument("--batch-statements", type=int, default=None, metavar="S",
+                        help="INSERT statements per insert operation, each of --batch-size "
+                             "rows, all committed together (default: 1)")
+    parser.add_argument("--profile", default=None, metavar="FILE",
+                        help="Sample the harness' own stacks during the run and write them "
+                             "to FILE in folded format (for flamegraph.pl or speedscope)")
+    parser.add_argument("--profile-interval", type=float, default=PROFILE_INTERVAL * 1000,
+                        metavar="MS",
+                        help=f"Milliseconds between profile samples "
+                             f"(default: {PROFILE_INTERVAL * 1000:g})")
+    parser.add_argument("--no-dashboard", dest="dashboard", action="store_false",
+                        help="Print a report block every interval instead of redrawing a live "
+                             "dashboard (the default on a terminal)")
+    parser.add_argument("--no-phase-timing", dest="phase_timing", action="store_false",
+                        help="Don't time statements and commits separately (removes the "
+                             "per-phase spans, for the highest-TPS runs)")
+    parser.add_argument("--no-prepare", dest="prepare", action="store_false",
+                        help="Send plain SQL text instead of server-side prepared statements")
+    parser.add_argument("--compare-prepared", action="store_true",
+                        help="Run the test twice (plain SQL, then prepared) and compare "
+                             "throughput, latency and gateway CPU; needs a duration")
+    parser.add_argument("--scenario", metavar="FILE|TEXT", default=None,
+                        help='Timeline of actions to run during the test, e.g. '
+                             '"t=30s add_index; t=90s stop-node roach3; t=150s start-node roach3"')
+    parser.add_argument("--actions", metavar="FILE", default=None,
+                        help="Python file whose ACTIONS dict adds or replaces scenario actions")
+    parser.add_argument("--collect", type=float, default=None, metavar="SECONDS",
+                        help="Poll every --nodes node for QPS, latency, ranges, leases, "
+                             "replication queue and CPU every SECONDS; with --output the "
+                             "rows go to <name>.nodes.<ext>")
+    parser.add_argument("--collect-source", choices=ClusterCollector.SOURCES, default="sql",
+                        help="crdb_internal.node_metrics (sql) or _status/vars (http) "
+                             "(default: sql)")
+    parser.add_argument("--track-ranges", type=float, default=None, metavar="SECONDS",
+                        help="Snapshot the transactions table's ranges every SECONDS and record "
+                             "lease transfers and replica moves as events; with --output the "
+                             "per-range changes go to <name>.ranges.csv")
+    parser.add_argument("--warmup", type=float, default=0.0, metavar="SECONDS",
+                        help="Leave the first SECONDS out of the totals (default: 0)")
+    parser.add_argument("--find-capacity", action="store_true",
+                        help="Ramp the load (connections, or the arrival rate when --rate is "
+                             "given) and binary-search the highest load within --slo-p99")
+    parser.add_argument("--slo-p99", type=_parse_slo, default=None, metavar="LATENCY",
+                        help="p99 target for --find-capacity, e.g. 50ms")
+    parser.add_argument("--max-error-rate", type=float, default=0.001,
+                        help="Failed-transaction share that breaks the SLO (default: 0.001)")
+    parser.add_argument("--step-duration", type=float, default=30.0, metavar="SECONDS",
+                        help="How long each --find-capacity step runs, warmup included "
+                             "(default: 30)")
+    parser.add_argument("--max-steps", type=int, default=12,
+                        help="Most --find-capacity steps to run (default: 12)")
+    parser.add_argument("--label", default="",
+                        help="Name of this topology or configuration in the capacity curve "
+                             "and result bundle file names, e.g. 3-node")
+    parser.add_argument("--capacity-output", metavar="PATH", default=None,
+                        help="Append the capacity curve to this CSV "
+                             "(plot with generate_graphs.py --capacity)")
+    parser.add_argument("--fake", nargs="?", const="", default=None, metavar="SPEC",
+                        help="Run against the in-process stand-in instead of a cluster; SPEC is "
+                             "JSON or a JSON file with latency distributions, retry_rate and "
+                             "node down windows (see fakedb.py)")
+    parser.add_argument("--nodes", type=parse_nodes, default=None,
+                        help="Comma-separated gateways to spread connections over, e.g. "
+                             "localhost:26257,localhost:26258, or 'local' for all five "
+                             "(default: localhost:26257)")
+    parser.add_argument("--discover", action="store_true",
+                        help="Find the live gateways via crdb_internal.gossip_nodes, "
+                             "starting from the first --nodes entry")
+    parser.add_argument("--balance", choices=GatewayPool.POLICIES, default="round-robin",
+                        help="How connections are assigned to gateways (default: round-robin)")
+    parser.add_argument("--health-interval", type=float, default=5.0, metavar="SECONDS",
+                        help="How often ejected gateways are re-checked (default: 5)")
+    parser.add_argument("--output", metavar="PATH", default=None,
+                        help="Stream interval rows to PATH: .csv for generate_graphs.py, "
+                             "any other extension (e.g. .bin) for the compact binary format")
+    parser.add_argument("--export-interval", type=float, default=None, metavar="SECONDS",
+                        help="Seconds per exported row, may be sub-second "
+                             f"(default: report_interval, or {BUNDLE_INTERVAL:g} with --bundle)")
+    parser.add_argument("--txlog", metavar="PATH", default=None,
+                        help="Log every transaction (start, latency, phases, gateway, outcome, "
+                             "retries) as a fixed-width binary record to PATH, for "
+                             "analyze_txlog.py; further runs go to PATH.2, PATH.3, ...")
+    parser.add_argument("--txlog-max-mb", type=float, default=TXLOG_MAX_MB, metavar="MB",
+                        help="Stop logging transactions once a log reaches MB "
+                             f"(default: {TXLOG_MAX_MB})")
+    parser.add_argument("--bundle", metavar="DIR", default=None,
+                        help="Write every run's result bundle (config, cluster, summary, "
+                             "histograms and interval series) to a new file in DIR, for "
+                             "compare.py")
+    parser.add_argument("--fsync-interval", type=float, default=5.0, metavar="SECONDS",
+                        help="How often the export file is fsync'd (default: 5)")
+    parser.add_argument("--max-retries", type=int, default=10,
+                        help="Client-side retry budget per transaction for 40001 errors, "
+                             "0 disables the savepoint protocol (default: 10)")
+    parser.add_argument("--retry-backoff-ms", type=float, default=10.0,
+                        help="Base of the jittered exponential backoff (default: 10)")
+    parser.add_argument("--precision", type=int, default=3, choices=range(1, 6),
+                        metavar="{1-5}",
+                        help="Significant figures kept by the latency histograms (default: 3)")
+    args = parser.parse_args()
+
+    if args.list_workloads:
+        for description in list_workloads().values():
+            print(f"  {description}")
+        return
 
-    if len(sys.argv) > 1:
+    if args.fake is not None:
         try:
-            duration = int(sys.argv[1])
-        except ValueError:
-            print("Usage: python load_test.py [duration_seconds] [report_interval]")
-            print("Example: python load_test.py 60 10  # Run for 60s, report every 10s")
-            sys.exit(1)
+            fakedb.install(args.fake)
+        except (OSError, ValueError) as e:
+            parser.error(f"--fake: {e}")
+        print("✓ Using the in-process fake cluster (fakedb)")
+
+    batch_sizes = args.batch_size or [None]
+    read_modes = args.read_consistency or [None]
+    workload_names = [name.strip() for name in args.workload.split(',') if name.strip()]
+    if len(workload_names) > 1 and not args.schemas:
+        parser.error("several --workload names need --schemas")
+    if len(read_modes) > 1 and len(batch_sizes) > 1:
+        parser.error("compare read modes or sweep batch sizes, not both")
+    overrides = dict(distribution=args.distribution, theta=args.zipf, keys=args.keys,
+                     batch_statements=args.batch_statements, max_staleness=args.max_staleness,
+                     separate_reads=args.separate_reads, scan_by=args.scan_by,
+                     scan_window=args.scan_window, scan_method=args.scan_method,
+                     itersize=args.itersize)
+    try:
+        matrix_workloads = [load_workload(name, read_consistency=read_modes[0], **overrides)
+                            for name in workload_names]
+        workloads = [load_workload(workload_names[0], batch_size=size,
+                                   read_consistency=read_modes[0], **overrides)
+                     for size in batch_sizes]
+        mode_workloads = [load_workload(workload_names[0], read_consistency=mode, **overrides)
+                          for mode in read_modes]
+    except ValueError as e:
+        parser.error(str(e))
+    workload = workloads[0]
+
+    steps = None
+    if args.scenario:
+        try:
+            actions = load_actions(args.actions) if args.actions else ACTIONS
+            steps = read_scenario(args.scenario, actions)
+        except (OSError, ValueError) as e:
+            parser.error(f"--scenario: {e}")
+
+    if args.workers < 1 or args.procs < 1:
+        parser.error("--workers and --procs must be at least 1")
+
+    if args.export_interval is not None and args.export_interval <= 0:
+        parser.error("--export-interval must be positive")
+    if args.collect is not None and args.collect <= 0:
+        parser.error("--collect must be positive")
+    if args.track_ranges is not None and args.track_ranges <= 0:
+        parser.error("--track-ranges must be positive")
+    if args.profile_interval <= 0:
+        parser.error("--profile-interval must be positive")
 
-    if len(sys.argv) > 2:
+    nodes = args.nodes or DEFAULT_NODES
+    if args.discover:
         try:
-            report_interval = int(sys.argv[2])
-        except ValueError:
-            print("Invalid report interval")
+            nodes = discover_nodes(nodes[0])
+        except psycopg2.Error as e:
+            print(f"✗ Gateway discovery failed: {e}")
             sys.exit(1)
+        print(f"✓ Discovered {len(nodes)} live gateway(s)")
+    gateways = {'nodes': nodes, 'policy': args.balance, 'health_interval': args.health_interval}
+
+    if args.compare_prepared and not args.duration:
+        parser.error("--compare-prepared needs a duration")
+    if args.find_capacity:
+        if args.slo_p99 is None:
+            parser.error("--find-capacity needs --slo-p99")
+        if args.compare_prepared or len(batch_sizes) > 1:
+            parser.error("--find-capacity can't be combined with --compare-prepared "
+                         "or a --batch-size sweep")
+        if args.step_duration <= args.warmup:
+            parser.error("--step-duration must be longer than --warmup")
+    if args.schemas:
+        if not args.duration:
+            parser.error("--schemas needs a duration")
+        if args.compare_prepared or args.find_capacity or len(batch_sizes) > 1:
+            parser.error("--schemas can't be combined with --compare-prepared, "
+                         "--find-capacity or a --batch-size sweep")
+    if len(read_modes) > 1:
+        if not args.duration:
+            parser.error("comparing read modes needs a duration")
+        if args.compare_prepared or args.find_capacity or args.schemas:
+            parser.error("comparing read modes can't be combined with --compare-prepared, "
+                         "--find-capacity or --schemas")
+        if not set(READ_OPS) & set(list(workload.get('sequence', [])) + list(workload.get('mix', {}))):
+            parser.error(f"workload '{workload['name']}' has no reads to compare")
+    if len(batch_sizes) > 1:
+        if not args.duration:
+            parser.error("a --batch-size sweep needs a duration")
+        if args.compare_prepared:
+            parser.error("--compare-prepared and a --batch-size sweep can't be combined")
+        if 'insert' not in list(workload.get('sequence', [])) + list(workload.get('mix', {})):
+            parser.error(f"workload '{workload['name']}' inserts nothing to batch")
+    if args.txlog_max_mb <= 0:
+        parser.error("--txlog-max-mb must be positive")
+    bounded = any(spec.get('read_consistency') == 'bounded'
+                  and set(READ_OPS) & set(list(spec.get('sequence', [])) + list(spec.get('mix', {})))
+                  for spec in matrix_workloads + workloads + mode_workloads)
+    if bounded and args.schemas:
+        unindexed = [schema for schema in args.schemas if schema not in USER_INDEX_SCHEMAS]
+        if unindexed:
+            parser.error(f"bounded-staleness reads need an index on user_id, which schema(s) "
+                         f"{', '.join(unindexed)} lack (use {', '.join(USER_INDEX_SCHEMAS)})")
+    elif bounded and args.fake is None:
+        _check_bounded_reads(nodes[0])
+
+    live_dashboard = args.dashboard and sys.stdout.isatty()
+    # One profiler for every run of this invocation; the file is rewritten after each
+    profiler = SamplingProfiler(args.profile_interval / 1000.0) if args.profile else None
+    # Bundles are resampled per export interval, so give them enough intervals by default
+    export_interval = args.export_interval
+    if export_interval is None and args.bundle:
+        export_interval = min(BUNDLE_INTERVAL, args.report_interval)
+    txlog_runs = 0
+
+    def run_once(prepare: bool, output: Optional[str], workload: dict = workload,
+                 **overrides) -> LoadTester:
+        """One LoadTester.run; overrides replace its duration/workers/procs/rate/warmup."""
+        nonlocal txlog_runs
+        exporter = event_log = scenario = collector = node_writer = None
+        tracker = range_log = txlog = None
+        if output:
+            exporter = open_interval_writer(output, fsync_interval=args.fsync_interval)
+        if args.collect:
+            if output:
+                base, ext = os.path.splitext(output)
+                node_writer = open_interval_writer(f"{base}.nodes{ext}", COLLECT_COLUMNS,
+                                                   fsync_interval=args.fsync_interval)
+            collector = ClusterCollector(nodes, interval=args.collect,
+                                         source=args.collect_source, writer=node_writer)
+        if steps:
+            scenario = ScenarioRunner(steps, actions, nodes=nodes)
+        if args.track_ranges:
+            if output:
+                range_log = EventLog(ranges_path(output))
+            tracker = RangeTracker(nodes, interval=args.track_ranges, log=range_log)
+        if output and (steps or args.track_ranges):
+            event_log = EventLog(events_path(output))
+        if args.txlog:
+            txlog_runs += 1
+            path = args.txlog if txlog_runs == 1 else f"{args.txlog}.{txlog_runs}"
+            txlog = TxLogWriter(path, txlog_phases(Workload(workload)), nodes,
+                                max_mb=args.txlog_max_mb)
+
+        run_args = dict(duration=args.duration, workers=args.workers, procs=args.procs,
+                        rate=args.rate, warmup=args.warmup, dashboard=live_dashboard)
+        run_args.update(overrides)
+        bundle = None
+        if args.bundle:
+            config = {key: value for key, value in run_args.items() if key != 'dashboard'}
+            config.update(workload=workload, prepare=prepare, phase_timing=args.phase_timing,
+                          max_retries=args.max_retries, retry_backoff_ms=args.retry_backoff_ms,
+                          gateways=gateways, label=args.label)
+            bundle = ResultBundle(config, cluster=probe_cluster(nodes))
+
+        tester = LoadTester(report_interval=args.report_interval,
+                            significant_figures=args.precision,
+                            exporter=exporter,
+                            export_interval=export_interval,
+                            retry_policy=RetryPolicy(max_retries=args.max_retries,
+                                                     base_delay_ms=args.retry_backoff_ms),
+                            workload=workload,
+                            prepare=prepare,
+                            event_log=event_log,
+                            phase_timing=args.phase_timing,
+                            quiet=live_dashboard,
+                            bundle=bundle,
+                            txlog=txlog)
+        try:
+            tester.run(gateways=gateways, scenario=scenario, collector=collector,
+                       profiler=profiler, ranges=tracker, **run_args)
+        finally:
+            if profiler:
+                _write_profile(profiler, args.profile)
+            if exporter:
+                exporter.close()
+                print(f"✓ Wrote {exporter.rows_written} interval rows to {exporter.path}")
+            if event_log:
+                event_log.close()
+                print(f"✓ Wrote {event_log.count} events to {event_log.path}")
+            if node_writer:
+                node_writer.close()
+                print(f"✓ Wrote {node_writer.rows_written} node rows to {node_writer.path}")
+            if range_log:
+                range_log.close()
+                print(f"✓ Wrote {range_log.count} range changes to {range_log.path}")
+            if txlog:
+                txlog.close()
+                print(f"✓ Wrote {txlog.records} transactions ({txlog.size_mb:.1f} MB) to {txlog.path}")
+                if txlog.dropped:
+                    print(f"✗ {txlog.dropped} transactions past --txlog-max-mb were not logged")
+        if bundle:
+            print(f"✓ Wrote result bundle {bundle.write(args.bundle, tester, args.label)}")
+        return tester
+
+    if args.find_capacity:
+        _search_capacity(run_once, args)
+        return
+
+    if args.schemas:
+        _schema_matrix(run_once, args, nodes, matrix_workloads)
+        return
+
+    if len(read_modes) > 1:
+        _compare_read_modes(run_once, args.prepare, args.output, read_modes, mode_workloads)
+        return
+
+    if len(batch_sizes) > 1:
+        _sweep_batch_sizes(run_once, args.prepare, args.output, batch_sizes, workloads)
+        return
+
+    if not args.compare_prepared:
+        run_once(args.prepare, args.output)
+        return
+
+    results = []
+    for prepare in (False, True):
+        label = "prepared" if prepare else "plain SQL"
+        output = None
+        if args.output:
+            base, ext = os.path.splitext(args.output)
+            output = f"{base}.{'prepared' if prepare else 'plain'}{ext}"
+
+        cpu_before = gateway_cpu_seconds(nodes)
+        started = time.time()
+        tester = run_once(prepare, output)
+        wall = time.time() - started
+        cpu_after = gateway_cpu_seconds(nodes)
+
+        # Gateway CPU can only be read around the whole run, so it averages over startup too
+        cores = sum(cpu_after[n] - cpu_before[n] for n in cpu_after if n in cpu_before) / wall
+        elapsed = tester.total_elapsed  # Measured time: no startup or warmup
+        pct = tester.total_latencies.percentiles((50, 99))
+        results.append((label, tester.transaction_count / elapsed if elapsed > 0 else 0.0,
+                        pct[50], pct[99], cores))
 
-    tester = LoadTester(report_interval=report_interval)
-    tester.run(duration=duration)
+    print("="*70)
+    print("PREPARED vs PLAIN SQL")
+    print("="*70)
+    print(f"{'Mode':<12} {'TPS':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'Gateway CPU (cores)':>20}")
+    for label, tps, p50, p99, cores in results:
+        print(f"{label:<12} {tps:10.1f} {p50:10.2f} {p99:10.2f} {cores:20.2f}")
+    (_, plain_tps, _, _, plain_cores), (_, prep_tps, _, _, prep_cores) = results
+    if plain_tps > 0:
+        print(f"\nThroughput change: {100.0 * (prep_tps - plain_tps) / plain_tps:+.1f}%")
+    if plain_tps > 0 and prep_tps > 0 and plain_cores > 0:
+        per_tx = (prep_cores / prep_tps) / (plain_cores / plain_tps)
+        print(f"Gateway CPU per transaction: {100.0 * (per_tx - 1):+.1f}%")
+    print("(gateway CPU is averaged over each whole run, startup and warmup included)")
+    print("="*70 + "\n")
 
 
 if __name__ == "__main__":
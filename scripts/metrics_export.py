@@ -0,0 +1,188 @@
+"""
+Streaming export of per-interval load test metrics.
+
+Rows are handed to a background thread, so the reporting loop never waits
+on disk. Two formats are supported, picked by file extension:
+
+- .csv: plain CSV that generate_graphs.py reads directly. Appends are
+  buffered and the file is fsync'd every `fsync_interval` seconds.
+- anything else (e.g. .bin): a compact binary columnar format for
+  sub-second intervals over multi-hour runs. After a short header the
+  file is a sequence of blocks, each holding up to BLOCK_ROWS rows stored
+  column by column (time as float64, everything else as float32). A block
+  is written at least every `fsync_interval` seconds, so a crash loses at
+  most that much data.
+"""
+import os
+import queue
+import struct
+import threading
+import time
+from array import array
+from typing import Dict, List, Sequence
+
+INTERVAL_COLUMNS = [
+    'time_elapsed', 'tps', 'transactions', 'errors',
+    'p50_latency', 'p95_latency', 'p99_latency', 'p999_latency', 'max_latency',
+    'retries', 'retry_cost_ms', 'aborts',
+    'rows', 'rows_per_sec', 'p50_row_latency', 'p99_row_latency',
+    'scan_rows_per_sec', 'p99_first_row',
+]
+
+MAGIC = b"CRDBCOL1"
+BLOCK_ROWS = 4096
+_STOP = object()
+
+
+class IntervalWriter:
+    """Base class: owns the writer thread and the row queue."""
+
+    def __init__(self, path: str, columns: Sequence[str], fsync_interval: float = 5.0):
+        self.path = path
+        self.columns = list(columns)
+        self.fsync_interval = fsync_interval
+        self.rows_written = 0
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._file = open(path, 'wb')
+        self._write_header()
+        self._thread = threading.Thread(target=self._run, name="interval-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, row: Dict[str, float]):
+        """Queue one interval row. Never blocks on I/O."""
+        self._queue.put(row)
+
+    def close(self):
+        """Write everything still queued, fsync and close the file."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        next_sync = time.time() + self.fsync_interval
+        while True:
+            try:
+                row = self._queue.get(timeout=max(next_sync - time.time(), 0.01))
+            except queue.Empty:
+                row = None
+
+            if row is _STOP:
+                break
+            if row is not None:
+                self._append(row)
+                self.rows_written += 1
+
+            if time.time() >= next_sync:
+                self._sync()
+                next_sync = time.time() + self.fsync_interval
+
+        self._sync()
+        self._file.close()
+
+    def _sync(self):
+        self._flush_buffered()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    # Format-specific hooks
+    def _write_header(self):
+        raise NotImplementedError
+
+    def _append(self, row: Dict[str, float]):
+        raise NotImplementedError
+
+    def _flush_buffered(self):
+        pass
+
+
+class CsvIntervalWriter(IntervalWriter):
+    def _write_header(self):
+        self._file.write((",".join(self.columns) + "\n").encode())
+
+    def _append(self, row: Dict[str, float]):
+        line = ",".join(_format_value(row.get(col, 0)) for col in self.columns)
+        self._file.write((line + "\n").encode())
+
+
+class BinaryIntervalWriter(IntervalWriter):
+    def _write_header(self):
+        self._typecodes = ['d' if col == 'time_elapsed' else 'f' for col in self.columns]
+        self._buffers = [array(code) for code in self._typecodes]
+
+        header = bytearray(MAGIC)
+        header += struct.pack('<H', len(self.columns))
+        for name, code in zip(self.columns, self._typecodes):
+            encoded = name.encode()
+            header += struct.pack('<B', len(encoded)) + encoded + code.encode()
+        self._file.write(header)
+
+    def _append(self, row: Dict[str, float]):
+        for col, buf in zip(self.columns, self._buffers):
+            buf.append(row.get(col, 0))
+        if len(self._buffers[0]) >= BLOCK_ROWS:
+            self._flush_buffered()
+
+    def _flush_buffered(self):
+        rows = len(self._buffers[0])
+        if not rows:
+            return
+        self._file.write(struct.pack('<I', rows))
+        for buf in self._buffers:
+            self._file.write(_little_endian(buf).tobytes())
+            del buf[:]
+
+
+def open_interval_writer(path: str, columns: Sequence[str] = INTERVAL_COLUMNS,
+                         fsync_interval: float = 5.0) -> IntervalWriter:
+    """Open a CSV writer for .csv paths and a binary columnar writer otherwise."""
+    if path.lower().endswith('.csv'):
+        return CsvIntervalWriter(path, columns, fsync_interval)
+    return BinaryIntervalWriter(path, columns, fsync_interval)
+
+
+def read_binary_columns(path: str) -> Dict[str, List[float]]:
+    """Read a binary columnar file back into {column: values}."""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a binary interval file")
+    offset = len(MAGIC)
+    (ncols,) = struct.unpack_from('<H', data, offset)
+    offset += 2
+
+    names, typecodes = [], []
+    for _ in range(ncols):
+        (length,) = struct.unpack_from('<B', data, offset)
+        offset += 1
+        names.append(data[offset:offset + length].decode())
+        typecodes.append(chr(data[offset + length]))
+        offset += length + 1
+
+    columns = {name: array(code) for name, code in zip(names, typecodes)}
+    row_size = sum(array(code).itemsize for code in typecodes)
+    while offset + 4 <= len(data):
+        (rows,) = struct.unpack_from('<I', data, offset)
+        offset += 4
+        if offset + rows * row_size > len(data):
+            break  # Block cut short by a crash mid-write
+        for name, code in zip(names, typecodes):
+            size = rows * array(code).itemsize
+            chunk = array(code, data[offset:offset + size])
+            columns[name].extend(_little_endian(chunk))
+            offset += size
+
+    return {name: values.tolist() for name, values in columns.items()}
+
+
+def _little_endian(values: array) -> array:
+    if struct.pack('=H', 1) == struct.pack('<H', 1):
+        return values
+    swapped = array(values.typecode, values)
+    swapped.byteswap()
+    return swapped
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
@@ -0,0 +1,62 @@
+"""
+Per-connection cache of server-side prepared statements.
+
+psycopg2 always sends statement text with the parameters interpolated, so
+the gateway parses and plans every statement again. StatementCache issues
+`PREPARE` once per SQL text and connection and afterwards runs the
+statement by name with `EXECUTE name (params)`, which the server resolves
+to the already-planned statement.
+"""
+import re
+from typing import Dict, Iterable, Tuple
+
+_PLACEHOLDER = re.compile(r"%s")
+
+
+class StatementCache:
+    def __init__(self, conn, prefix: str = "lt"):
+        """
+        Args:
+            conn: psycopg2 connection the statements are prepared on
+            prefix: Prefix for the generated statement names
+        """
+        self.conn = conn
+        self.prefix = prefix
+        self._statements: Dict[str, str] = {}  # SQL text -> EXECUTE template
+
+    def __len__(self):
+        return len(self._statements)
+
+    def prepare(self, cur, sql: str) -> str:
+        """PREPARE sql on this connection (once) and return its EXECUTE template."""
+        template = self._statements.get(sql)
+        if template is not None:
+            return template
+
+        name = f"{self.prefix}_{len(self._statements) + 1}"
+        count = 0
+
+        def number(_):
+            nonlocal count
+            count += 1
+            return f"${count}"
+
+        body = _PLACEHOLDER.sub(number, sql.strip().rstrip(";"))
+        cur.execute(f"PREPARE {name} AS {body}")
+
+        args = ", ".join(["%s"] * count)
+        template = f"EXECUTE {name} ({args})" if count else f"EXECUTE {name}"
+        self._statements[sql] = template
+        return template
+
+    def prepare_all(self, statements: Iterable[str]):
+        """Prepare statements up front, outside of any workload transaction."""
+        with self.conn.cursor() as cur:
+            for sql in statements:
+                self.prepare(cur, sql)
+        self.conn.commit()
+
+    def execute(self, cur, sql: str, params: Tuple = ()):
+        """Run sql by handle, preparing it first if this connection hasn't yet."""
+        cur.execute(self.prepare(cur, sql), params)
+        return cur
@@ -0,0 +1,91 @@
+"""
+Sampling profiler for load_test.py --profile.
+
+A background thread snapshots every other thread's Python stack
+(sys._current_frames) every `interval` seconds and counts identical
+stacks. It needs no extra packages and no changes to the code being
+profiled, and at the default 5 ms interval costs far less than
+deterministic profiling (cProfile hooks every call, which would inflate
+exactly the client latency being measured).
+
+Samples are wall-clock: a thread blocked on the database or a queue is
+sampled too, so time spent waiting shows up next to time spent in our
+own Python. write_folded writes Brendan Gregg's folded format, one
+"root;caller;callee count" line per stack, which flamegraph.pl,
+speedscope and inferno read directly:
+
+    flamegraph.pl profile.folded > profile.svg
+"""
+import os
+import sys
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+PROFILE_INTERVAL = 0.005  # Seconds between samples
+
+
+def _label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = PROFILE_INTERVAL, root: str = "load_test"):
+        """
+        Args:
+            interval: Seconds between samples
+            root: Frame every stack starts from, e.g. the process it came from
+        """
+        self.interval = interval
+        self.root = root
+        self.stacks: Counter = Counter()  # Folded stack -> samples
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start sampling; after stop() a new start() adds to the same stacks."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(_label(frame.f_code))
+                    frame = frame.f_back
+                names.append(self.root)
+                stacks.append(";".join(reversed(names)))
+            with self._lock:
+                self.stacks.update(stacks)
+                self.samples += 1
+
+    def merge(self, stacks: Dict[str, int]):
+        """Add stacks sampled elsewhere (e.g. by a worker process)."""
+        with self._lock:
+            self.stacks.update(stacks)
+
+    def top(self, n: int = 10) -> List[Tuple[str, int]]:
+        """The n functions most often on top of a stack (own samples)."""
+        own: Counter = Counter()
+        for stack, count in self.stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        return own.most_common(n)
+
+    def write_folded(self, path: str):
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
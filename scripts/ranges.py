@@ -0,0 +1,205 @@
+"""
+Range and leaseholder tracker for the transactions table.
+
+Every `interval` seconds RangeTracker reads the transactions table's range
+descriptors (range id and replica set per range) plus each range's
+leaseholder, and diffs them against the previous snapshot. A poll costs a
+meta scan and one lease lookup per range, not SHOW RANGES WITH DETAILS'
+per-range span stats. Each difference becomes a change:
+
+- lease-transfer: the range's leaseholder moved, e.g. "r42 n1->n3"
+- replica-move: its replica set changed, e.g. "r42 +n4 -n2"
+- split: a range id appeared (a split, or the table's first ranges)
+- merge: a range id disappeared
+
+The diff walks the snapshot once and skips unchanged ranges with a single
+tuple comparison, and the per-node lease counts are updated from the
+changes rather than recounted, so a poll stays cheap with thousands of
+ranges. Changes go to an optional EventLog (<name>.ranges.csv, one row per
+range) on the caller's time axis, and a one-line summary per poll goes to
+on_change; load_test.py --track-ranges records that as a run event, so
+generate_graphs.py marks it next to the latency it may explain.
+"""
+import os
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.errors
+
+from cluster import dsn_for
+from scenario import EventLog
+
+RANGES_INTERVAL = 10.0
+
+# Cheapest first. From v23.1 on SHOW RANGES only lists leaseholders WITH
+# DETAILS, which also computes span stats for every range (a scan of its
+# data), so the table's range descriptors are read instead and only each
+# lease is looked up; ranges_no_leases lost table_name in v23.1, hence the
+# table_span() bounds. Before v23.1 crdb_internal.ranges has both.
+RANGES_QUERIES = (
+    """WITH span AS (SELECT crdb_internal.table_span('{table}'::REGCLASS::OID::INT8) AS s)
+       SELECT range_id, crdb_internal.lease_holder(start_key), replicas
+       FROM crdb_internal.ranges_no_leases, span
+       WHERE start_key < s[2] AND end_key > s[1]""",
+    "SELECT range_id, lease_holder, replicas FROM crdb_internal.ranges WHERE table_name = '{table}'",
+    "SELECT range_id, lease_holder, replicas FROM [SHOW RANGES FROM TABLE {table} WITH DETAILS]",
+)
+_UNSUPPORTED = (psycopg2.errors.SyntaxError, psycopg2.errors.UndefinedFunction,
+                psycopg2.errors.UndefinedColumn, psycopg2.errors.UndefinedTable)
+
+Snapshot = Dict[int, Tuple[int, Tuple[int, ...]]]  # range_id -> (leaseholder, replicas)
+Change = Tuple[str, int, str]  # (event, range_id, detail)
+
+
+def ranges_path(metrics_path: str) -> str:
+    """Sidecar file the range changes of a metrics export are written to."""
+    return os.path.splitext(metrics_path)[0] + '.ranges.csv'
+
+
+def _nodes(ids) -> str:
+    return ",".join(f"n{node}" for node in ids)
+
+
+def diff_ranges(previous: Snapshot, current: Snapshot) -> List[Change]:
+    """Changes between two snapshots, in range id order."""
+    changes = []
+    for range_id, state in current.items():
+        old = previous.get(range_id)
+        if old == state:
+            continue
+        lease, replicas = state
+        if old is None:
+            changes.append(('split', range_id, f"r{range_id} lease n{lease} on {_nodes(replicas)}"))
+            continue
+        old_lease, old_replicas = old
+        if old_lease != lease:
+            changes.append(('lease-transfer', range_id, f"r{range_id} n{old_lease}->n{lease}"))
+        if old_replicas != replicas:
+            added = sorted(set(replicas) - set(old_replicas))
+            removed = sorted(set(old_replicas) - set(replicas))
+            moves = [f"+n{node}" for node in added] + [f"-n{node}" for node in removed]
+            changes.append(('replica-move', range_id, f"r{range_id} {' '.join(moves)}"))
+    for range_id in previous.keys() - current.keys():
+        changes.append(('merge', range_id, f"r{range_id}"))
+    changes.sort(key=lambda change: change[1])
+    return changes
+
+
+def summarize(changes: List[Change], leases: Counter) -> str:
+    """One line per poll: counts by kind, then the lease count per node."""
+    kinds = Counter(event for event, _, _ in changes)
+    parts = [f"{count} {event}{'s' if count > 1 else ''}" for event, count in sorted(kinds.items())]
+    spread = " ".join(f"n{node}:{count}" for node, count in sorted(leases.items()) if count)
+    return f"{', '.join(parts)} | leases {spread}"
+
+
+class RangeTracker:
+    """
+    Background poller of the table's range layout.
+
+    Connects to the first reachable node of `nodes`, so it keeps going
+    while the node it was using is down.
+    """
+
+    def __init__(self, nodes: List[str], interval: float = RANGES_INTERVAL,
+                 table: str = 'transactions', log: Optional[EventLog] = None,
+                 on_change: Optional[Callable[[str, List[Change]], None]] = None):
+        self.nodes = nodes
+        self.interval = interval
+        self.table = table
+        self.log = log
+        self.on_change = on_change  # Called with (summary, changes) for polls with changes
+        self.snapshot: Snapshot = {}
+        self.leases: Counter = Counter()  # Node id -> ranges it holds the lease for
+        self.changes = 0
+        self.polls = 0
+        self.failures = 0
+        self.conn = None
+        self._query: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.start_time = time.time()
+
+    def start(self, start_time: Optional[float] = None):
+        self.start_time = start_time or time.time()
+        self._thread = threading.Thread(target=self._run, name="range-tracker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self.conn is not None:
+            self.conn.close()
+
+    def _run(self):
+        next_poll = time.time()
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except psycopg2.Error:
+                self.failures += 1
+                if self.conn is not None:
+                    self.conn.close()
+                    self.conn = None  # Reconnect, possibly elsewhere, on the next poll
+            next_poll += self.interval
+            self._stop.wait(max(0.0, next_poll - time.time()))
+
+    def _connect(self):
+        error = None
+        for node in self.nodes:
+            try:
+                conn = psycopg2.connect(dsn_for(node), connect_timeout=2)
+                conn.autocommit = True
+                return conn
+            except psycopg2.OperationalError as e:
+                error = e
+        raise error
+
+    def read(self) -> Snapshot:
+        """The table's current ranges."""
+        if self.conn is None or self.conn.closed:
+            self.conn = self._connect()
+        with self.conn.cursor() as cur:
+            for query in ([self._query] if self._query else RANGES_QUERIES):
+                try:
+                    cur.execute(query.format(table=self.table))
+                except _UNSUPPORTED:
+                    continue
+                self._query = query
+                # A range without a known leaseholder shows as n0
+                return {int(range_id): (int(lease or 0), tuple(sorted(replicas or ())))
+                        for range_id, lease, replicas in cur.fetchall()}
+        raise psycopg2.ProgrammingError("no supported range query for this cluster")
+
+    def poll(self) -> List[Change]:
+        """Take a snapshot and emit what changed since the last one."""
+        now = time.time()
+        current = self.read()
+        self.polls += 1
+        if self.polls == 1:
+            # The first snapshot is the baseline, not a burst of splits
+            self.snapshot = current
+            self.leases = Counter(lease for lease, _ in current.values())
+            return []
+
+        changes = diff_ranges(self.snapshot, current)
+        for event, range_id, _ in changes:
+            if event in ('lease-transfer', 'merge'):
+                self.leases[self.snapshot[range_id][0]] -= 1
+            if event in ('lease-transfer', 'split'):
+                self.leases[current[range_id][0]] += 1
+        self.snapshot = current
+        self.changes += len(changes)
+
+        if changes:
+            if self.log:
+                elapsed = now - self.start_time
+                for event, _, detail in changes:
+                    self.log.write(elapsed, event, detail)
+            if self.on_change:
+                self.on_change(summarize(changes, self.leases), changes)
+        return changes
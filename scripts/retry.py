@@ -0,0 +1,151 @@
+"""
+CockroachDB client-side transaction retries.
+
+Implements the SAVEPOINT cockroach_restart protocol: the transaction body
+runs after `SAVEPOINT cockroach_restart`, and on a retryable error
+(SQLSTATE 40001) the client rolls back to the savepoint, waits a jittered
+exponential backoff and runs the body again, keeping the transaction's
+place in line instead of starting over. RELEASE SAVEPOINT is where
+CockroachDB actually commits, so it can fail with 40001 as well.
+"""
+import random
+import time
+from typing import Callable, Dict, Optional
+
+import psycopg2
+
+RETRYABLE_SQLSTATES = {"40001"}  # serialization_failure / restart transaction
+
+
+class RetryPolicy:
+    def __init__(self, max_retries: int = 10, base_delay_ms: float = 10.0,
+                 max_delay_ms: float = 1000.0):
+        """
+        Args:
+            max_retries: Retry budget per transaction (0 = never retry)
+            base_delay_ms: Backoff cap for the first retry; doubles every retry
+            max_delay_ms: Upper bound on any single backoff
+        """
+        self.max_retries = max_retries
+        self.base_delay_ms = base_delay_ms
+        self.max_delay_ms = max_delay_ms
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds to wait before retry number `attempt` (1-based), full jitter."""
+        cap = min(self.max_delay_ms, self.base_delay_ms * 2 ** (attempt - 1))
+        return random.uniform(0, cap) / 1000.0
+
+
+class RetryStats:
+    """Retry counters for one interval; mergeable like the latency histograms."""
+
+    def __init__(self):
+        self.retries = 0
+        self.retry_cost_ms = 0.0  # Time lost in failed attempts plus backoff
+        self.aborts: Dict[str, int] = {}  # Final failures by SQLSTATE
+
+    def record_retry(self, cost_ms: float):
+        self.retries += 1
+        self.retry_cost_ms += cost_ms
+
+    def record_abort(self, error: Exception):
+        code = sqlstate(error)
+        self.aborts[code] = self.aborts.get(code, 0) + 1
+
+    @property
+    def abort_count(self) -> int:
+        return sum(self.aborts.values())
+
+    def merge(self, other: "RetryStats"):
+        self.retries += other.retries
+        self.retry_cost_ms += other.retry_cost_ms
+        for code, count in other.aborts.items():
+            self.aborts[code] = self.aborts.get(code, 0) + count
+
+    def reset(self):
+        self.retries = 0
+        self.retry_cost_ms = 0.0
+        self.aborts = {}
+
+    def format_aborts(self) -> str:
+        if not self.aborts:
+            return "none"
+        return ", ".join(f"{code}={count}" for code, count in sorted(self.aborts.items()))
+
+
+def sqlstate(error: Exception) -> str:
+    """SQLSTATE of a database error, or the exception class name for anything else."""
+    return getattr(error, "pgcode", None) or type(error).__name__
+
+
+def is_retryable(error: Exception) -> bool:
+    return getattr(error, "pgcode", None) in RETRYABLE_SQLSTATES
+
+
+def _rollback_quietly(conn):
+    try:
+        conn.rollback()
+    except psycopg2.Error:
+        pass  # Connection already gone; the original error is what matters
+
+
+def _commit(conn, release: bool, timer: Optional[Callable[[str, int], None]]):
+    """RELEASE (when using the savepoint protocol) and COMMIT, timed as 'commit'."""
+    start = time.perf_counter_ns()
+    try:
+        if release:
+            with conn.cursor() as cur:
+                cur.execute("RELEASE SAVEPOINT cockroach_restart")
+        conn.commit()
+    finally:
+        if timer is not None:
+            timer("commit", time.perf_counter_ns() - start)
+
+
+def run_in_transaction(conn, body: Callable, policy: RetryPolicy,
+                       stats: Optional[RetryStats] = None,
+                       timer: Optional[Callable[[str, int], None]] = None):
+    """
+    Run body(conn) in one transaction and commit, retrying on 40001.
+
+    conn must not be in autocommit mode. On a non-retryable error, or once
+    the retry budget is spent, the transaction is rolled back and the error
+    re-raised for the caller to count. If given, timer("commit", ns) gets
+    the duration of every commit attempt.
+
+    Returns:
+        Whatever body returned on the attempt that committed
+    """
+    if policy.max_retries <= 0:
+        try:
+            result = body(conn)
+            _commit(conn, False, timer)
+            return result
+        except Exception:
+            _rollback_quietly(conn)
+            raise
+
+    attempt = 0
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SAVEPOINT cockroach_restart")
+
+        while True:
+            attempt_start = time.perf_counter()
+            try:
+                result = body(conn)
+                _commit(conn, True, timer)
+                return result
+            except psycopg2.Error as e:
+                if not is_retryable(e) or attempt >= policy.max_retries:
+                    raise
+                with conn.cursor() as cur:
+                    cur.execute("ROLLBACK TO SAVEPOINT cockroach_restart")
+
+                attempt += 1
+                time.sleep(policy.backoff(attempt))
+                if stats is not None:
+                    stats.record_retry((time.perf_counter() - attempt_start) * 1000)
+    except Exception:
+        _rollback_quietly(conn)
+        raise
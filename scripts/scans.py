@@ -0,0 +1,148 @@
+"""
+Streaming large scans for the bigscan operation.
+
+A bigscan reads a large range of `transactions`: a `scan_keys` wide range
+of user_ids, every row created in the last `scan_window`, or the whole
+table (`scan_by`: user, time or table). How the rows reach the client is
+the `scan_method`:
+
+- cursor: a named (server-side) cursor, fetched `itersize` rows at a
+  time, so the client only ever holds one batch
+- keyset: ORDER BY id LIMIT `itersize` pages, each starting after the
+  last id of the one before
+- fetchall: one plain SELECT buffered whole on the client, the baseline
+  the other two are measured against
+
+Every scan reports its rows, its time to first row and its duration;
+ScanStats collects them like RetryStats collects retries, and the client's
+peak RSS shows what each method costs in memory.
+"""
+import sys
+import time
+from typing import Dict, Tuple
+
+from histogram import LatencyHistogram
+
+try:
+    import resource  # Not on Windows
+except ImportError:
+    resource = None
+
+SCAN_BY = ('user', 'time', 'table')
+SCAN_METHODS = ('cursor', 'keyset', 'fetchall')
+
+_COLUMNS = "SELECT id, user_id, amount, created_at FROM transactions"
+_PREDICATES = {
+    'user': "user_id >= %s AND user_id < %s",
+    'time': "created_at > now() - %s::INTERVAL",
+    'table': "true",
+}
+
+
+def scan_sql(scan_by: str, method: str) -> Dict[str, str]:
+    """The statements a bigscan runs, by name ('bigscan', and 'bigscan_next' for keyset)."""
+    where = f"{_COLUMNS} WHERE {_PREDICATES[scan_by]}"
+    if method == 'keyset':
+        return {
+            'bigscan': f"{where} ORDER BY id LIMIT %s;",
+            'bigscan_next': f"{where} AND id > %s ORDER BY id LIMIT %s;",
+        }
+    return {'bigscan': f"{where};"}
+
+
+def scan_params(scan_by: str, key: int, width: int, window: str) -> tuple:
+    """Parameters of the scan predicate for a scan starting at user_id `key`."""
+    if scan_by == 'user':
+        return (key, key + width)
+    if scan_by == 'time':
+        return (window,)
+    return ()
+
+
+def stream_scan(run, method: str, params: tuple, itersize: int) -> Tuple[int, int, int]:
+    """
+    Run one scan through run(name, params[, itersize]) and consume its rows.
+
+    Returns:
+        (rows, nanoseconds to the first row, nanoseconds for the whole scan);
+        the first row time is the whole scan when no rows came back
+    """
+    start = time.perf_counter_ns()
+    first = None
+    rows = 0
+    if method == 'cursor':
+        cur = run('bigscan', params, itersize)
+        try:
+            while True:
+                batch = cur.fetchmany(itersize)
+                if not batch:
+                    break
+                if first is None:
+                    first = time.perf_counter_ns()
+                rows += len(batch)
+        finally:
+            cur.close()
+    elif method == 'keyset':
+        page = run('bigscan', params + (itersize,)).fetchall()
+        last_id = None
+        while page:
+            if first is None:
+                first = time.perf_counter_ns()
+            rows += len(page)
+            # A short page is the end; so is a page that doesn't move past the last one
+            if len(page) < itersize or page[-1][0] == last_id:
+                break
+            last_id = page[-1][0]
+            page = run('bigscan_next', params + (last_id, itersize)).fetchall()
+    else:
+        rows = len(run('bigscan', params).fetchall())
+        first = time.perf_counter_ns()
+    end = time.perf_counter_ns()
+    return rows, (first or end) - start, end - start
+
+
+class ScanStats:
+    """Bigscan counters for one interval; mergeable like the latency histograms."""
+
+    def __init__(self, significant_figures: int = 3):
+        self.scans = 0
+        self.rows = 0
+        self.scan_ns = 0  # Summed duration of the scans
+        self.first_row = LatencyHistogram(significant_figures=significant_figures)
+
+    def record(self, rows: int, first_row_ns: int, scan_ns: int):
+        self.scans += 1
+        self.rows += rows
+        self.scan_ns += scan_ns
+        self.first_row.record_us(first_row_ns // 1000)
+
+    def merge(self, other: "ScanStats"):
+        self.scans += other.scans
+        self.rows += other.rows
+        self.scan_ns += other.scan_ns
+        self.first_row.merge(other.first_row)
+
+    def copy(self) -> "ScanStats":
+        stats = ScanStats(self.first_row.significant_figures)
+        stats.merge(self)
+        return stats
+
+    def reset(self):
+        self.scans = 0
+        self.rows = 0
+        self.scan_ns = 0
+        self.first_row.reset()
+
+    @property
+    def rows_per_scan_sec(self) -> float:
+        """Streaming rate of a single scan: rows over the time spent scanning."""
+        return self.rows / (self.scan_ns / 1e9) if self.scan_ns else 0.0
+
+
+def peak_rss_mb() -> float:
+    """This process's peak resident set size in MB (0 where it can't be read)."""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
@@ -0,0 +1,216 @@
+"""
+Scripted experiment timelines for load_test.py --scenario.
+
+A scenario is a list of timed actions, one per line or separated by ';':
+
+    t=30s  add_index
+    t=90s  stop-node roach3
+    t=150s start-node roach3
+    t=200s shell docker-compose up -d roach4 roach5
+
+Times are seconds from the start of the load test (suffixes s, m, h).
+"run" and "action" before the action name are ignored, and `start`/`stop`
+are short for `start-node`/`stop-node`. Each action runs on its own thread
+so a long one (an index build) doesn't hold up the rest of the timeline,
+and its start and end are reported as timestamped events.
+
+Actions are plain callables taking the remaining words as arguments. The
+built-ins shell out to docker, except `add_index [NAME:COLS]...`, which
+follows the build's schema-change job and reports its phases as events.
+An action with an `on_timeline` attribute is also passed the run's
+start_time, on_event and nodes keywords. A Python file passed with --actions can
+define an ACTIONS dict that adds to or replaces them, e.g. a local stub
+for machines without docker.
+"""
+import csv
+import importlib.util
+import os
+import re
+import shlex
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+EVENT_COLUMNS = ['time_elapsed', 'event', 'detail']
+
+_TIME = re.compile(r"^(?:t=)?(\d+(?:\.\d+)?)([smh]?)$")
+_UNITS = {'': 1.0, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+_FILLER = ('run', 'action')
+_ALIASES = {'start': 'start-node', 'stop': 'stop-node', 'kill': 'kill-node'}
+
+
+def _docker(*args: str):
+    subprocess.run(['docker', *args], check=True)
+
+
+def _add_index(*args: str, start_time: Optional[float] = None,
+               on_event: Optional[Callable[[str, str], None]] = None,
+               nodes: Optional[List[str]] = None):
+    from add_index import DEFAULT_INDEX, DSN_APP, build_indexes, parse_index
+    from cluster import dsn_for
+    build_indexes([parse_index(arg) for arg in args] or [DEFAULT_INDEX], start_time, on_event,
+                  dsn=dsn_for(nodes[0]) if nodes else DSN_APP)
+
+
+_add_index.on_timeline = True
+
+
+def _shell(*args: str):
+    subprocess.run(" ".join(args), shell=True, check=True)
+
+
+ACTIONS: Dict[str, Callable] = {
+    'add_index': _add_index,
+    'stop-node': lambda name: _docker('stop', name),
+    'start-node': lambda name: _docker('start', name),
+    'kill-node': lambda name: _docker('kill', name),
+    'shell': _shell,
+}
+
+
+def load_actions(path: str) -> Dict[str, Callable]:
+    """Built-in actions updated with the ACTIONS dict of the Python file at path."""
+    spec = importlib.util.spec_from_file_location("scenario_actions", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    actions = dict(ACTIONS)
+    actions.update(getattr(module, 'ACTIONS', {}))
+    return actions
+
+
+def parse_scenario(text: str, actions: Dict[str, Callable] = ACTIONS) -> List[Tuple[float, str, List[str]]]:
+    """
+    Parse scenario text into (seconds, action, args) steps sorted by time.
+
+    Raises ValueError for malformed times and unknown actions.
+    """
+    steps = []
+    for line in text.splitlines():
+        for entry in line.split('#', 1)[0].split(';'):
+            words = shlex.split(entry)
+            if not words:
+                continue
+
+            match = _TIME.match(words[0])
+            if not match:
+                raise ValueError(f"Bad time '{words[0]}' in '{entry.strip()}' (expected e.g. t=30s)")
+            at = float(match.group(1)) * _UNITS[match.group(2)]
+
+            words = words[1:]
+            while words and words[0] in _FILLER:
+                words = words[1:]
+            if not words:
+                raise ValueError(f"No action in '{entry.strip()}'")
+            name = _ALIASES.get(words[0], words[0])
+            if name not in actions:
+                raise ValueError(f"Unknown action '{words[0]}' (choose from {', '.join(sorted(actions))})")
+            steps.append((at, name, words[1:]))
+
+    return sorted(steps, key=lambda step: step[0])
+
+
+def read_scenario(path_or_text: str, actions: Dict[str, Callable] = ACTIONS):
+    """Parse a scenario file, or the scenario text itself if no such file exists."""
+    try:
+        with open(path_or_text) as f:
+            text = f.read()
+    except OSError:
+        text = path_or_text
+    return parse_scenario(text, actions)
+
+
+def events_path(metrics_path: str) -> str:
+    """Sidecar file the events of a metrics export are written to."""
+    return os.path.splitext(metrics_path)[0] + '.events.csv'
+
+
+class EventLog:
+    """Append-only CSV of (time_elapsed, event, detail); flushed per event."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(EVENT_COLUMNS)
+        self._file.flush()
+
+    def write(self, elapsed: float, event: str, detail: str = ""):
+        with self._lock:
+            if self._file.closed:
+                return  # An action that outlived the run
+            self._writer.writerow([f"{elapsed:.3f}", event, detail])
+            self._file.flush()
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_events(path: str) -> List[Tuple[float, str, str]]:
+    with open(path, newline='') as f:
+        return [(float(row['time_elapsed']), row['event'], row['detail'])
+                for row in csv.DictReader(f)]
+
+
+class ScenarioRunner:
+    """Fires a scenario's actions on schedule relative to a start time."""
+
+    def __init__(self, steps: List[Tuple[float, str, List[str]]],
+                 actions: Dict[str, Callable] = ACTIONS,
+                 on_event: Optional[Callable[[str, str], None]] = None,
+                 nodes: Optional[List[str]] = None):
+        """
+        Args:
+            steps: Output of parse_scenario
+            actions: Action name -> callable(*args)
+            on_event: Called with (event, detail) when an action starts,
+                finishes or fails
+            nodes: The run's gateways ("host:port"), for actions that
+                connect to the cluster
+        """
+        self.steps = steps
+        self.actions = actions
+        self.on_event = on_event or (lambda event, detail: None)
+        self.nodes = nodes
+        self.start_time = time.time()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, start_time: Optional[float] = None):
+        self.start_time = start_time = start_time or time.time()
+        self._thread = threading.Thread(target=self._run, args=(start_time,),
+                                        name="scenario", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Cancel actions not yet due; ones already running are left to finish."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self, start_time: float):
+        for at, name, args in self.steps:
+            if self._stop.wait(max(0.0, start_time + at - time.time())):
+                return
+            threading.Thread(target=self._fire, args=(name, args),
+                             name=f"scenario-{name}", daemon=True).start()
+
+    def _fire(self, name: str, args: List[str]):
+        label = " ".join([name, *args])
+        self.on_event(label, "start")
+        started = time.time()
+        action = self.actions[name]
+        try:
+            if getattr(action, 'on_timeline', False):
+                action(*args, start_time=self.start_time, on_event=self.on_event,
+                       nodes=self.nodes)
+            else:
+                action(*args)
+        except Exception as e:
+            self.on_event(label, f"failed after {time.time() - started:.1f}s: {e}")
+        else:
+            self.on_event(label, f"done in {time.time() - started:.1f}s")
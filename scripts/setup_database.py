@@ -1,19 +1,246 @@
 """
 Setup script for CockroachDB cluster study.
 Creates the database and initial schema.
+
+Large datasets (--rows 10000000) are seeded in parallel: the row space is
+cut into chunks that a pool of worker processes loads with batched
+multi-row INSERTs (or COPY), each worker holding one connection to one of
+the --nodes gateways.
+
+--schema picks how the table is keyed and indexed:
+
+    serial        id SERIAL primary key (the original study schema)
+    uuid          id UUID DEFAULT gen_random_uuid(), spreading inserts
+                  over ranges instead of appending to the last one
+    hash-sharded  uuid, plus a hash-sharded index on created_at so the
+                  time-ordered index doesn't become the next hotspot
+    covering      uuid, plus (user_id, created_at DESC) STORING (amount),
+                  which answers the workloads' per-user reads on its own
 """
+import argparse
+import io
+import multiprocessing
+import time
+from typing import List, Optional
+
 import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extras import execute_values
+
+from cluster import DEFAULT_NODES, dsn_for, parse_nodes
+
+MIN_BATCH = 100
+MAX_BATCH = 20_000
+TARGET_BATCH_SECONDS = (0.1, 0.5)  # Grow batches below this window, shrink above
+MAX_CHUNK_ROWS = 100_000
+COUNT_ROWS_LIMIT = 1_000_000  # Skip the final COUNT(*) above this many rows
+PROGRESS_INTERVAL = 2.0
+
+INSERT_SQL = "INSERT INTO transactions (user_id, amount, description) VALUES %s"
+COPY_SQL = "COPY transactions (user_id, amount, description) FROM STDIN"
+
+_TABLE = """
+    CREATE TABLE {if_not_exists}transactions (
+        id {id_column},
+        user_id INT NOT NULL,
+        amount DECIMAL(10, 2) NOT NULL,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT NOW()
+    );
+"""
+SERIAL_ID = "SERIAL PRIMARY KEY"
+UUID_ID = "UUID PRIMARY KEY DEFAULT gen_random_uuid()"
+
+# Schema variant -> (id column, extra DDL run after CREATE TABLE)
+SCHEMAS = {
+    'serial': (SERIAL_ID, []),
+    'uuid': (UUID_ID, []),
+    'hash-sharded': (UUID_ID, [
+        "CREATE INDEX IF NOT EXISTS idx_created_at_sharded ON transactions (created_at) USING HASH;",
+    ]),
+    'covering': (UUID_ID, [
+        "CREATE INDEX IF NOT EXISTS idx_user_created_covering "
+        "ON transactions (user_id, created_at DESC) STORING (amount);",
+    ]),
+}
+DEFAULT_SCHEMA = 'serial'
+# Variants with an index led by user_id, which bounded-staleness reads need
+USER_INDEX_SCHEMAS = ('covering',)
+
+_USER_INDEX_QUERY = """
+    SELECT count(*) FROM [SHOW INDEXES FROM transactions]
+    WHERE column_name = 'user_id' AND seq_in_index = 1;
+"""
+
+
+def parse_schemas(value: str) -> List[str]:
+    """Parse "uuid,covering" (or "all") into schema variant names."""
+    if value.strip() == 'all':
+        return list(SCHEMAS)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCHEMAS]
+    if not names or unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown schema '{','.join(unknown) or value}' (choose from {', '.join(SCHEMAS)} or all)")
+    return names
+
+
+def create_schema(cur, schema: str = DEFAULT_SCHEMA, if_not_exists: bool = False):
+    """Create transactions as the given schema variant, plus its indexes."""
+    id_column, indexes = SCHEMAS[schema]
+    cur.execute(_TABLE.format(if_not_exists="IF NOT EXISTS " if if_not_exists else "",
+                              id_column=id_column))
+    for ddl in indexes:
+        cur.execute(ddl)
+
+
+def has_user_index(conn) -> bool:
+    """
+    Whether transactions has an index led by user_id. Without one the
+    workloads' per-user reads scan the whole table, which a
+    bounded-staleness read (with_max_staleness) refuses: it only runs
+    lookups confined to a single range.
+    """
+    with conn.cursor() as cur:
+        cur.execute(_USER_INDEX_QUERY)
+        return cur.fetchone()[0] > 0
+
+
+# Per-process state of the seeding workers
+_seed_conn = None
+_seed_method = "insert"
+_seed_users = 10
+_seed_batch = None
+
+
+def seed_row(i: int, users: int) -> tuple:
+    """Deterministic contents of seed row i (the first 100 match the original setup)."""
+    return (i % users, round(10.50 * (i % 10_000 + 1), 2), f"Initial transaction {i}")
+
+
+def _init_seeder(nodes: List[str], counter, method: str, users: int, batch_size: Optional[int]):
+    """Pool initializer: give each worker process its own gateway connection."""
+    global _seed_conn, _seed_method, _seed_users, _seed_batch
+
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
 
-DSN_ADMIN = "postgresql://root@localhost:26257/defaultdb?sslmode=disable"
-DSN_APP = "postgresql://root@localhost:26257/study_db?sslmode=disable"
+    _seed_conn = psycopg2.connect(dsn_for(nodes[index % len(nodes)]))
+    _seed_method = method
+    _seed_users = users
+    _seed_batch = batch_size
 
-def setup_database():
-    """Create database and schema for the study."""
+
+def _write_batch(cur, first: int, last: int):
+    rows = [seed_row(i, _seed_users) for i in range(first, last)]
+    if _seed_method == "copy":
+        buf = io.StringIO()
+        for user_id, amount, description in rows:
+            buf.write(f"{user_id}\t{amount}\t{description}\n")
+        buf.seek(0)
+        cur.copy_expert(COPY_SQL, buf)
+    else:
+        execute_values(cur, INSERT_SQL, rows, page_size=len(rows))
+
+
+def _seed_chunk(chunk: tuple) -> tuple:
+    """
+    Load rows [first, last) in committed batches.
+
+    Without a fixed --batch-size, the batch grows or shrinks so each commit
+    takes roughly TARGET_BATCH_SECONDS: big enough to amortize the consensus
+    round trip, small enough to avoid giant transactions and retries.
+    Returns (rows, seconds, final batch size).
+    """
+    global _seed_batch
+
+    first, last = chunk
+    started = time.time()
+    batch = _seed_batch or MIN_BATCH * 5
+    position = first
+
+    while position < last:
+        end = min(position + batch, last)
+        for attempt in range(5):
+            t0 = time.time()
+            try:
+                with _seed_conn.cursor() as cur:
+                    _write_batch(cur, position, end)
+                _seed_conn.commit()
+                break
+            except psycopg2.errors.SerializationFailure:
+                _seed_conn.rollback()
+                time.sleep(0.05 * 2 ** attempt)
+        else:
+            raise RuntimeError(f"Batch {position}-{end} kept failing with serialization errors")
+
+        took = time.time() - t0
+        position = end
+        if _seed_batch is None:
+            if took < TARGET_BATCH_SECONDS[0]:
+                batch = min(batch * 2, MAX_BATCH)
+            elif took > TARGET_BATCH_SECONDS[1]:
+                batch = max(batch // 2, MIN_BATCH)
+
+    return last - first, time.time() - started, batch
+
+
+def seed_rows(rows: int, users: int = 10, nodes: Optional[List[str]] = None,
+              connections: int = 4, batch_size: Optional[int] = None,
+              method: str = "insert") -> float:
+    """
+    Seed `rows` rows into transactions in parallel.
+
+    Args:
+        rows: Number of rows to insert
+        users: Number of distinct user_ids to spread rows over
+        nodes: Gateways ("host:port") to spread connections over
+        connections: Parallel loader processes (one connection each)
+        batch_size: Fixed rows per commit (None = size automatically)
+        method: "insert" (multi-row INSERT) or "copy" (COPY FROM STDIN)
+
+    Returns:
+        Achieved rows/sec
+    """
+    nodes = nodes or DEFAULT_NODES
+    connections = max(1, min(connections, rows))
+    chunk_rows = max(1, min(MAX_CHUNK_ROWS, -(-rows // (connections * 4))))
+    chunks = [(i, min(i + chunk_rows, rows)) for i in range(0, rows, chunk_rows)]
+
+    print(f"Seeding {rows:,} rows over {connections} connection(s) "
+          f"to {len(nodes)} node(s) using {method.upper()}...")
+
+    counter = multiprocessing.Value('i', 0)
+    done = 0
+    start = time.time()
+    last_progress = start
+    with multiprocessing.Pool(connections, initializer=_init_seeder,
+                              initargs=(nodes, counter, method, users, batch_size)) as pool:
+        for loaded, _, batch in pool.imap_unordered(_seed_chunk, chunks):
+            done += loaded
+            now = time.time()
+            if now - last_progress >= PROGRESS_INTERVAL and done < rows:
+                rate = done / (now - start)
+                print(f"  {done:>13,} / {rows:,} rows ({100.0 * done / rows:5.1f}%) | "
+                      f"{rate:,.0f} rows/sec | batch {batch}")
+                last_progress = now
+
+    elapsed = time.time() - start
+    rate = rows / elapsed if elapsed > 0 else 0.0
+    print(f"✓ Inserted {rows:,} initial rows in {elapsed:.1f}s ({rate:,.0f} rows/sec)")
+    return rate
+
+
+def setup_database(rows: int = 100, users: int = 10, nodes: Optional[List[str]] = None,
+                   connections: int = 4, batch_size: Optional[int] = None,
+                   method: str = "insert", schema: str = DEFAULT_SCHEMA):
+    """Create database and schema variant for the study, then seed it (see seed_rows)."""
+    nodes = nodes or DEFAULT_NODES
     try:
         # Create database
-        print("Connecting to CockroachDB...")
-        conn_admin = psycopg2.connect(DSN_ADMIN)
+        print(f"Connecting to CockroachDB at {nodes[0]}...")
+        conn_admin = psycopg2.connect(dsn_for(nodes[0], "defaultdb"))
         conn_admin.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
 
         with conn_admin.cursor() as cur:
@@ -23,7 +250,7 @@ def setup_database():
         conn_admin.close()
 
         # Create table
-        conn_app = psycopg2.connect(DSN_APP)
+        conn_app = psycopg2.connect(dsn_for(nodes[0]))
         conn_app.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
 
         with conn_app.cursor() as cur:
@@ -31,30 +258,19 @@ def setup_database():
             cur.execute("DROP TABLE IF EXISTS transactions CASCADE;")
 
             # Create transactions table
-            cur.execute("""
-                CREATE TABLE transactions (
-                    id SERIAL PRIMARY KEY,
-                    user_id INT NOT NULL,
-                    amount DECIMAL(10, 2) NOT NULL,
-                    description TEXT,
-                    created_at TIMESTAMP DEFAULT NOW()
-                );
-            """)
-            print("✓ Table 'transactions' created")
-
-            # Insert some initial data
-            for i in range(100):
-                cur.execute("""
-                    INSERT INTO transactions (user_id, amount, description)
-                    VALUES (%s, %s, %s);
-                """, (i % 10, round(10.50 * (i + 1), 2), f"Initial transaction {i}"))
-
-            print("✓ Inserted 100 initial rows")
-
-            # Show table info
-            cur.execute("SELECT COUNT(*) FROM transactions;")
-            count = cur.fetchone()[0]
-            print(f"✓ Total rows in transactions: {count}")
+            create_schema(cur, schema)
+            print(f"✓ Table 'transactions' created ({schema} schema)")
+
+        # Insert the initial data
+        seed_rows(rows, users=users, nodes=nodes, connections=connections,
+                  batch_size=batch_size, method=method)
+
+        with conn_app.cursor() as cur:
+            # Show table info (a full COUNT(*) is too slow on big seeds)
+            if rows <= COUNT_ROWS_LIMIT:
+                cur.execute("SELECT COUNT(*) FROM transactions;")
+                count = cur.fetchone()[0]
+                print(f"✓ Total rows in transactions: {count}")
 
         conn_app.close()
         print("\n✓ Setup complete! Ready to run load tests.")
@@ -63,5 +279,38 @@ def setup_database():
         print(f"✗ Setup failed: {e}")
         raise
 
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Create study_db.transactions and seed it.",
+        epilog="Example: python setup_database.py --rows 10000000 --users 100000 "
+               "--nodes local --connections 16",
+    )
+    parser.add_argument("--rows", type=int, default=100,
+                        help="Seed rows to insert (default: 100)")
+    parser.add_argument("--users", type=int, default=10,
+                        help="Distinct user_ids to spread rows over (default: 10)")
+    parser.add_argument("--nodes", type=parse_nodes, default=None,
+                        help="Comma-separated gateways to load through, e.g. "
+                             "localhost:26257,localhost:26258, or 'local' for all five "
+                             "(default: localhost:26257)")
+    parser.add_argument("--connections", type=int, default=4,
+                        help="Parallel loader processes, one connection each (default: 4)")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="Rows per committed batch (default: sized automatically)")
+    parser.add_argument("--schema", choices=list(SCHEMAS), default=DEFAULT_SCHEMA,
+                        help=f"Key and index variant (default: {DEFAULT_SCHEMA})")
+    parser.add_argument("--method", choices=("insert", "copy"), default="insert",
+                        help="Multi-row INSERT or COPY FROM STDIN (default: insert)")
+    args = parser.parse_args()
+
+    if args.rows < 0 or args.users < 1 or args.connections < 1:
+        parser.error("--rows must be >= 0, --users and --connections >= 1")
+
+    setup_database(rows=args.rows, users=args.users, nodes=args.nodes,
+                   connections=args.connections, batch_size=args.batch_size,
+                   method=args.method, schema=args.schema)
+
+
 if __name__ == "__main__":
-    setup_database()
+    main()
@@ -0,0 +1,222 @@
+"""
+Per-transaction event log for load_test.py --txlog.
+
+The interval reports and exports keep histograms, which is what makes them
+cheap, but it also means a latency spike can never be re-sliced finer than
+the interval it landed in. The transaction log keeps every transaction as
+one fixed-width binary record instead:
+
+    start_ns    int64   wall-clock start, ns since the epoch
+    latency_us  uint32  whole transaction, retries included
+    <phase>     uint32  one column per phase (statement or commit), µs
+    gateway     uint8   index into the header's gateway list (255: unknown)
+    outcome     uint8   OUTCOME_OK, OUTCOME_SQL or OUTCOME_CLIENT
+    retries     uint8   40001 retries before the outcome (capped at 255)
+    worker      uint16  worker id
+    sqlstate    5 bytes SQLSTATE of a failure, empty otherwise
+
+A record is ~40 bytes for the built-in workloads, so ten million
+transactions take ~400 MB; TxLogWriter stops at `max_mb` and counts what
+it dropped. Each worker packs its records into a preallocated buffer
+(TxRecorder, one struct.pack_into per transaction) that travels to the
+parent with the worker's samples, and the parent appends the buffers to
+the file on a background thread.
+
+After a JSON header the file is nothing but records, so
+analyze_txlog.py memory-maps it as a NumPy structured array.
+"""
+import json
+import os
+import queue
+import struct
+import threading
+from typing import List, Optional, Sequence
+
+TXLOG_MAGIC = b"CRDBTXL1"
+TXLOG_BUFFER = 16384  # Records per worker buffer (more spill into extra chunks)
+TXLOG_MAX_MB = 1024
+
+OUTCOME_OK = 0
+OUTCOME_SQL = 1  # Failed with a SQLSTATE
+OUTCOME_CLIENT = 2  # Failed without one, e.g. a lost connection
+NO_GATEWAY = 255
+
+_UINT32 = 2 ** 32 - 1
+_TAIL = struct.Struct("<BBBH5s")  # gateway, outcome, retries, worker, sqlstate
+_STOP = object()
+
+
+def txlog_phases(workload) -> List[str]:
+    """Phase columns of a Workload: its statements' timer labels, then commit."""
+    return sorted({workload.phase_names.get(name, name) for name in workload.statements}) + ['commit']
+
+
+def record_format(phases: Sequence[str]) -> str:
+    """struct format of one record with these phase columns."""
+    return "<qI" + "I" * len(phases) + "BBBH5s"
+
+
+def record_fields(phases: Sequence[str]) -> List[List[str]]:
+    """(name, NumPy type) of every record field, in order, for the header."""
+    return ([['start_ns', '<i8'], ['latency_us', '<u4']] +
+            [[f"phase_{phase}", '<u4'] for phase in phases] +
+            [['gateway', 'u1'], ['outcome', 'u1'], ['retries', 'u1'], ['worker', '<u2'],
+             ['sqlstate', 'S5']])
+
+
+class TxRecorder:
+    """
+    Worker side: packs records into a preallocated buffer until take() hands it off.
+
+    The tester adds each phase's µs straight into phase_us[slots[phase]] (a
+    list zeroed in place, never replaced) and calls set_gateway() when it
+    connects, so record(), the success path, is a single pack_into of the
+    integers it is given and a prebuilt tail of the constant fields. A full
+    buffer or an out-of-range field only costs anything once pack_into
+    rejects it.
+    """
+
+    def __init__(self, phases: Sequence[str], gateways: Sequence[str], worker_id: int = 0,
+                 capacity: int = TXLOG_BUFFER):
+        self.worker_id = worker_id & 0xFFFF
+        self.slots = {phase: i for i, phase in enumerate(phases)}
+        self.gateways = {node: i for i, node in enumerate(gateways[:NO_GATEWAY])}
+        self.phase_us = [0] * len(phases)  # Phases of the transaction in progress
+        self._no_phases = (0,) * len(phases)
+        self._gateway_index = NO_GATEWAY
+        self._ok_tail = self._tail(OUTCOME_OK, 0, b"")  # gateway..sqlstate of a first-try success
+        # Same bytes as record_format, with the trailing fields prepacked
+        self._pack = struct.Struct("<qI" + "I" * len(phases) + f"{_TAIL.size}s").pack_into
+        self.record_size = struct.calcsize(record_format(phases))
+        self._buffer = bytearray(self.record_size * capacity)
+        self._end = len(self._buffer)
+        self._offset = 0
+        self._chunks: List[bytes] = []  # Full buffers not yet taken
+
+    def set_gateway(self, gateway: Optional[str]):
+        """The node the following transactions run on."""
+        self._gateway_index = self.gateways.get(gateway, NO_GATEWAY)
+        self._ok_tail = self._tail(OUTCOME_OK, 0, b"")
+
+    def _tail(self, outcome: int, retries: int, code: bytes) -> bytes:
+        return _TAIL.pack(self._gateway_index, outcome, retries if retries < 255 else 255,
+                          self.worker_id, code)
+
+    def record(self, start_ns: int, latency_us: int, retries: int):
+        """Pack one successful transaction and start the phases of the next one afresh."""
+        phase_us = self.phase_us
+        tail = self._tail(OUTCOME_OK, retries, b"") if retries else self._ok_tail
+        try:
+            self._pack(self._buffer, self._offset, start_ns, latency_us, *phase_us, tail)
+        except struct.error:  # The buffer is full, or a field is out of range
+            self._pack_checked(start_ns, latency_us, tail)
+        self._offset += self.record_size
+        phase_us[:] = self._no_phases
+
+    def record_error(self, start_ns: int, latency_us: int, retries: int, error: Exception):
+        """Pack one failed transaction, with the SQLSTATE of `error` if it has one."""
+        code = getattr(error, "pgcode", None)
+        self._pack_checked(start_ns, latency_us,
+                           self._tail(OUTCOME_SQL if code else OUTCOME_CLIENT, retries,
+                                      code.encode() if code else b""))
+        self._offset += self.record_size
+        self.phase_us[:] = self._no_phases
+
+    def _pack_checked(self, start_ns: int, latency_us: int, tail: bytes):
+        if self._offset == self._end:
+            self._chunks.append(bytes(self._buffer))
+            self._offset = 0
+        self._pack(self._buffer, self._offset, start_ns, min(max(0, latency_us), _UINT32),
+                   *(min(us, _UINT32) for us in self.phase_us), tail)
+
+    def take(self) -> bytes:
+        """Everything recorded since the last take(), as whole records."""
+        data = b"".join(self._chunks) + bytes(memoryview(self._buffer)[:self._offset])
+        self._chunks = []
+        self._offset = 0
+        return data
+
+
+class TxLogWriter:
+    """
+    Parent side: appends the workers' record buffers to one file.
+
+    Writes happen on a background thread, like metrics_export's writers,
+    so the sample loop never waits on disk.
+    """
+
+    def __init__(self, path: str, phases: Sequence[str], gateways: Sequence[str],
+                 max_mb: float = TXLOG_MAX_MB):
+        self.path = path
+        self.phases = list(phases)
+        self.gateways = list(gateways)
+        self.record_size = struct.calcsize(record_format(phases))
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.records = 0
+        self.dropped = 0  # Records past max_mb
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._file = None
+        self._thread: Optional[threading.Thread] = None
+
+    def layout(self) -> dict:
+        """TxRecorder arguments every worker must share with this log."""
+        return {'phases': self.phases, 'gateways': self.gateways}
+
+    def start(self, start_time: float, header: Optional[dict] = None):
+        """Open the file; record times are read relative to start_time (the run's start)."""
+        info = dict(header or {}, start_ns=int(start_time * 1e9), phases=self.phases,
+                    gateways=self.gateways, record_size=self.record_size,
+                    fields=record_fields(self.phases))
+        encoded = json.dumps(info).encode()
+        self._file = open(self.path, 'wb')
+        self._file.write(TXLOG_MAGIC + struct.pack('<I', len(encoded)) + encoded)
+        self._thread = threading.Thread(target=self._run, name="txlog-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, data: bytes):
+        """Queue a worker's records. Never blocks on I/O."""
+        count = len(data) // self.record_size
+        room = max(0, self.max_bytes // self.record_size - self.records)
+        if count > room:
+            self.dropped += count - room
+            count = room
+            data = data[:count * self.record_size]
+        if count:
+            self.records += count
+            self._queue.put(data)
+
+    def close(self):
+        """Write everything still queued and close the file."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    @property
+    def size_mb(self) -> float:
+        return self.records * self.record_size / (1024 * 1024)
+
+    def _run(self):
+        try:
+            while True:
+                data = self._queue.get()
+                if data is _STOP:
+                    break
+                self._file.write(data)
+        finally:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+def read_header(path: str) -> dict:
+    """The JSON header of a transaction log, with 'offset' set to where records start."""
+    with open(path, 'rb') as f:
+        magic = f.read(len(TXLOG_MAGIC))
+        if magic != TXLOG_MAGIC:
+            raise ValueError(f"{path} is not a transaction log")
+        (length,) = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(length))
+    header['offset'] = len(TXLOG_MAGIC) + 4 + length
+    return header
@@ -0,0 +1,498 @@
+"""
+Workload definitions for load_test.py.
+
+A workload is plain data: which operations a transaction runs against the
+`transactions` table and how their keys (user_ids) are chosen. Either a
+fixed `sequence` of operations runs in every transaction, or
+`ops_per_txn` operations are drawn from a weighted `mix`:
+
+    {"mix": {"read": 0.95, "update": 0.05}, "distribution": "zipfian",
+     "keys": 10000, "theta": 0.99}
+
+Operations: insert, read, update, scan, rmw (read-modify-write), bigscan.
+Distributions: sequential, uniform, zipfian, latest, hotspot.
+
+Inserts can be batched: each insert operation writes `batch_size` rows per
+multi-row INSERT statement, `batch_statements` times.
+
+Reads (read and scan operations) can trade freshness for latency with
+`read_consistency`: "strong" reads go to the leaseholder, "follower" reads
+use AS OF SYSTEM TIME follower_read_timestamp() and "bounded" reads use
+with_max_staleness(`max_staleness`), so any replica close enough can
+serve them. Stale reads can't share a transaction with writes, so they
+run as single-statement read-only transactions of their own after the
+transaction's writes commit; `separate_reads` does the same for strong
+reads. Separated reads are timed as "<op>@<mode>" phases, e.g.
+"read@follower". Bounded reads only serve single-range lookups, so they
+need an index led by user_id (setup_database.py --schema covering);
+load_test.py refuses to run them against a table without one.
+
+A bigscan streams a large range of rows instead of fetching a page (see
+scans.py): `scan_by` user (`scan_keys` user_ids), time (rows newer than
+`scan_window`) or table, read through a named server-side cursor,
+keyset pages or one buffered fetchall (`scan_method`), `itersize` rows
+at a time.
+
+Custom workloads can be loaded from a JSON file with the same keys.
+"""
+import bisect
+import json
+import os
+import random
+import re
+import time
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from prepared import StatementCache
+from scans import SCAN_BY, SCAN_METHODS, scan_params, scan_sql, stream_scan
+
+STATEMENTS = {
+    'insert': """
+        INSERT INTO transactions (user_id, amount, description)
+        VALUES (%s, %s, %s);
+    """,
+    'read': """
+        SELECT id, user_id, amount, created_at
+        FROM transactions
+        WHERE user_id = %s
+        ORDER BY created_at DESC
+        LIMIT 5;
+    """,
+    'update': """
+        UPDATE transactions
+        SET amount = %s
+        WHERE user_id = %s
+        ORDER BY created_at DESC
+        LIMIT 1;
+    """,
+    'scan': """
+        SELECT id, user_id, amount, created_at
+        FROM transactions
+        WHERE user_id >= %s AND user_id < %s
+        LIMIT %s;
+    """,
+}
+
+DEFAULTS = {
+    'keys': 100,
+    'distribution': 'uniform',
+    'theta': 0.99,          # zipfian / latest skew
+    'hot_fraction': 0.2,    # hotspot: share of keys that are hot...
+    'hot_ops': 0.8,         # ...and share of operations that hit them
+    'ops_per_txn': 1,
+    'scan_keys': 10,        # scan: max user_ids covered
+    'scan_limit': 100,      # scan: max rows returned
+    'batch_size': 1,        # insert: rows per INSERT statement
+    'batch_statements': 1,  # insert: INSERT statements per operation
+    'read_consistency': 'strong',  # reads: strong, follower or bounded
+    'max_staleness': '10s',        # bounded: with_max_staleness() interval
+    'separate_reads': False,       # strong reads in their own transactions
+    'scan_by': 'user',      # bigscan: user (scan_keys wide), time or table
+    'scan_window': '1h',    # bigscan by time: rows newer than this
+    'scan_method': 'cursor',  # bigscan: cursor, keyset or fetchall
+    'itersize': 2000,       # bigscan: rows per cursor fetch or keyset page
+}
+
+READ_MODES = ('strong', 'follower', 'bounded')
+READ_OPS = ('read', 'scan')  # Operations read_consistency applies to
+_STALENESS = re.compile(r"^\d+(?:\.\d+)?(?:ms|s|m|h)$")
+
+WORKLOADS = {
+    # The original load_test.py transaction: insert a row, read the user's latest 5
+    'default': {'sequence': ['insert', 'read'], 'distribution': 'sequential', 'keys': 100},
+    'ycsb-a': {'mix': {'read': 0.5, 'update': 0.5}, 'distribution': 'zipfian'},
+    'ycsb-b': {'mix': {'read': 0.95, 'update': 0.05}, 'distribution': 'zipfian'},
+    'ycsb-c': {'mix': {'read': 1.0}, 'distribution': 'zipfian'},
+    'ycsb-d': {'mix': {'read': 0.95, 'insert': 0.05}, 'distribution': 'latest'},
+    'ycsb-e': {'mix': {'scan': 0.95, 'insert': 0.05}, 'distribution': 'zipfian'},
+    'ycsb-f': {'mix': {'read': 0.5, 'rmw': 0.5}, 'distribution': 'zipfian'},
+    'write-only': {'mix': {'insert': 1.0}, 'distribution': 'uniform'},
+    'hotspot': {'mix': {'read': 0.5, 'update': 0.5}, 'distribution': 'hotspot'},
+    # Large streaming reads (analytics or export jobs next to the OLTP traffic)
+    'bigscan-user': {'sequence': ['bigscan'], 'distribution': 'uniform', 'keys': 1000,
+                     'scan_by': 'user', 'scan_keys': 100},
+    'bigscan-time': {'sequence': ['bigscan'], 'scan_by': 'time', 'scan_window': '1h'},
+    'bigscan-table': {'sequence': ['bigscan'], 'scan_by': 'table'},
+    # A multi-statement order-entry transaction in the spirit of TPC-C new-order
+    'tpcc-lite': {
+        'sequence': ['read', 'insert', 'insert', 'insert', 'update'],
+        'distribution': 'uniform',
+        'keys': 1000,
+    },
+}
+
+
+def load_workload(name_or_path: str, **overrides) -> dict:
+    """
+    Resolve a workload by name or JSON file path and apply overrides.
+
+    Overrides that are None are ignored, so argparse defaults pass straight
+    through. Raises ValueError for unknown names or malformed specs.
+    """
+    if name_or_path in WORKLOADS:
+        spec = dict(WORKLOADS[name_or_path])
+        spec['name'] = name_or_path
+    elif os.path.exists(name_or_path):
+        with open(name_or_path) as f:
+            spec = json.load(f)
+        spec.setdefault('name', os.path.splitext(os.path.basename(name_or_path))[0])
+    else:
+        raise ValueError(f"Unknown workload '{name_or_path}' "
+                         f"(choose from {', '.join(WORKLOADS)} or give a JSON file)")
+
+    spec.update({k: v for k, v in overrides.items() if v is not None})
+    validate(spec)
+    return spec
+
+
+def validate(spec: dict):
+    ops = list(spec.get('sequence', [])) + list(spec.get('mix', {}))
+    if not ops or ('sequence' in spec) == ('mix' in spec):
+        raise ValueError("A workload needs exactly one of 'sequence' or 'mix'")
+    unknown = set(ops) - set(OPERATIONS)
+    if unknown:
+        raise ValueError(f"Unknown operations: {', '.join(sorted(unknown))}")
+    distribution = spec.get('distribution', DEFAULTS['distribution'])
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution '{distribution}'")
+    if not 0 < spec.get('theta', DEFAULTS['theta']) < 1:
+        raise ValueError("theta must be between 0 and 1 (exclusive)")
+    if spec.get('keys', DEFAULTS['keys']) < 1:
+        raise ValueError("keys must be at least 1")
+    if (spec.get('batch_size', DEFAULTS['batch_size']) < 1
+            or spec.get('batch_statements', DEFAULTS['batch_statements']) < 1):
+        raise ValueError("batch_size and batch_statements must be at least 1")
+    if spec.get('read_consistency', DEFAULTS['read_consistency']) not in READ_MODES:
+        raise ValueError(f"read_consistency must be one of {', '.join(READ_MODES)}")
+    if not _STALENESS.match(str(spec.get('max_staleness', DEFAULTS['max_staleness']))):
+        raise ValueError("max_staleness must be an interval such as 10s or 500ms")
+    if spec.get('scan_by', DEFAULTS['scan_by']) not in SCAN_BY:
+        raise ValueError(f"scan_by must be one of {', '.join(SCAN_BY)}")
+    if spec.get('scan_method', DEFAULTS['scan_method']) not in SCAN_METHODS:
+        raise ValueError(f"scan_method must be one of {', '.join(SCAN_METHODS)}")
+    if not _STALENESS.match(str(spec.get('scan_window', DEFAULTS['scan_window']))):
+        raise ValueError("scan_window must be an interval such as 1h or 30m")
+    if spec.get('itersize', DEFAULTS['itersize']) < 1:
+        raise ValueError("itersize must be at least 1")
+
+
+def describe(spec: dict) -> str:
+    if 'sequence' in spec:
+        shape = " + ".join(spec['sequence'])
+    else:
+        shape = ", ".join(f"{op} {weight:.0%}" for op, weight in spec['mix'].items())
+    distribution = spec.get('distribution', DEFAULTS['distribution'])
+    if distribution in ('zipfian', 'latest'):
+        distribution += f" θ={spec.get('theta', DEFAULTS['theta'])}"
+    text = (f"{spec.get('name', 'custom')}: {shape} | {distribution} over "
+            f"{spec.get('keys', DEFAULTS['keys']):,} keys")
+    batch = spec.get('batch_size', DEFAULTS['batch_size'])
+    statements = spec.get('batch_statements', DEFAULTS['batch_statements'])
+    if batch > 1 or statements > 1:
+        text += f" | inserts of {batch} row(s) x {statements} statement(s)"
+    mode = spec.get('read_consistency', DEFAULTS['read_consistency'])
+    if mode == 'bounded':
+        text += f" | bounded-staleness reads ({spec.get('max_staleness', DEFAULTS['max_staleness'])})"
+    elif mode == 'follower':
+        text += " | follower reads"
+    elif spec.get('separate_reads', DEFAULTS['separate_reads']):
+        text += " | strong reads in separate transactions"
+    if 'bigscan' in spec.get('sequence', []) or 'bigscan' in spec.get('mix', {}):
+        scan_by = spec.get('scan_by', DEFAULTS['scan_by'])
+        if scan_by == 'user':
+            scope = f"{spec.get('scan_keys', DEFAULTS['scan_keys'])} users"
+        elif scan_by == 'time':
+            scope = f"last {spec.get('scan_window', DEFAULTS['scan_window'])}"
+        else:
+            scope = "whole table"
+        method = spec.get('scan_method', DEFAULTS['scan_method'])
+        text += f" | bigscan of {scope} via {method}"
+        if method != 'fetchall':
+            text += f" ({spec.get('itersize', DEFAULTS['itersize'])} rows at a time)"
+    return text
+
+
+def insert_sql(rows: int) -> str:
+    """STATEMENTS['insert'] as a multi-row INSERT of `rows` rows."""
+    if rows == 1:
+        return STATEMENTS['insert']
+    values = ", ".join(["(%s, %s, %s)"] * rows)
+    return f"INSERT INTO transactions (user_id, amount, description) VALUES {values};"
+
+
+def read_sql(statement: str, mode: str, max_staleness: str = DEFAULTS['max_staleness']) -> str:
+    """A read statement with the AS OF SYSTEM TIME clause of the read mode."""
+    if mode == 'follower':
+        clause = "follower_read_timestamp()"
+    elif mode == 'bounded':
+        clause = f"with_max_staleness('{max_staleness}')"
+    else:
+        return statement
+    return statement.replace("FROM transactions", f"FROM transactions AS OF SYSTEM TIME {clause}")
+
+
+# --- Key distributions -------------------------------------------------------
+
+@lru_cache(maxsize=8)
+def _zeta(n: int, theta: float) -> float:
+    return sum(1.0 / i ** theta for i in range(1, n + 1))
+
+
+class ZipfianGenerator:
+    """YCSB's zipfian generator (Gray et al., "Quickly generating billion-record...")."""
+
+    def __init__(self, n: int, theta: float, rng: random.Random):
+        self.n = n
+        self.theta = theta
+        self.rng = rng
+        self.zetan = _zeta(n, theta)
+        self.alpha = 1.0 / (1.0 - theta)
+        zeta2 = 1.0 + 0.5 ** theta
+        self.half_pow_theta = 0.5 ** theta
+        self.eta = (1 - (2.0 / n) ** (1 - theta)) / (1 - zeta2 / self.zetan) if n > 2 else 1.0
+
+    def next(self) -> int:
+        """Rank in [0, n): 0 is the most popular."""
+        u = self.rng.random()
+        uz = u * self.zetan
+        if uz < 1.0:
+            return 0
+        if uz < 1.0 + self.half_pow_theta:
+            return min(1, self.n - 1)
+        return min(int(self.n * (self.eta * u - self.eta + 1) ** self.alpha), self.n - 1)
+
+
+class KeyChooser:
+    def __init__(self, spec: dict, worker_id: int, rng: random.Random):
+        self.keys = spec.get('keys', DEFAULTS['keys'])
+        self.distribution = spec.get('distribution', DEFAULTS['distribution'])
+        self.worker_id = worker_id
+        self.rng = rng
+        self.latest = worker_id % self.keys  # Most recently inserted key (latest)
+
+        if self.distribution in ('zipfian', 'latest'):
+            self.zipf = ZipfianGenerator(self.keys, spec.get('theta', DEFAULTS['theta']), rng)
+        self.hot_keys = max(1, int(self.keys * spec.get('hot_fraction', DEFAULTS['hot_fraction'])))
+        self.hot_ops = spec.get('hot_ops', DEFAULTS['hot_ops'])
+
+    def next(self, n: int) -> int:
+        """Key for an operation of transaction number n."""
+        d = self.distribution
+        if d == 'sequential':
+            return (n + self.worker_id) % self.keys
+        if d == 'uniform':
+            return self.rng.randrange(self.keys)
+        if d == 'zipfian':
+            return self.zipf.next()
+        if d == 'latest':
+            return (self.latest - self.zipf.next()) % self.keys
+        # hotspot
+        if self.hot_keys >= self.keys or self.rng.random() < self.hot_ops:
+            return self.rng.randrange(self.hot_keys)
+        return self.rng.randrange(self.hot_keys, self.keys)
+
+    def next_insert(self, n: int) -> int:
+        """Key for an insert: 'latest' appends new keys, others reuse next()."""
+        if self.distribution == 'latest':
+            self.latest = (self.latest + 1) % self.keys
+            return self.latest
+        return self.next(n)
+
+
+DISTRIBUTIONS = ('sequential', 'uniform', 'zipfian', 'latest', 'hotspot')
+
+
+# --- Operations --------------------------------------------------------------
+#
+# Operations call run(statement_name, params), which executes the statement
+# either as plain SQL or through a prepared-statement cache and returns the
+# cursor. run(statement_name, params, itersize) instead opens a named
+# server-side cursor over the plain SQL (a prepared statement can't be
+# declared as a cursor); the caller closes it.
+
+def _insert(run, key: int, n: int, spec: dict):
+    amount = round((n % 1000) * 0.99, 2)
+    batch = spec.get('batch_size', DEFAULTS['batch_size'])
+    for s in range(spec.get('batch_statements', DEFAULTS['batch_statements'])):
+        params = []
+        for i in range(batch):
+            suffix = f".{s}.{i}" if batch > 1 else ""
+            params += (key, amount, f"Load test transaction {n}{suffix}")
+        run('insert', params)
+
+
+def _read(run, key: int, n: int, spec: dict):
+    return run('read', (key,)).fetchall()
+
+
+def _update(run, key: int, n: int, spec: dict):
+    run('update', (round((n % 1000) * 1.01, 2), key))
+
+
+def _scan(run, key: int, n: int, spec: dict):
+    width = spec.get('scan_keys', DEFAULTS['scan_keys'])
+    return run('scan', (key, key + width, spec.get('scan_limit', DEFAULTS['scan_limit']))).fetchall()
+
+
+def _read_modify_write(run, key: int, n: int, spec: dict):
+    rows = _read(run, key, n, spec)
+    _update(run, key, n, spec)
+    return rows
+
+
+def _bigscan(run, key: int, n: int, spec: dict):
+    scan_by = spec.get('scan_by', DEFAULTS['scan_by'])
+    params = scan_params(scan_by, key, spec.get('scan_keys', DEFAULTS['scan_keys']),
+                         spec.get('scan_window', DEFAULTS['scan_window']))
+    return stream_scan(run, spec.get('scan_method', DEFAULTS['scan_method']), params,
+                       spec.get('itersize', DEFAULTS['itersize']))
+
+
+OPERATIONS = {
+    'insert': _insert,
+    'read': _read,
+    'update': _update,
+    'scan': _scan,
+    'rmw': _read_modify_write,
+    'bigscan': _bigscan,  # Returns (rows, first row ns, scan ns)
+}
+
+
+class Workload:
+    """One worker's instance of a workload spec (owns its RNG and key state)."""
+
+    def __init__(self, spec: dict, worker_id: int = 0):
+        self.spec = spec
+        self.name = spec.get('name', 'custom')
+        self.rng = random.Random(worker_id)
+        self.chooser = KeyChooser(spec, worker_id, self.rng)
+        self.sequence = spec.get('sequence')
+        self.ops_per_txn = spec.get('ops_per_txn', DEFAULTS['ops_per_txn'])
+        batch = spec.get('batch_size', DEFAULTS['batch_size'])
+        self.rows_per_insert = batch * spec.get('batch_statements', DEFAULTS['batch_statements'])
+        self.statements = dict(STATEMENTS, insert=insert_sql(batch))  # SQL by statement name
+
+        self.read_mode = spec.get('read_consistency', DEFAULTS['read_consistency'])
+        self.separate_reads = (self.read_mode != 'strong'
+                               or spec.get('separate_reads', DEFAULTS['separate_reads']))
+        self.phase_names: Dict[str, str] = {}  # Statement name -> timer label
+        ops = list(self.sequence or spec['mix'])
+        if 'bigscan' in ops:
+            self.statements.update(scan_sql(spec.get('scan_by', DEFAULTS['scan_by']),
+                                            spec.get('scan_method', DEFAULTS['scan_method'])))
+        self.last_scans: List[Tuple[int, int, int]] = []  # bigscan results of the last execute
+        self._cursors = 0  # Named cursors opened, for unique names
+        if self.separate_reads:
+            staleness = spec.get('max_staleness', DEFAULTS['max_staleness'])
+            for op in READ_OPS:
+                self.statements[op] = read_sql(self.statements[op], self.read_mode, staleness)
+                self.phase_names[op] = f"{op}@{self.read_mode}"
+        if not self.sequence:
+            mix = spec['mix']
+            self._ops = list(mix)
+            total = float(sum(mix.values()))
+            self._cumulative = []
+            running = 0.0
+            for op in self._ops:
+                running += mix[op] / total
+                self._cumulative.append(running)
+
+    def _pick(self) -> str:
+        return self._ops[min(bisect.bisect_left(self._cumulative, self.rng.random()),
+                             len(self._ops) - 1)]
+
+    def next_transaction(self, n: int) -> List[Tuple[str, int]]:
+        """
+        Operations and keys for transaction number n.
+
+        Chosen up front so a retried transaction replays the same work.
+        """
+        ops = self.sequence or [self._pick() for _ in range(self.ops_per_txn)]
+        if self.chooser.distribution == 'sequential':
+            # The same key for every statement, as in the original transaction
+            key = self.chooser.next(n)
+            return [(op, key) for op in ops]
+        return [(op, self.chooser.next_insert(n) if op == 'insert' else self.chooser.next(n))
+                for op in ops]
+
+    def split_reads(self, ops: List[Tuple[str, int]]) -> Tuple[List[Tuple[str, int]],
+                                                                List[Tuple[str, int]]]:
+        """(ops for the read-write transaction, reads to run on their own)."""
+        if not self.separate_reads:
+            return ops, []
+        return ([(op, key) for op, key in ops if op not in READ_OPS],
+                [(op, key) for op, key in ops if op in READ_OPS])
+
+    def rows_written(self, ops: List[Tuple[str, int]]) -> int:
+        """Rows a transaction made of `ops` inserts."""
+        return self.rows_per_insert * sum(1 for op, _ in ops if op == 'insert')
+
+    def execute(self, conn, ops: List[Tuple[str, int]], n: int,
+                statements: Optional[StatementCache] = None,
+                timer: Optional[Callable[[str, int], None]] = None):
+        """
+        Run the statements of one transaction (body for run_in_transaction).
+
+        With a StatementCache the statements run by prepared handle,
+        otherwise as plain SQL text. With a timer, timer(statement, ns) is
+        called after every statement with its perf_counter_ns duration
+        (for a named cursor: declaring it, not fetching from it).
+        The results of bigscan operations are left in last_scans.
+        """
+        result = None
+        scans = []
+        with conn.cursor() as cur:
+            if statements is not None:
+                def execute(name, params):
+                    return statements.execute(cur, self.statements[name], params)
+            else:
+                def execute(name, params):
+                    cur.execute(self.statements[name], params)
+                    return cur
+
+            def run(name, params, itersize=None):
+                if itersize is None:
+                    return execute(name, params)
+                self._cursors += 1
+                named = conn.cursor(name=f"{name}_{self._cursors}")
+                named.itersize = itersize
+                named.execute(self.statements[name], params)
+                return named
+
+            if timer is not None:
+                untimed = run
+
+                def run(name, params, itersize=None):
+                    start = time.perf_counter_ns()
+                    try:
+                        return untimed(name, params, itersize)
+                    finally:
+                        timer(self.phase_names.get(name, name), time.perf_counter_ns() - start)
+
+            for op, key in ops:
+                result = OPERATIONS[op](run, key, n, self.spec)
+                if op == 'bigscan':
+                    scans.append(result)
+        self.last_scans = scans
+        return result
+
+    def execute_reads(self, conn, ops: List[Tuple[str, int]], n: int,
+                      statements: Optional[StatementCache] = None,
+                      timer: Optional[Callable[[str, int], None]] = None):
+        """
+        Run reads split off by split_reads, each as its own implicit
+        (single-statement, read-only) transaction. Bounded-staleness reads
+        are only allowed there, and follower reads need a read-only
+        transaction.
+        """
+        autocommit = conn.autocommit
+        conn.autocommit = True
+        try:
+            return self.execute(conn, ops, n, statements, timer)
+        finally:
+            conn.autocommit = autocommit
+
+
+def list_workloads() -> Dict[str, str]:
+    return {name: describe(load_workload(name)) for name in WORKLOADS}